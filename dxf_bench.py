@@ -0,0 +1,359 @@
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from pydraw import batch, dxf, entity, reader
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def temp_path(name):
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def report(name, elapsed, peak=None):
+    if peak is None:
+        print(f'{name:<40}{elapsed:>10.3f} s')
+    else:
+        print(f'{name:<40}{elapsed:>10.3f} s{peak / 2**20:>10.1f} MiB')
+
+
+# GroupCode
+# -------------------------------------------------
+
+
+class ListGroupCode:
+    """The former list-of-str GroupCode, kept for comparison."""
+    def __init__(self):
+        self.data = list()
+
+    def append(self, code, value):
+        if isinstance(code, list):
+            for c, v in zip(code, value):
+                self.data.append(f'{c}')
+                self.data.append(f'{v}')
+        else:
+            self.data.append(f'{code}')
+            self.data.append(f'{value}')
+
+    def extend(self, group_code):
+        self.data.extend(group_code.data)
+
+    def to_string(self):
+        return '\n'.join(self.data)
+
+
+def fill_lines(code_class, count):
+    total = code_class()
+    for i in range(count):
+        code = code_class()
+        code.append(0, 'LINE')
+        code.append(5, f'{i + 100:X}')
+        code.append(8, '0')
+        code.append(48, 1)
+        code.append(330, '1F')
+        code.append(100, 'AcDbEntity')
+        code.append(100, 'AcDbLine')
+        code.append(67, 0)
+        code.append([10, 20, 30], [i * 0.5, 0.25, 0])
+        code.append([11, 21, 31], [i * 0.5, 10.75, 0])
+        total.extend(code)
+    return total
+
+
+def bench_group_code(count=100000):
+    for code_class in (ListGroupCode, dxf.GroupCode):
+        code, elapsed, peak = measure(fill_lines, code_class, count)
+        report(f'{code_class.__name__} fill {count}', elapsed, peak)
+        _, elapsed, _ = measure(code.to_string)
+        report(f'{code_class.__name__} to_string', elapsed)
+
+
+# Document
+# -------------------------------------------------
+
+
+def make_lines(count):
+    d = dxf.DXF()
+    layer = d.layer['0']
+    for i in range(count):
+        line = dxf.Line([i * 0.37, 1.25], [i * 0.37, 10.5 + i * 0.01])
+        line.set_layer(layer)
+        d.model_space.append(line)
+    return d
+
+
+def to_code_all(d):
+    for entity in d.model_space.entity_list:
+        entity.to_code()
+
+
+def bench_to_code(count=100000):
+    d = make_lines(count)
+    _, elapsed, _ = measure(to_code_all, d)
+    report(f'Line.to_code {count}', elapsed)
+    _, elapsed, _ = measure(d.save, temp_path('bench.dxf'))
+    report(f'DXF.save {count} lines', elapsed)
+
+
+def make_survey_lines(count):
+    """Lines with full precision survey coordinates."""
+    rand = random.Random(1)
+    d = dxf.DXF()
+    layer = d.layer['0']
+    for i in range(count):
+        line = dxf.Line([512000 + 1000 * rand.random(), 3400000 + 1000 * rand.random()],
+                        [512000 + 1000 * rand.random(), 3400000 + 1000 * rand.random()])
+        line.set_layer(layer)
+        d.model_space.append(line)
+    return d
+
+
+def make_demo_mix(count):
+    """The entities of dxf_demo.py, repeated at random offsets."""
+    rand = random.Random(1)
+    d = dxf.DXF()
+    layer = d.layer['0']
+    style = d.style['STANDARD']
+    dimstyle = d.dimstyle['STANDARD']
+    pattern = d.pattern_resource.get_data('ANSI31')
+    m = d.model_space
+    for i in range(count // 10):
+        x, y = 1000 * rand.random(), 1000 * rand.random()
+        entities = [
+            dxf.Arc([x + 50, y + 50], 25.3, 0, 180),
+            dxf.Circle([x + 25, y + 25], 10.7),
+            dxf.Ellipse([x + 75, y + 75], [25, 0], 0.5),
+            dxf.Line([x, y], [x + 100.1, y + 100.2]),
+            dxf.LWPolyline([[x, y], [x + 50, y], [x + 50, y + 50], [x, y + 50], [x, y]],
+                           [0.5, 0.5, 0.5, 0.5, 0]),
+            dxf.Text('hello world', [x + 100, y + 100], 10),
+            dxf.MText('hello world', [x + 50, y + 50], 5, 100),
+            dxf.RotatedDimension([x, y], [x + 150, y], [x + 75, y + 50], 0),
+            dxf.RadialDimension([x, y], [x + 50, y + 20], 0),
+            dxf.Hatch(pattern, [[x, y], [x + 20, y], [x + 20, y + 20], [x, y + 20], [x, y]]),
+        ]
+        for entity in entities:
+            entity.set_layer(layer)
+            if isinstance(entity, dxf._TextBase):
+                entity.set_style(style)
+            if isinstance(entity, dxf._DimBase):
+                entity.set_dimstyle(dimstyle)
+            m.append(entity)
+    return d
+
+
+def bench_precision(count=100000):
+    path = temp_path('bench.dxf')
+    for precision in (None, 6, 3):
+        d = make_demo_mix(count)
+        d.precision = precision
+        _, elapsed, _ = measure(d.save, path)
+        size = os.path.getsize(path)
+        report(f'DXF.save precision={precision} {size / 2**20:.1f} MiB', elapsed)
+
+
+def bench_binary(count=100000):
+    d = make_survey_lines(count)
+    path = temp_path('bench.dxf')
+    for binary in (False, True):
+        _, elapsed, _ = measure(d.save, path, binary)
+        size = os.path.getsize(path)
+        report(f'DXF.save binary={binary} {size / 2**20:.1f} MiB', elapsed)
+
+
+def bench_workers(count=200000):
+    path = temp_path('bench.dxf')
+    for workers in (1, 2, 4, 8):
+        d = make_survey_lines(count)
+        start = time.perf_counter()
+        d.save(path, workers=workers)
+        report(f'DXF.save workers={workers} {count}', time.perf_counter() - start)
+
+
+def bench_resave(count=100000):
+    d = make_survey_lines(count)
+    d.cache_codes = True
+    path = temp_path('bench.dxf')
+    for name in ('first save', 'save after one edit'):
+        start = time.perf_counter()
+        d.save(path)
+        report(f'DXF.save cache_codes {name}', time.perf_counter() - start)
+        d.model_space.entity_list[count // 2].end = [0.0, 0.0]
+
+
+def make_line_objects(starts, ends):
+    d = dxf.DXF()
+    layer = d.layer['0']
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        line = dxf.Line(start, end)
+        line.set_layer(layer)
+        d.model_space.append(line)
+    return d
+
+
+def make_line_batch(starts, ends):
+    d = dxf.DXF()
+    d.model_space.append(batch.LineBatch(starts, ends, layer=d.layer['0']))
+    return d
+
+
+def bench_batch(counts=(10**4, 10**5, 10**6)):
+    import numpy as np
+    rand = np.random.default_rng(1)
+    path = temp_path('bench.dxf')
+    for count in counts:
+        starts = 512000 + 1000 * rand.random((count, 2))
+        ends = starts + rand.random((count, 2))
+        for make in (make_line_objects, make_line_batch):
+            d, elapsed, peak = measure(make, starts, ends)
+            report(f'{make.__name__} {count}', elapsed, peak)
+            start = time.perf_counter()
+            d.save(path)
+            report(f'DXF.save {count}', time.perf_counter() - start)
+
+
+def bench_point_array(count=10000, repeat=100):
+    vectors = [entity.Vector(i * 0.5, i * 0.25) for i in range(count)]
+    points = entity.PointArray(vectors)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for vector in vectors:
+            vector.scale(0, 0, 1.001)
+    report(f'Vector.scale {count} x {repeat}', time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        points.scale(0, 0, 1.001)
+    report(f'PointArray.scale {count} x {repeat}', time.perf_counter() - start)
+
+
+def count_pairs(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in reader.iter_pairs(f))
+
+
+def bench_read(count=100000):
+    d = make_demo_mix(count)
+    path = temp_path('bench.dxf')
+    for binary in (False, True):
+        d.save(path, binary)
+        pairs, elapsed, _ = measure(count_pairs, path)
+        report(f'iter_pairs binary={binary} {pairs / elapsed / 1e6:.2f} M pairs/s', elapsed)
+        doc, elapsed, peak = measure(reader.read, path)
+        report(f'read binary={binary} {len(doc.entities)} entities', elapsed, peak)
+
+
+def bench_index(count=100000):
+    d = make_demo_mix(count)
+    path = temp_path('bench.dxf')
+    d.save(path)
+    if os.path.exists(path + '.idx'):
+        os.remove(path + '.idx')
+    start = time.perf_counter()
+    index = reader.Index(path)
+    report(f'Index scan {len(index)} records', time.perf_counter() - start)
+    index.save()
+    index.close()
+    start = time.perf_counter()
+    with reader.Index(path) as index:
+        report('Index reopen', time.perf_counter() - start)
+        start = time.perf_counter()
+        index.find(index.handles[len(index) // 2])
+        report('Index.find', time.perf_counter() - start)
+        start = time.perf_counter()
+        circles = list(index.select('CIRCLE'))
+        report(f'Index.select {len(circles)} circles', time.perf_counter() - start)
+
+
+def scan_bbox(entity_list, xmin, ymin, xmax, ymax):
+    found = list()
+    for entity in entity_list:
+        box = entity.bbox()
+        if box[0] <= xmax and box[2] >= xmin and box[1] <= ymax and box[3] >= ymin:
+            found.append(entity)
+    return found
+
+
+def bench_spatial(count=10**6, repeat=100):
+    m = make_demo_mix(count).model_space
+    window = 400, 400, 450, 450
+    start = time.perf_counter()
+    found = scan_bbox(m.entity_list, *window)
+    report(f'scan {count} for {len(found)} entities', time.perf_counter() - start)
+    start = time.perf_counter()
+    m.get_grid()
+    report(f'GridIndex {count}', time.perf_counter() - start)
+    rand = random.Random(2)
+    points = [(1000 * rand.random(), 1000 * rand.random()) for _ in range(repeat)]
+    start = time.perf_counter()
+    for x, y in points:
+        m.query_bbox(x, y, x + 50, y + 50)
+    report(f'query_bbox 50 x 50 x {repeat}', time.perf_counter() - start)
+    start = time.perf_counter()
+    for x, y in points:
+        m.query_point(x, y)
+    report(f'query_point x {repeat}', time.perf_counter() - start)
+    start = time.perf_counter()
+    for x, y in points:
+        m.nearest(x, y, 10)
+    report(f'nearest 10 x {repeat}', time.perf_counter() - start)
+
+
+def make_bolts(count):
+    """count bolt symbols of twelve primitives each, on a grid."""
+    d = dxf.DXF()
+    layer = d.layer['0']
+    for i in range(count):
+        x, y = i % 100 * 30.1, i // 100 * 30.7
+        entities = [dxf.Circle([x, y], 5), dxf.Circle([x, y], 3),
+                    dxf.LWPolyline([[x - 6, y - 6], [x + 6, y - 6], [x + 6, y + 6],
+                                    [x - 6, y + 6], [x - 6, y - 6]]),
+                    dxf.Line([x - 7, y], [x + 7, y]), dxf.Line([x, y - 7], [x, y + 7])]
+        entities += [dxf.Arc([x, y], 4, angle, angle + 45) for angle in range(0, 360, 90)]
+        entities += [dxf.Line([x + 6, y + dy], [x + 8, y + dy]) for dy in (-3, 0, 3)]
+        for entity in entities:
+            entity.set_layer(layer)
+            d.model_space.append(entity)
+    return d
+
+
+def bench_dedupe(count=10000):
+    d = make_bolts(count)
+    path = temp_path('bench.dxf')
+    for deduped in (False, True):
+        if deduped:
+            start = time.perf_counter()
+            d.dedupe()
+            report(f'dedupe {count} symbols', time.perf_counter() - start)
+        d.save(path)
+        size = os.path.getsize(path) / 2**20
+        start = time.perf_counter()
+        reader.read(path)
+        report(f'read deduped={deduped} {size:.1f} MiB', time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    bench_group_code()
+    bench_to_code()
+    bench_binary()
+    bench_workers()
+    bench_resave()
+    bench_precision()
+    bench_read()
+    bench_index()
+    bench_batch()
+    bench_point_array()
+    bench_spatial()
+    bench_dedupe()
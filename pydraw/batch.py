@@ -0,0 +1,140 @@
+from array import array
+
+import numpy as np
+
+from .dxf import Arc, Batch, Circle, Line
+
+
+def _floats(values, count):
+    """A float column as array('d'), a scalar broadcast to count values."""
+    values = np.ascontiguousarray(np.broadcast_to(np.asarray(values, dtype=float), (count,)))
+    return array('d', values.tobytes())
+
+
+def _points(points):
+    points = np.asarray(points, dtype=float)
+    assert points.ndim == 2 and points.shape[1] >= 2
+    return points
+
+
+def _circles_bbox(centers, radii):
+    radii = np.broadcast_to(np.asarray(radii, dtype=float), (len(centers),))
+    low = (centers[:, :2] - radii[:, None]).min(axis=0)
+    high = (centers[:, :2] + radii[:, None]).max(axis=0)
+    return float(low[0]), float(low[1]), float(high[0]), float(high[1])
+
+
+def _arcs_bbox(centers, radii, start_angles, end_angles):
+    """The quadrant logic of geometry.arc_bbox over whole columns."""
+    count = len(centers)
+    x, y = centers[:, 0], centers[:, 1]
+    radii = np.broadcast_to(np.asarray(radii, dtype=float), (count,))
+    start = np.radians(np.broadcast_to(np.asarray(start_angles, dtype=float), (count,)))
+    end = np.radians(np.broadcast_to(np.asarray(end_angles, dtype=float), (count,)))
+    span = (end - start) % (2 * np.pi)
+    span[span == 0] = 2 * np.pi
+    stop = start + span
+
+    def passes(angle):
+        return (angle - start) % (2 * np.pi) <= span
+
+    xs = np.stack((np.cos(start), np.cos(stop)))
+    ys = np.stack((np.sin(start), np.sin(stop)))
+    xmin = np.where(passes(np.pi), -1, xs.min(axis=0))
+    xmax = np.where(passes(0), 1, xs.max(axis=0))
+    ymin = np.where(passes(1.5 * np.pi), -1, ys.min(axis=0))
+    ymax = np.where(passes(0.5 * np.pi), 1, ys.max(axis=0))
+    return (float((x + radii * xmin).min()), float((y + radii * ymin).min()),
+            float((x + radii * xmax).max()), float((y + radii * ymax).max()))
+
+
+class LineBatch(Batch):
+    """N lines from (N, 2) arrays of start and end points."""
+    __slots__ = ('starts', 'ends', 'line_scale')
+    template = Line.template
+
+    def __init__(self, starts, ends, line_scale=1, layer=None):
+        super().__init__()
+        self.starts = _points(starts)
+        self.ends = _points(ends)
+        assert len(self.starts) == len(self.ends)
+        self.line_scale = line_scale
+        if layer is not None:
+            self.set_layer(layer)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def bbox(self):
+        if not len(self):
+            return None
+        points = np.concatenate((self.starts[:, :2], self.ends[:, :2]))
+        (xmin, ymin), (xmax, ymax) = points.min(axis=0).tolist(), points.max(axis=0).tolist()
+        return xmin, ymin, xmax, ymax
+
+    def columns(self):
+        count = len(self)
+        return (self.layer.name, _floats(self.line_scale, count), self.owner_handle,
+                self.space_status,
+                _floats(self.starts[:, 0], count), _floats(self.starts[:, 1], count),
+                _floats(self.ends[:, 0], count), _floats(self.ends[:, 1], count))
+
+
+class CircleBatch(Batch):
+    """N circles from an (N, 2) array of centers and N radii, or one radius."""
+    __slots__ = ('centers', 'radii')
+    template = Circle.template
+
+    def __init__(self, centers, radii, layer=None):
+        super().__init__()
+        self.centers = _points(centers)
+        self.radii = radii
+        if layer is not None:
+            self.set_layer(layer)
+
+    def __len__(self):
+        return len(self.centers)
+
+    def bbox(self):
+        if not len(self):
+            return None
+        return _circles_bbox(self.centers, self.radii)
+
+    def columns(self):
+        count = len(self)
+        return (self.layer.name, self.owner_handle, self.space_status,
+                _floats(self.centers[:, 0], count), _floats(self.centers[:, 1], count),
+                _floats(self.radii, count))
+
+
+class ArcBatch(Batch):
+    """N arcs from an (N, 2) array of centers, radii and angles in degrees.
+
+    Radii and angles are arrays of N values or single values.
+    """
+    __slots__ = ('centers', 'radii', 'start_angles', 'end_angles')
+    template = Arc.template
+
+    def __init__(self, centers, radii, start_angles, end_angles, layer=None):
+        super().__init__()
+        self.centers = _points(centers)
+        self.radii = radii
+        self.start_angles = start_angles
+        self.end_angles = end_angles
+        if layer is not None:
+            self.set_layer(layer)
+
+    def __len__(self):
+        return len(self.centers)
+
+    def bbox(self):
+        if not len(self):
+            return None
+        return _arcs_bbox(self.centers, self.radii, self.start_angles, self.end_angles)
+
+    def columns(self):
+        count = len(self)
+        return (self.layer.name, self.owner_handle, self.space_status,
+                _floats(self.centers[:, 0], count), _floats(self.centers[:, 1], count),
+                _floats(self.radii, count),
+                _floats(self.start_angles, count), _floats(self.end_angles, count))
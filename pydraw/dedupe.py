@@ -0,0 +1,121 @@
+import copy
+
+from .dxf import Batch, GroupCode, Insert, Viewport
+from .geometry import union_bbox
+from .spatial import GridIndex
+
+
+def dedupe(document, min_count=2, min_size=2, precision=6, auto=True):
+    """Hoist groups of entities that repeat into blocks and insert those.
+
+    The groups are the ones marked with Space.group and, with auto, the
+    clusters of other entities whose bounding boxes touch.  A group is
+    moved so its lower left corner is at the origin and recorded without
+    handles, floats rounded to precision; min_count groups or more that
+    record the same, each of min_size entities or more, become one block.
+    Every occurrence is replaced, in the place and with the handle of its
+    first entity, by an insert at the corner it was moved from.  Only translated copies are
+    found, not rotated or scaled ones.  Returns the new blocks.
+    """
+    document.merge()
+    blocks = list()
+    for space in (document.model_space, document.paper_space):
+        blocks += dedupe_space(document, space, min_count, min_size, precision, auto)
+    return blocks
+
+
+def dedupe_space(document, space, min_count=2, min_size=2, precision=6, auto=True):
+    occurrences = dict()
+    for group in find_groups(space, auto):
+        if len(group) < min_size:
+            continue
+        x, y = union_bbox([value for entity in group for value in entity.get_bbox()])[:2]
+        occurrences.setdefault(signature(group, x, y, precision), []).append((group, x, y))
+
+    inserts, hoisted, blocks = dict(), set(), list()
+    for found in occurrences.values():
+        if len(found) < min_count:
+            continue
+        group, x, y = found[0]
+        block = document.new_block()
+        for entity in group:
+            local = copy.copy(entity)
+            local.move(-x, -y)
+            block.append(local)
+        blocks.append(block)
+        for group, x, y in found:
+            insert = Insert([x, y], block.name)
+            insert.set_block(block)
+            insert.set_layer(group[0].layer)
+            insert.set_space_status(group[0].space_status)
+            inserts[id(group[0])] = insert
+            hoisted.update(id(entity) for entity in group)
+
+    if blocks:
+        with space.lock:
+            entity_list = list()
+            for entity in space.entity_list:
+                insert = inserts.get(id(entity))
+                if insert is not None:
+                    # the handle of the entity it replaces keeps handles in list order
+                    insert.set_handle(entity.handle)
+                    insert.set_owner_handle(space.record_handle)
+                    entity_list.append(insert)
+                elif id(entity) not in hoisted:
+                    entity_list.append(entity)
+            space.entity_list = entity_list
+            space.groups = list()
+            space.grid = None
+            space.box = None
+    return blocks
+
+
+def find_groups(space, auto=True):
+    """The marked groups, then the clusters of touching unmarked entities."""
+    groups = [group for group in space.groups if all(_movable(entity) for entity in group)]
+    if not auto:
+        return groups
+    marked = {id(entity) for group in space.groups for entity in group}
+    entities = [entity for entity in space.entity_list
+                if id(entity) not in marked and _movable(entity)]
+    return groups + clusters(entities)
+
+
+def clusters(entities):
+    """entities split into clusters of touching bounding boxes, in order."""
+    grid = GridIndex(entities)
+    parent = list(range(len(entities)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, entity in enumerate(entities):
+        for other in grid.query_indexes(*entity.get_bbox()):
+            a, b = root(i), root(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    found = dict()
+    for i, entity in enumerate(entities):
+        found.setdefault(root(i), []).append(entity)
+    return list(found.values())
+
+
+def signature(entities, x, y, precision=6):
+    """The records of entities moved by (-x, -y), handles left out."""
+    records = list()
+    for entity in entities:
+        local = copy.copy(entity)
+        local.move(-x, -y)
+        code = local.to_code()
+        records.append(tuple(
+            (c, round(value, precision) if isinstance(value, float) else value)
+            for c, tag, value in zip(code.codes, code.tags, code.values())
+            if tag != GroupCode.HANDLE))
+    return tuple(records)
+
+
+def _movable(entity):
+    return not isinstance(entity, (Batch, Viewport))
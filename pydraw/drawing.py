@@ -1,18 +1,20 @@
-from PIL import Image, ImageDraw, ImageColor, ImageFont
-
-
 class PILDraw:
+    """Drawing on a PIL image; PIL is imported when the first one is made."""
+
     def __init__(self, width, height):
+        from PIL import Image, ImageColor, ImageDraw
         self._dpi = 300
         self._line_width = 4
         # size in mm
         self._width = self._mm_to_pixel(width)
         self._height = self._mm_to_pixel(height)
         self._draw = Image.new('RGB', (self._width, self._height), ImageColor.getrgb('white'))
+        self._black = ImageColor.getrgb('black')
         self._canvas = ImageDraw.Draw(self._draw)
         self._font = {}
 
     def _get_font(self, font, size):
+        from PIL import ImageFont
         size = self._mm_to_pixel(size)
         font = font + '.ttf'
         if font not in self._font:
@@ -34,7 +36,7 @@ class PILDraw:
         self._canvas.arc((x-radius, self._height - y - radius,
                           x+radius, self._height - y + radius),
                          start_degree, end_degree,
-                         fill=ImageColor.getrgb('black'),
+                         fill=self._black,
                          width=self._line_width)
 
     def line(self, start_pt, end_pt):
@@ -45,7 +47,7 @@ class PILDraw:
         x2 = self._mm_to_pixel(x2)
         y2 = self._mm_to_pixel(y2)
         self._canvas.line((x1, self._height - y1, x2, self._height - y2),
-                          fill=ImageColor.getrgb('black'),
+                          fill=self._black,
                           width=self._line_width)
 
     def text(self, string, insert_pt, size=10, font='simhei'):
@@ -53,4 +55,4 @@ class PILDraw:
         x = self._mm_to_pixel(x)
         y = self._mm_to_pixel(y)
         self._canvas.text((x, y), string, font=self._get_font(font, size),
-                          fill=ImageColor.getrgb('black'))
+                          fill=self._black)
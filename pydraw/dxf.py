@@ -1,6 +1,18 @@
+import marshal
 import math
-import pyparsing
-from collections import OrderedDict
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from itertools import chain
+from operator import itemgetter
+
+from .geometry import (arc_bbox, bulge_bbox, ellipse_bbox, moved, points_bbox, rect_bbox, sweep,
+                       union_bbox)
 
 
 class HandleContainer:
@@ -14,7 +26,7 @@ class HandleContainer:
 
     def __setitem__(self, key, entity):
         self.ordered_dict[key] = entity
-        entity.set_handle(self.handle_gen.get_hex())
+        entity.set_handle(self.handle_gen.get())
 
     def __getitem__(self, key):
         return self.ordered_dict[key]
@@ -23,66 +35,220 @@ class HandleContainer:
         return iter(self.ordered_dict.values())
 
 
+class LTypeContainer(HandleContainer):
+    """The linetypes of a document.
+
+    A complex linetype added without styles gets the text styles it names
+    from style, each made when missing: a shape file style for the .shx
+    file of its shapes.
+    """
+    def __init__(self, handle_gen, style):
+        super().__init__(handle_gen)
+        self.style = style
+
+    def __setitem__(self, key, ltype):
+        if ltype.styles is None and ltype.data is not None:
+            ltype.styles = self.get_styles(ltype.data)
+        super().__setitem__(key, ltype)
+
+    def get_styles(self, data):
+        styles = dict()
+        elements = data.get('elements') or compile_ltype(data['content'])
+        for element in elements[1]:
+            flags, style = element[1], element[3]
+            if style not in self.style.ordered_dict:
+                if flags & 4:
+                    self.style.append(Style(style, style, '', 1, shape_file=True))
+                else:
+                    self.style.append(Style(style))
+            styles[style] = self.style[style]
+        return styles
+
+
 class Resource:
-    def __init__(self, file_path=None):
+    """The definitions of an AutoCAD .pat or .lin file, by name.
+
+    Opening splits the file into definitions in one pass over its lines,
+    each a '*NAME,description' line followed by rows of comma separated
+    fields; blank lines and ';' comments are skipped.  A definition is
+    decoded on its first get_data: numbers become floats, other fields,
+    e.g. the 'A' alignment of a linetype, stay strings.
+
+    With cache, the decoded definitions are kept in cache_dir as a
+    marshal file and reused while the file's path, mtime and size are
+    the same.  The cache is replaced atomically, so processes starting
+    together at worst split the file each; a cache that cannot be read
+    or written is passed over.
+    """
+    field = re.compile(r'\[[^\]]*\]|[^,]+')
+    cache_dir = os.environ.get('PYDRAW_CACHE') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+        'pydraw')
+    cache_version = 1
+
+    def __init__(self, file_path=None, cache=True):
+        self.index = {}
         if file_path is not None:
-            with open(file_path) as file:
-                self.data_string = file.read()
+            self.index = self.load_index(file_path, cache)
 
         self.data = {}
 
-    def get_data(self, data_name):
-        if data_name in self.data.keys():
-            return self.data[data_name]
+    @classmethod
+    def load_index(cls, file_path, cache=True):
+        path = os.path.abspath(file_path)
+        cache_path = None
+        if cache and cls.cache_dir:
+            stat = os.stat(path)
+            key = (cls.cache_version, sys.implementation.cache_tag, path,
+                   stat.st_mtime_ns, stat.st_size)
+            name = f'{os.path.basename(path)}-{zlib.crc32(path.encode()):08x}.marshal'
+            cache_path = os.path.join(cls.cache_dir, name)
+            index = _read_cache(cache_path, key)
+            if index is not None:
+                return index
+
+        with open(path) as file:
+            index = cls.split(file.read())
+        if cache_path is not None:
+            # decoded up front, a definition then costs a marshal.loads
+            _write_cache(cache_path, key, {name: marshal.dumps(cls.decode(entry))
+                                           for name, entry in index.items()})
+        return index
 
-        block = self.gen_block_parse(data_name)
+    @staticmethod
+    def split(text):
+        """name -> (description, rows) of every definition, the first of a name kept."""
+        index = {}
+        rows = None
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line[0] == ';':
+                continue
+            if line[0] == '*':
+                name, _, inform = line[1:].partition(',')
+                rows = list()
+                index.setdefault(name.strip(), (inform, rows))
+            elif rows is not None:
+                rows.append(line)
+        return index
+
+    def __contains__(self, data_name):
+        return data_name in self.index
 
-        parse_result = block.searchString(self.data_string)
+    def get_data(self, data_name):
+        if data_name in self.data:
+            return self.data[data_name]
 
+        inform, content = self.decode(self.index[data_name])
         data = {'name': data_name,
-                'inform': parse_result[0].inform,
-                'content': parse_result[0].content}
+                'inform': inform,
+                'content': content}
 
         self.data[data_name] = data
         return data
 
-    @staticmethod
-    def gen_block_parse(name):
-        p = pyparsing
+    @classmethod
+    def decode(cls, entry):
+        """(description, rows) of an index entry, split from the file or marshalled."""
+        if entry.__class__ is bytes:
+            return marshal.loads(entry)
+        inform, rows = entry
+        return inform, tuple(cls.decode_row(row) for row in rows)
+
+    @classmethod
+    def decode_row(cls, row):
+        values = list()
+        for item in cls.field.findall(row):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                values.append(float(item))
+            except ValueError:
+                values.append(item)
+        return values
+
+
+def _read_cache(cache_path, key):
+    try:
+        with open(cache_path, 'rb') as file:
+            cached_key, value = marshal.loads(file.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return value if cached_key == key else None
+
+
+def _write_cache(cache_path, key, value):
+    """Write to a file of this process and thread, then rename it over cache_path."""
+    temp_path = f'{cache_path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(marshal.dumps((key, value)))
+            os.replace(temp_path, cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    except OSError:
+        pass
 
-        start_line = p.lineStart + '*' + name + ',' + p.restOfLine('inform')
 
-        below_one = '.' + p.OneOrMore(p.Word(p.nums))
-        above_one = p.OneOrMore(p.Word(p.nums)) + p.ZeroOrMore('.') + p.ZeroOrMore(p.Word(p.nums))
-        number = p.Combine(p.ZeroOrMore('-') + (below_one | above_one)).setParseAction(lambda tokens: float(tokens[0]))
-
-        content_line = p.Group(p.lineStart + p.delimitedList(p.Word(p.alphas) | number))
-
-        content = p.OneOrMore(content_line)('content')
-
-        return start_line + content
+class ReResource:
+    """Patterns or linetypes by name, built in or loaded from libraries.
 
+    load takes every definition of a .pat or .lin file, see Resource; a
+    later library overrides earlier ones and the built-in definitions.
+    get_data returns a definition with the arrays compile adds to it.
+    """
 
-class ReResource:
     def __init__(self):
         self.data = {}
+        self.libraries = []
 
     def add(self, name, inform, *content):
-        self.data[name] = {'name': name,
-                           'inform': inform,
-                           'content': content}
+        self.data[name] = self.compile({'name': name,
+                                        'inform': inform,
+                                        'content': content})
+
+    def load(self, file_path, cache=True):
+        library = Resource(file_path, cache)
+        for name in library.index:
+            self.data.pop(name, None)
+        self.libraries.append(library)
+
+    def __contains__(self, name):
+        return name in self.data or any(name in library for library in self.libraries)
 
     def get_data(self, name):
-        return self.data[name]
+        data = self.data.get(name)
+        if data is None:
+            for library in reversed(self.libraries):
+                if name in library:
+                    data = self.data[name] = self.compile(dict(library.get_data(name)))
+                    break
+            else:
+                raise KeyError(name)
+        return data
+
+    def compile(self, data):
+        return data
 
 
 class LTypeResource(ReResource):
+    """Linetypes; shapes maps the shape names of complex ones to numbers."""
+
     def __init__(self):
         super().__init__()
+        self.shapes = {}
         self.add('CENTER',
                  'Center ____ _ ____ _ ____ _ ____ _ ____ _ ____',
                  [1.25,-.25,.25,-.25])
 
+    def compile(self, data):
+        data['elements'] = compile_ltype(data['content'], self.shapes)
+        return data
+
 
 class PatternResource(ReResource):
     def __init__(self):
@@ -94,48 +260,566 @@ class PatternResource(ReResource):
                  'ANSI Iron, Brick, Stone masonry',
                  [45, 0, 0, 0, 3.175])
 
+    def compile(self, data):
+        data['lines'] = compile_pattern(data['content'])
+        return data
+
+
+def compile_pattern(content):
+    """The rows of a hatch pattern as arrays (heads, counts, dashes).
+
+    heads holds angle, x, y, dx, dy of every line, counts how many dashes
+    each line has, and dashes those of all lines in turn.
+    """
+    heads, counts, dashes = array('d'), array('H'), array('d')
+    for row in content:
+        if len(row) < 5:
+            raise ValueError(f'Pattern line needs angle, origin and offset: {row}')
+        heads.extend(row[:5])
+        counts.append(len(row) - 5)
+        dashes.extend(row[5:])
+    return heads, counts, dashes
+
+
+_embedded_params = {'S': 0, 'R': 1, 'A': 1, 'U': 1, 'X': 2, 'Y': 3}
+
+
+def compile_ltype(content, shapes=None):
+    """The dash lengths of a linetype as an array, and its embedded elements.
+
+    The first row of content is the .lin pattern: an optional 'A', dash
+    lengths and, after a dash, a text or shape in brackets.  Each element
+    is (dash index, 74 flags, text or shape number, style name, scale,
+    rotation in radians, x, y).  Shapes named rather than numbered are
+    looked up in shapes.
+    """
+    dashes, elements = array('d'), []
+    for item in (content[0] if content else ()):
+        if isinstance(item, str):
+            if item.upper() == 'A' and not dashes:
+                continue
+            if not (item.startswith('[') and item.endswith(']')) or not dashes:
+                raise ValueError(f'Unknown linetype element: {item}')
+            elements.append((len(dashes) - 1, *_compile_embedded(item[1:-1], shapes or {})))
+        else:
+            dashes.append(item)
+    return dashes, tuple(elements)
+
+
+def _compile_embedded(text, shapes):
+    if text.startswith('"'):
+        end = text.index('"', 1)
+        flags, value = 2, text[1:end]
+        fields = text[end + 1:].split(',')[1:]
+    else:
+        fields = text.split(',')
+        flags, value = 4, fields.pop(0).strip()
+        if value.isdigit():
+            value = int(value)
+        elif value in shapes:
+            value = shapes[value]
+        else:
+            raise ValueError(f'Linetype shape {value} needs its number in shapes')
+    style = fields.pop(0).strip() if fields else 'STANDARD'
+    # scale, rotation, x, y
+    params = [1.0, 0.0, 0.0, 0.0]
+    for field in fields:
+        key, _, number = field.strip().partition('=')
+        key = key.upper()
+        if key not in _embedded_params:
+            raise ValueError(f'Unknown linetype parameter: {field}')
+        if key == 'A':
+            flags |= 1
+        elif key == 'U':
+            # upright: the text is turned to read from left to right
+            flags |= 8
+        if _embedded_params[key] == 1:
+            params[1] = _radians(number)
+        else:
+            params[_embedded_params[key]] = float(number)
+    return (flags, value, style, *params)
+
+
+def _radians(angle):
+    """A .lin angle in radians: degrees, or radians or grads ending with r or g."""
+    angle = angle.strip().lower()
+    if angle.endswith('r'):
+        return float(angle[:-1])
+    if angle.endswith('g'):
+        return float(angle[:-1]) * math.pi / 200
+    return math.radians(float(angle.rstrip('d')))
+
 
 class GroupCode:
+    """Typed buffer of (group code, value) pairs.
+
+    Codes are kept in an ``array('H')`` and float values in an ``array('d')``;
+    every other value (ints, interned strings) goes to a plain list.  One tag
+    per pair records which store holds its value.  Ints under handle codes
+    are tagged HANDLE and written in hex.  Text is only produced at write
+    time, by ``lines`` or ``to_string``.  ``to_string`` without a precision
+    uses the buffer's own, which ``DXF.build`` sets to the document's.
+    """
+    ATOM = 0
+    FLOAT = 1
+    HANDLE = 2
+    precision = None
+
     def __init__(self):
-        self.data = list()
+        self.codes = array('H')
+        self.tags = array('B')
+        self.floats = array('d')
+        self.atoms = list()
+
+    def __len__(self):
+        return len(self.codes)
 
     def append(self, code, value):
-        if isinstance(code, list):
+        if code.__class__ is list:
             assert len(code) == len(value)
+            self.codes.extend(code)
             for c, v in zip(code, value):
-                self.data.append(f'{c}')
-                self.data.append(f'{v}')
+                kind = v.__class__
+                if kind is float:
+                    self.tags.append(1)
+                    self.floats.append(v)
+                elif kind is str:
+                    self.tags.append(0)
+                    self.atoms.append(v)
+                elif kind is int:
+                    self.tags.append(_int_tags[c])
+                    self.atoms.append(v)
+                else:
+                    self.store(c, v)
+            return
+
+        self.codes.append(code)
+        kind = value.__class__
+        if kind is float:
+            self.tags.append(1)
+            self.floats.append(value)
+        elif kind is str:
+            self.tags.append(0)
+            self.atoms.append(value)
+        elif kind is int:
+            self.tags.append(_int_tags[code])
+            self.atoms.append(value)
+        else:
+            self.store(code, value)
+
+    def store(self, code, value):
+        if isinstance(value, float):
+            self.tags.append(1)
+            self.floats.append(value)
+        elif isinstance(value, int):
+            self.tags.append(_int_tags[code])
+            self.atoms.append(int(value))
         else:
-            self.data.append(f'{code}')
-            self.data.append(f'{value}')
+            # text made here is interned, other strings are already shared
+            self.tags.append(0)
+            self.atoms.append(sys.intern(f'{value}'))
 
     def extend(self, group_code):
         assert isinstance(group_code, GroupCode)
-        self.data.extend(group_code.data)
+        self.codes += group_code.codes
+        self.tags += group_code.tags
+        self.floats += group_code.floats
+        self.atoms += group_code.atoms
+
+    def layout(self):
+        return CodeLayout.get(self.codes, self.tags)
+
+    def values(self):
+        """Return the values in pair order."""
+        return self.layout().order((*self.floats, *self.atoms))
+
+    def lines(self):
+        if not self.codes:
+            return []
+        return self.to_string().split('\n')
+
+    @property
+    def data(self):
+        return self.lines()
+
+    def to_string(self, precision=None):
+        if precision is None:
+            precision = self.precision
+        if precision is None:
+            return self.layout().text(self.floats, self.atoms)
+        return self.layout().text(format_floats(self.floats, precision), self.atoms)
 
-    def to_string(self):
-        return '\n'.join(self.data)
+    @staticmethod
+    def iter_text(codes, precision=None, batch_size=256):
+        """Yield the text of GroupCodes, one str per code or per batch of them.
+
+        With a precision, the floats of a whole batch are formatted at once.
+        """
+        if precision is None:
+            for code in codes:
+                yield code.to_string()
+            return
+
+        batch = list()
+        for code in codes:
+            batch.append(code)
+            if len(batch) >= batch_size:
+                yield '\n'.join(GroupCode.to_strings(batch, precision))
+                batch = list()
+        if batch:
+            yield '\n'.join(GroupCode.to_strings(batch, precision))
+
+    @staticmethod
+    def to_strings(codes, precision):
+        floats = array('d')
+        for code in codes:
+            floats += code.floats
+        texts = format_floats(floats, precision)
+        strings = list()
+        start = 0
+        for code in codes:
+            end = start + len(code.floats)
+            strings.append(code.layout().text(texts[start:end], code.atoms))
+            start = end
+        return strings
+
+    def to_bytes(self, encoding='utf-8'):
+        layout = self.layout()
+        values = layout.order((*self.floats, *self.atoms))
+        plan = layout.binary_plan
+        if plan is not None:
+            template, args, string_args, strings, handle_args = plan
+            args = args.copy()
+            args[1::2] = values
+            try:
+                for index in handle_args:
+                    args[index] = f'{args[index]:X}'
+
+                texts = '\0'.join(strings(args)).encode(encoding).split(b'\0')
+                for index, text in zip(string_args, texts):
+                    args[index] = text
+                return struct.pack(template % tuple(map(len, texts)), *args)
+            except (TypeError, struct.error):
+                pass
+        # values that need converting, e.g. '1' under an integer code
+        return b''.join([_pack_code(code) + _binary_encoders[value_type(code)](
+                             f'{value:X}' if tag == 2 else value, encoding)
+                         for code, tag, value in zip(self.codes, self.tags, values)])
+
+
+class CodeLayout:
+    """Write plans shared by every GroupCode with the same codes and tags.
+
+    Records of one entity type share their layout, so plans for small
+    layouts are compiled once and cached.
+    """
+    cache = dict()
+    cache_size = 1024
+    cache_layout_size = 256
+
+    @classmethod
+    def get(cls, codes, tags):
+        key = (codes.tobytes(), tags.tobytes())
+        layout = cls.cache.get(key)
+        if layout is None:
+            layout = cls(codes, tags)
+            if len(codes) <= cls.cache_layout_size:
+                if len(cls.cache) >= cls.cache_size:
+                    cls.cache.clear()
+                cls.cache[key] = layout
+        return layout
+
+    def __init__(self, codes, tags):
+        self.codes = array('H', codes)
+        self.tags = array('B', tags)
+        self._text_template = None
+        self._order = None
+        self._binary = None
+
+    def text(self, floats, atoms):
+        """The text of a GroupCode of this layout, one %-format over a template.
+
+        floats may be floats or their already formatted text.  A cached
+        layout puts the values in pair order with its order getter, a
+        large one by picking from the float and atom streams by tag.
+        """
+        if self._text_template is None:
+            self._text_template = '\n'.join(map(_text_pieces.__getitem__,
+                                                zip(self.codes, self.tags)))
+        if len(self.tags) <= self.cache_layout_size:
+            values = self.order((*floats, *atoms))
+        else:
+            atom_iter = iter(atoms)
+            streams = atom_iter, iter(floats), atom_iter
+            values = tuple(map(next, map(streams.__getitem__, self.tags)))
+        return self._text_template % values
+
+    @property
+    def order(self):
+        """Getter taking floats + atoms to the values in pair order."""
+        if self._order is None:
+            float_index, atom_index = 0, self.tags.count(GroupCode.FLOAT)
+            indices = list()
+            for tag in self.tags:
+                if tag == GroupCode.FLOAT:
+                    indices.append(float_index)
+                    float_index += 1
+                else:
+                    indices.append(atom_index)
+                    atom_index += 1
+            self._order = _getter(indices)
+        return self._order
+
+    @property
+    def binary_plan(self):
+        """(struct format template, argument list, string argument indices,
+        string getter, handle argument indices).
+
+        The format takes the byte length of every string value, the
+        argument list holds the codes with a gap after each one for its
+        value.  Int handles are turned to hex strings before packing.
+        None when the layout holds binary chunks.
+        """
+        if self._binary is None:
+            template, args, string_args, handle_args = ['<'], list(), list(), list()
+            for code, tag in zip(self.codes, self.tags):
+                kind = value_type(code)
+                if kind is bytes:
+                    self._binary = (None,)
+                    break
+                template.append('H' + _struct_formats[kind])
+                if kind is str:
+                    string_args.append(len(args) + 1)
+                    if tag == GroupCode.HANDLE:
+                        handle_args.append(len(args) + 1)
+                args.extend((code, None))
+            else:
+                self._binary = (''.join(template), args, string_args, _getter(string_args),
+                                handle_args),
+        return self._binary[0]
+
+
+class _TextPieces(dict):
+    """'code\n%s' template pieces by (code, tag), handles written in hex."""
+
+    def __missing__(self, key):
+        code, tag = key
+        piece = self[key] = f'{code}\n%X' if tag == GroupCode.HANDLE else f'{code}\n%s'
+        return piece
+
+
+_text_pieces = _TextPieces()
+
+BINARY_SENTINEL = b'AutoCAD Binary DXF\r\n\x1a\x00'
+
+_trailing_zeros = re.compile(r'0+\n')
+_negative_zero = re.compile(r'^-0\n', re.MULTILINE)
+
+
+def format_floats(floats, precision):
+    """Format floats with precision decimals, trailing zeros stripped."""
+    if not floats:
+        return []
+    text = (f'%.{precision}f\n' * len(floats)) % tuple(floats)
+    if precision > 0:
+        text = _trailing_zeros.sub('\n', text).replace('.\n', '\n')
+    if '-0\n' in text:
+        text = _negative_zero.sub('0\n', text)
+    return text.split('\n')[:-1]
+
+
+def is_float_code(code):
+    return (10 <= code <= 59 or 110 <= code <= 149 or 210 <= code <= 239
+            or 460 <= code <= 469 or 1010 <= code <= 1059)
+
+
+def is_handle_code(code):
+    return (code == 5 or code == 105 or 320 <= code <= 369 or 390 <= code <= 399
+            or 480 <= code <= 481 or code == 1005)
+
+
+# GroupCode tag of an int value, indexed by code
+_int_tags = bytes(GroupCode.HANDLE if is_handle_code(code) else GroupCode.ATOM
+                  for code in range(1072))
+
+
+def value_type(code):
+    """Type of the values under a group code, according dxf spec."""
+    if is_float_code(code):
+        return float
+    if (60 <= code <= 79 or 170 <= code <= 179 or 270 <= code <= 289
+            or 370 <= code <= 389 or 400 <= code <= 409 or 1060 <= code <= 1070):
+        return 'int16'
+    if 90 <= code <= 99 or 420 <= code <= 429 or 440 <= code <= 459 or code == 1071:
+        return 'int32'
+    if 160 <= code <= 169:
+        return 'int64'
+    if 290 <= code <= 299:
+        return bool
+    if 310 <= code <= 319 or code == 1004:
+        return bytes
+    return str
+
+
+_pack_code = struct.Struct('<H').pack
+_pack_double = struct.Struct('<d').pack
+_pack_int16 = struct.Struct('<h').pack
+_pack_int32 = struct.Struct('<i').pack
+_pack_int64 = struct.Struct('<q').pack
+
+
+def _encode_chunk(value, encoding):
+    data = bytes.fromhex(value)
+    return bytes((len(data),)) + data
+
+
+_struct_formats = {
+    str: '%dsx', float: 'd', 'int16': 'h', 'int32': 'i', 'int64': 'q', bool: '?',
+}
+
+_binary_encoders = {
+    str: lambda value, encoding: f'{value}'.encode(encoding) + b'\0',
+    float: lambda value, encoding: _pack_double(float(value)),
+    'int16': lambda value, encoding: _pack_int16(int(value)),
+    'int32': lambda value, encoding: _pack_int32(int(value)),
+    'int64': lambda value, encoding: _pack_int64(int(value)),
+    bool: lambda value, encoding: b'\1' if int(value) else b'\0',
+    bytes: _encode_chunk,
+}
+
+
+def _getter(indices):
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda values: (values[index],)
+    if not indices:
+        return lambda values: ()
+    return itemgetter(*indices)
+
+
+class Template:
+    """Precompiled record layout of one entity type.
+
+    ``fields`` is a list of (code, value) pairs where ``...`` marks a
+    variable field.  Variables under float group codes are stored as
+    floats, the others as given; variables under handle codes must be
+    int handles.  ``fill`` appends one record from the
+    variable values in field order; ``fill_many`` appends ``count``
+    records from columns of values, where a column may be a single value
+    shared by every record.
+    """
+    def __init__(self, fields):
+        self.codes = array('H', [code for code, _ in fields])
+        self.tags = array('B')
+        float_constants, float_indices = list(), list()
+        atom_constants, atom_indices = list(), list()
+        self.float_columns, self.atom_columns = list(), list()
+        arg_count = sum(1 for _, value in fields if value is ...)
+        arg = 0
+        for code, value in fields:
+            if value is ...:
+                if is_float_code(code):
+                    self.tags.append(GroupCode.FLOAT)
+                    self.float_columns.append((len(float_indices), arg))
+                    float_indices.append(arg)
+                else:
+                    self.tags.append(_int_tags[code])
+                    self.atom_columns.append((len(atom_indices), arg))
+                    atom_indices.append(arg)
+                arg += 1
+            elif isinstance(value, float):
+                self.tags.append(GroupCode.FLOAT)
+                float_indices.append(arg_count + len(float_constants))
+                float_constants.append(value)
+            else:
+                self.tags.append(_int_tags[code] if isinstance(value, int) else GroupCode.ATOM)
+                atom_indices.append(arg_count + len(atom_constants))
+                atom_constants.append(value)
+
+        self.arg_count = arg_count
+        # constants are looked up after the values, see fill
+        self.float_constants = tuple(float_constants)
+        self.atom_constants = tuple(atom_constants)
+        self.float_getter = _getter(float_indices)
+        self.atom_getter = _getter(atom_indices)
+        self.float_row = [self.float_constants[i - arg_count] if i >= arg_count else 0.0
+                          for i in float_indices]
+        self.atom_row = [self.atom_constants[i - arg_count] if i >= arg_count else None
+                         for i in atom_indices]
+
+    def fill(self, code, *values):
+        assert len(values) == self.arg_count
+        code.codes += self.codes
+        code.tags += self.tags
+        code.floats.extend(self.float_getter(values + self.float_constants))
+        code.atoms += self.atom_getter(values + self.atom_constants)
+
+    def fill_many(self, code, count, *columns):
+        assert len(columns) == self.arg_count
+        code.codes += self.codes * count
+        code.tags += self.tags * count
+        code.floats += self._spread_floats(count, columns)
+        code.atoms += self._spread(self.atom_row, self.atom_columns, count, columns)
+
+    def _spread_floats(self, count, columns):
+        width = len(self.float_row)
+        values = array('d', self.float_row) * count
+        for offset, arg in self.float_columns:
+            column = columns[arg]
+            if isinstance(column, (int, float)):
+                column = [column] * count
+            values[offset::width] = column if isinstance(column, array) else array('d', column)
+        return values
+
+    @staticmethod
+    def _spread(row, slots, count, columns):
+        width = len(row)
+        values = row * count
+        for offset, arg in slots:
+            column = columns[arg]
+            if isinstance(column, (str, int, float)):
+                column = [column] * count
+            values[offset::width] = column
+        return values
 
 
 class Handle:
-    max = 0xfffff
+    """Allocator of int handles, safe to share between threads.
+
+    Handles are kept as ints and only written in hex, by GroupCode.
+    seed is the next free handle, the header's HANDSEED.
+    """
+    max = 0xffffffffffffffff
 
     def __init__(self, start=1):
         self._index = start
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            index = self._index
+            if index > self.max:
+                raise OverflowError('Out of handles')
+            self._index = index + 1
+        return index
 
     def get_hex(self):
-        assert self._index < self.max
-        ret = hex(self._index).upper()[2:]
-        self._index += 1
-        return ret
+        return f'{self.get():X}'
 
     def get_dec(self):
-        ret = f'{self._index}'
-        self._index += 1
-        return ret
+        return f'{self.get()}'
+
+    def reserve(self, count):
+        """Take count consecutive handles and return the first."""
+        with self._lock:
+            start = self._index
+            if start + count - 1 > self.max:
+                raise OverflowError('Out of handles')
+            self._index = start + count
+        return start
 
-    def get_max(self):
-        return hex(self.max).upper()[2:]
+    def seed(self):
+        return self._index
 
 
 # ------------------------------------------
@@ -194,16 +878,74 @@ class Class:
 
 
 class TableItem:
+    """Base of the table records.
+
+    Like an Entity, a record keeps its GroupCode once get_code asks for it
+    and drops it when an attribute is set.  When a record it refers to
+    changes, e.g. the LType of a layer is renamed, call touch.
+    """
+    __slots__ = ('handle', 'name', '_code')
+
     def __init__(self, name):
         self.handle = None
         self.name = name
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name[0] != '_':
+            object.__setattr__(self, '_code', None)
+
+    def touch(self):
+        self._code = None
+
+    def get_code(self):
+        if self._code is None:
+            self._code = self.to_code()
+        return self._code
+
     def set_handle(self, handle):
         assert self.handle is None
         self.handle = handle
 
+    def copy(self):
+        """A copy sharing the GroupCode, which the first change drops."""
+        clone = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(self, name):
+                    object.__setattr__(clone, name, getattr(self, name))
+        return clone
+
+
+class Table:
+    """A TABLE serialized from the codes of its records.
+
+    The table holds while the records' codes are the very same objects:
+    adding to a HandleContainer or setting an attribute of a record makes
+    it go stale.  The text or bytes are kept for the last encoding asked.
+    """
+    __slots__ = ('record_codes', 'code', '_encoded')
+
+    def __init__(self, record_codes, code):
+        self.record_codes = record_codes
+        self.code = code
+        self._encoded = None
+
+    def matches(self, record_codes):
+        return (len(record_codes) == len(self.record_codes)
+                and all(a is b for a, b in zip(record_codes, self.record_codes)))
+
+    def encode(self, binary=False, encoding='utf-8', precision=None):
+        key = binary, encoding, precision
+        if self._encoded is None or self._encoded[0] != key:
+            data = self.code.to_bytes(encoding) if binary else self.code.to_string(precision)
+            self._encoded = key, data
+        return self._encoded[1]
+
 
 class AppID(TableItem):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
 
@@ -221,6 +963,8 @@ class AppID(TableItem):
 
 
 class BlockRecord(TableItem):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
 
@@ -240,6 +984,9 @@ class BlockRecord(TableItem):
 
 
 class DimStyle(TableItem):
+    __slots__ = ('text_style', 'dim_scale', 'measure_scale', 'text_height', 'arrow_size',
+                 'angle_precision', 'dec_precision')
+
     def __init__(self, name, text_style, dim_scale=1, measure_scale=1,
                  text_height=2.5, arrow_size=2.0,
                  angle_precision=1, dec_precision=0):
@@ -295,6 +1042,8 @@ class DimStyle(TableItem):
 
 
 class Layer(TableItem):
+    __slots__ = ('ltype', 'color', 'no_print')
+
     def __init__(self, name, ltype=None, color=7, no_print=False):
         super().__init__(name)
         self.ltype = ltype
@@ -321,16 +1070,25 @@ class Layer(TableItem):
             code.append(290, 0)
 
         code.append(370, -3)
-        code.append(390, self.handle + '0')
-        code.append(347, self.handle + '1')
+        code.append(390, self.handle * 16)
+        code.append(347, self.handle * 16 + 1)
 
         return code
 
 
 class LType(TableItem):
-    def __init__(self, name, data=None):
+    """A linetype; data is a definition of LTypeResource.
+
+    The texts and shapes of a complex linetype refer to text styles by
+    name, looked up in styles: adding the linetype to a document fills
+    it in.
+    """
+    __slots__ = ('data', 'styles')
+
+    def __init__(self, name, data=None, styles=None):
         super().__init__(name)
         self.data = data
+        self.styles = styles
 
     def to_code(self):
         assert self.handle is not None
@@ -350,22 +1108,42 @@ class LType(TableItem):
             code.append(40, 0.0)
         else:
             assert self.data is not None
-            inform, content = self.data['inform'], self.data['content'][0]
+            dashes, elements = self.data.get('elements') or compile_ltype(self.data['content'])
 
-            code.append(3, inform)
-            code.append(72, 5)
-            code.append(73, len(content))
-            code.append(40, sum(abs(item) for item in content))
-            for item in content:
-                code.append([49, 74], [item, 0])
+            code.append(3, self.data['inform'])
+            code.append(72, 65)
+            code.append(73, len(dashes))
+            code.append(40, sum(map(abs, dashes)))
+            if not elements:
+                code.append([49, 74] * len(dashes), [value for dash in dashes for value in (dash, 0)])
+                return code
+
+            embedded = {element[0]: element[1:] for element in elements}
+            for index, dash in enumerate(dashes):
+                code.append(49, dash)
+                element = embedded.get(index)
+                if element is None:
+                    code.append(74, 0)
+                    continue
+                flags, value, style, scale, rotation, x, y = element
+                code.append(74, flags)
+                code.append(75, 0 if flags & 2 else value)
+                code.append(340, self.styles[style].handle)
+                code.append([46, 50, 44, 45], [scale, rotation, x, y])
+                if flags & 2:
+                    code.append(9, value)
 
         return code
 
 
 class Style(TableItem):
+    """A text style, or with shape_file the shapes of font_name."""
+    __slots__ = ('font_name', 'big_font_name', 'width_factor', 'oblique_degree',
+                 'system_font_name', 'ext_data', 'shape_file')
+
     def __init__(self, name, font_name='simp1.shx',
                  big_font_name='hz.shx', width_factor=0.7, oblique_degree=0,
-                 system_font_name=None, ext_data=None):
+                 system_font_name=None, ext_data=None, shape_file=False):
         super().__init__(name)
         self.font_name = font_name
         self.big_font_name = big_font_name
@@ -373,6 +1151,7 @@ class Style(TableItem):
         self.oblique_degree = 0
         self.system_font_name = system_font_name
         self.ext_data = ext_data
+        self.shape_file = shape_file
 
     def to_code(self):
         assert self.handle is not None
@@ -383,7 +1162,7 @@ class Style(TableItem):
         code.append(100, 'AcDbTextStyleTableRecord')
         code.append(2, self.name)
 
-        code.append(70, 0)
+        code.append(70, 1 if self.shape_file else 0)
         code.append(40, 0)
         code.append(41, self.width_factor)
         code.append(50, self.oblique_degree)
@@ -405,37 +1184,107 @@ class Style(TableItem):
 # ------------------------------------------
 
 
-class Block:
+class Stage:
+    """Entities appended by one producer; they get handles when merged."""
+    __slots__ = ('key', 'entity_list')
+
+    def __init__(self, key):
+        self.key = key
+        self.entity_list = list()
+
+    def __len__(self):
+        return len(self.entity_list)
+
+    def append(self, entity):
+        assert isinstance(entity, Entity)
+        self.entity_list.append(entity)
+
+    def extend(self, entities):
+        for entity in entities:
+            self.append(entity)
+
+
+class Staging:
+    """Thread-safe appending for blocks and spaces.
+
+    append takes handles at once, in call order.  Producer threads should
+    rather fill a stage(key) each: a stage is not shared, and merge appends
+    the stages in key order, so handles and output do not depend on thread
+    scheduling.  The document merges before it builds, and a space before
+    it is queried.
+    """
+
+    def __init__(self):
+        self.stages = dict()
+        self.lock = threading.Lock()
+
+    def stage(self, key):
+        """The stage of key, created on first use; keys must sort."""
+        with self.lock:
+            stage = self.stages.get(key)
+            if stage is None:
+                stage = self.stages[key] = Stage(key)
+        return stage
+
+    def merge(self):
+        """Append the staged entities, stage by stage in key order."""
+        with self.lock:
+            stages = [self.stages.pop(key) for key in sorted(self.stages)]
+        for stage in stages:
+            self.extend(stage.entity_list)
+
+    def extend(self, entities):
+        for entity in entities:
+            self.append(entity)
+
+
+class Block(Staging):
     index = 0
 
     def __init__(self, handle_gen,
                  name=None, layer=None, pt_base=(0, 0)):
+        super().__init__()
         self.entity_list = list()
         self.handle_gen = handle_gen
         if name is None:
-            name = f'BLOCK{self.index}'
-            self.index += 1
+            name = f'BLOCK{Block.index}'
+            Block.index += 1
         self.name = name
         self.layer = layer
         self.pt_base = pt_base
-        self.begin_handle = self.handle_gen.get_hex()
-        self.end_handle = self.handle_gen.get_hex()
+        self.begin_handle = self.handle_gen.get()
+        self.end_handle = self.handle_gen.get()
 
         self._gen_block_record()
 
     def _gen_block_record(self):
         self.block_record = BlockRecord(self.name)
-        self.block_record.set_handle(self.handle_gen.get_hex())
+        self.block_record.set_handle(self.handle_gen.get())
         self.record_handle = self.block_record.handle
 
     def append(self, entity):
         assert isinstance(entity, Entity)
         assert self.record_handle is not None
-        self.entity_list.append(entity)
-        entity.set_handle(self.handle_gen.get_hex())
+        with self.lock:
+            self.entity_list.append(entity)
+            if isinstance(entity, Batch):
+                entity.set_handle_range(self.handle_gen.reserve(len(entity)))
+            else:
+                entity.set_handle(self.handle_gen.get())
         entity.set_owner_handle(self.record_handle)
 
-    def to_code(self):
+    def extents(self):
+        return entity_extents(self.entity_list)
+
+    def to_code(self, cached=False):
+        code = GroupCode()
+        for part in self.iter_code(cached):
+            code.extend(part)
+
+        return code
+
+    def iter_code(self, cached=False):
+        self.merge()
         assert self.begin_handle is not None
         assert self.end_handle is not None
         if self.layer is None:
@@ -452,15 +1301,15 @@ class Block:
         code.append(70, 0)
         code.append([10, 20, 30], [self.pt_base[0], self.pt_base[1], 0])
         code.append(3, self.name)
-        for entity in self.entity_list:
-            code.extend(entity.to_code())
+        yield code
+        yield from iter_entity_codes(self.entity_list, cached)
+        code = GroupCode()
         code.append(0, 'ENDBLK')
         code.append(5, self.end_handle)
         code.append(100, 'AcDbEntity')
         code.append(8, layer)
         code.append(100, 'AcDbBlockEnd')
-
-        return code
+        yield code
 
 
 # ------------------------------------------
@@ -469,28 +1318,164 @@ class Block:
 
 
 class Entity:
+    """Base of the drawing entities.
+
+    The serialized record is cached by get_code/encode once the document
+    asks for it, and the bounding box by get_bbox.  The set_* methods and
+    move drop the caches; after assigning an attribute or changing a point
+    in place, call touch.  Plain attributes keep construction as cheap as
+    it was before the caches.  An entity with no extent returns None from
+    bbox, the default.
+    """
+    __slots__ = ('layer', 'handle', 'owner_handle', 'space_status', '_code', '_encoded',
+                 '_bbox')
+
     def __init__(self):
         self.layer = None
         self.handle = None
         self.owner_handle = None
         self.space_status = 0
+        self._code = self._encoded = self._bbox = None
+
+    def touch(self):
+        self._code = None
+        self._encoded = None
+        self._bbox = None
+
+    def touch_code(self):
+        """Drop the serialized record only, after a change of no extent."""
+        self._code = None
+        self._encoded = None
+
+    def get_code(self):
+        if self._code is None:
+            self._code = self.to_code()
+        return self._code
+
+    def encode(self, binary=False, encoding='utf-8', precision=None):
+        key = binary, encoding, precision
+        if self._encoded is None or self._encoded[0] != key:
+            code = self._code if self._code is not None else self.to_code()
+            data = code.to_bytes(encoding) if binary else code.to_string(precision)
+            self._encoded = key, data
+        return self._encoded[1]
 
     def check_before_build(self):
         assert self.layer is not None
         assert self.handle is not None
         assert self.owner_handle is not None
 
+    def bbox(self):
+        """(xmin, ymin, xmax, ymax) enclosing the entity, None when it has no extent."""
+        return None
+
+    def get_bbox(self):
+        if self._bbox is None:
+            self._bbox = self.bbox()
+        return self._bbox
+
+    def move(self, x, y):
+        """Translate by (x, y), giving the entity new point lists."""
+        raise NotImplementedError
+
     def set_layer(self, layer):
         self.layer = layer
+        self.touch_code()
 
     def set_handle(self, handle):
         self.handle = handle
+        self.touch_code()
 
     def set_owner_handle(self, handle):
         self.owner_handle = handle
+        self.touch_code()
 
     def set_space_status(self, code):
         self.space_status = code
+        self.touch_code()
+
+
+class Batch(Entity):
+    """Base of the entity batches: many records of one entity type.
+
+    Subclasses (see pydraw.batch) set template to the entity's Template
+    and return its fill_many columns from columns(), the handles
+    excepted.  Space.append gives a batch one handle per record, as a
+    contiguous range; handle is the first of them.  The records come out
+    chunk_size at a time, so the layouts stay small enough to be cached.
+    """
+    __slots__ = ('first_handle',)
+    template = None
+
+    def __init__(self):
+        super().__init__()
+        self.first_handle = None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def set_handle_range(self, first):
+        self.first_handle = first
+        self.handle = first
+        self.touch_code()
+
+    def columns(self):
+        raise NotImplementedError
+
+    @property
+    def chunk_size(self):
+        return max(1, 256 // len(self.template.codes))
+
+    def iter_code(self):
+        self.check_before_build()
+        columns = self.columns()
+        count = len(self)
+        step = self.chunk_size
+        first = self.first_handle
+        for start in range(0, count, step):
+            stop = min(start + step, count)
+            code = GroupCode()
+            self.template.fill_many(
+                code, stop - start,
+                list(range(first + start, first + stop)),
+                *[column[start:stop] if isinstance(column, (array, list)) else column
+                  for column in columns])
+            yield code
+
+    def to_code(self):
+        code = GroupCode()
+        for part in self.iter_code():
+            code.extend(part)
+        return code
+
+    def encode(self, binary=False, encoding='utf-8', precision=None):
+        key = binary, encoding, precision
+        if self._encoded is None or self._encoded[0] != key:
+            if binary:
+                data = b''.join([code.to_bytes(encoding) for code in self.iter_code()])
+            else:
+                data = '\n'.join(GroupCode.iter_text(self.iter_code(), precision))
+            self._encoded = key, data
+        return self._encoded[1]
+
+
+def entity_extents(entity_list):
+    """(xmin, ymin, xmax, ymax) over the entities' bounding boxes, None when empty."""
+    boxes = array('d')
+    for entity in entity_list:
+        box = entity.get_bbox()
+        if box is not None:
+            boxes.extend(box)
+    return union_bbox(boxes)
+
+
+def iter_entity_codes(entity_list, cached=False):
+    """Yield the GroupCodes of entities, a batch as several chunks."""
+    for entity in entity_list:
+        if isinstance(entity, Batch):
+            yield from entity.iter_code()
+        else:
+            yield entity.get_code() if cached else entity.to_code()
 
 
 # Linear Object
@@ -498,6 +1483,8 @@ class Entity:
 
 
 class Arc(Entity):
+    __slots__ = ('center', 'radius', 'start_angle', 'end_angle')
+
     def __init__(self, center, radius, start_angle, end_angle):
         super().__init__()
         self.center = center
@@ -505,47 +1492,64 @@ class Arc(Entity):
         self.start_angle = start_angle
         self.end_angle = end_angle
 
+    def bbox(self):
+        start = math.radians(self.start_angle)
+        return arc_bbox(self.center[0], self.center[1], self.radius, start,
+                        sweep(start, math.radians(self.end_angle)))
+
+    def move(self, x, y):
+        self.center = moved(self.center, x, y)
+        self.touch()
+
+    template = Template([
+        (0, 'ARC'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbCircle'), (67, ...),
+        (10, ...), (20, ...), (30, 0), (40, ...),
+        (100, 'AcDbArc'), (50, ...), (51, ...),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'ARC')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbCircle')
-        code.append(67, self.space_status)
-        code.append([10, 20, 30], [self.center[0], self.center[1], 0])
-        code.append(40, self.radius)
-        code.append(100, 'AcDbArc')
-        code.append([50, 51], [self.start_angle, self.end_angle])
-
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.center[0], self.center[1], self.radius,
+                           self.start_angle, self.end_angle)
         return code
 
 
 class Circle(Entity):
+    __slots__ = ('center', 'radius')
+
     def __init__(self, center, radius):
         super().__init__()
         self.center = center
         self.radius = radius
 
+    def bbox(self):
+        x, y, r = self.center[0], self.center[1], self.radius
+        return x - r, y - r, x + r, y + r
+
+    def move(self, x, y):
+        self.center = moved(self.center, x, y)
+        self.touch()
+
+    template = Template([
+        (0, 'CIRCLE'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbCircle'), (67, ...),
+        (10, ...), (20, ...), (30, 0), (40, ...),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'CIRCLE')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbCircle')
-        code.append(67, self.space_status)
-        code.append([10, 20, 30], [self.center[0], self.center[1], 0])
-        code.append(40, self.radius)
-
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.center[0], self.center[1], self.radius)
         return code
 
 
 class Ellipse(Entity):
+    __slots__ = ('center', 'long_vector', 'ratio', 'start_angle', 'end_angle')
+
     def __init__(self, center, long_vector, ratio, start_angle=0, end_angle=360):
         super().__init__()
         self.center = center
@@ -572,50 +1576,72 @@ class Ellipse(Entity):
             elif angle > 270:
                 return 2*math.pi + r
 
+    def bbox(self):
+        start = self.focus_radian(self.start_angle)
+        return ellipse_bbox(self.center[0], self.center[1],
+                            self.long_vector[0], self.long_vector[1], self.ratio,
+                            start, sweep(start, self.focus_radian(self.end_angle)))
+
+    def move(self, x, y):
+        self.center = moved(self.center, x, y)
+        self.touch()
+
+    template = Template([
+        (0, 'ELLIPSE'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbEllipse'), (67, ...),
+        (10, ...), (20, ...), (30, 0),
+        (11, ...), (21, ...), (31, 0),
+        (40, ...), (41, ...), (42, ...),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'ELLIPSE')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbEllipse')
-        code.append(67, self.space_status)
-        code.append([10, 20, 30], [self.center[0], self.center[1], 0])
-        code.append([11, 21, 31], [self.long_vector[0], self.long_vector[1], 0])
-        code.append(40, self.ratio)
-
-        code.append(41, self.focus_radian(self.start_angle))
-        code.append(42, self.focus_radian(self.end_angle))
-        # code.append([41, 42], [math.radians(self.start_angle), math.radians(self.end_angle)])
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.center[0], self.center[1],
+                           self.long_vector[0], self.long_vector[1], self.ratio,
+                           self.focus_radian(self.start_angle),
+                           self.focus_radian(self.end_angle))
         return code
 
 
 class Line(Entity):
+    __slots__ = ('start', 'end', 'line_scale')
+
     def __init__(self, start, end, line_scale=1):
         super().__init__()
         self.start = start
         self.end = end
         self.line_scale = line_scale
 
+    def bbox(self):
+        x0, y0, x1, y1 = self.start[0], self.start[1], self.end[0], self.end[1]
+        return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+    def move(self, x, y):
+        self.start = moved(self.start, x, y)
+        self.end = moved(self.end, x, y)
+        self.touch()
+
+    template = Template([
+        (0, 'LINE'), (5, ...), (8, ...), (48, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbLine'), (67, ...),
+        (10, ...), (20, ...), (30, 0),
+        (11, ...), (21, ...), (31, 0),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'LINE')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(48, self.line_scale)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbLine')
-        code.append(67, self.space_status)
-        code.append([10, 20, 30], [self.start[0], self.start[1], 0])
-        code.append([11, 21, 31], [self.end[0], self.end[1], 0])
+        self.template.fill(code, self.handle, self.layer.name, self.line_scale,
+                           self.owner_handle, self.space_status,
+                           self.start[0], self.start[1], self.end[0], self.end[1])
         return code
 
 
 class LWPolyline(Entity):
+    __slots__ = ('point_list', 'bulge_list')
+
     def __init__(self, point_list, bulge_list=None):
         super().__init__()
         self.point_list = point_list
@@ -624,35 +1650,50 @@ class LWPolyline(Entity):
         assert len(bulge_list) == len(point_list)
         self.bulge_list = bulge_list
 
+    def bbox(self):
+        return bulge_bbox(self.point_list, self.bulge_list)
+
+    def move(self, x, y):
+        self.point_list = [moved(pt, x, y) for pt in self.point_list]
+        self.touch()
+
+    template = Template([
+        (0, 'LWPOLYLINE'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbPolyline'), (67, ...), (90, ...),
+    ])
+    vertex_template = Template([(10, ...), (20, ...), (42, ...)])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'LWPOLYLINE')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbPolyline')
-        code.append(67, self.space_status)
-        code.append(90, len(self.point_list))
-        for pt, bulge in zip(self.point_list, self.bulge_list):
-            code.append([10, 20, 42], [pt[0], pt[1], bulge])
-
+        count = len(self.point_list)
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, count)
+        self.vertex_template.fill_many(code, count,
+                                       [pt[0] for pt in self.point_list],
+                                       [pt[1] for pt in self.point_list],
+                                       self.bulge_list)
         return code
 
 
 # Text object
 # -------------------------------------------------
 class _TextBase(Entity):
+    __slots__ = ('style',)
+
     def __init__(self):
         super().__init__()
         self.style = None
 
     def set_style(self, style):
         self.style = style
+        self.touch_code()
 
 
 class Text(_TextBase):
+    __slots__ = ('text_string', 'insert', 'height', 'h_justify', 'v_justify', 'width_factor',
+                 'angle')
+
     def __init__(self, text_string, insert, height,
                  h_justify=0, v_justify=0, width_factor=0.7, angle=0):
         super().__init__()
@@ -668,37 +1709,46 @@ class Text(_TextBase):
 
     def set_style(self, style):
         self.style = style
+        self.touch_code()
+
+    def bbox(self):
+        # characters taken as height * width_factor wide
+        width = len(self.text_string) * self.height * self.width_factor
+        left = -width * (0, 0.5, 1, 0, 0.5, 0)[self.h_justify]
+        bottom = -self.height * (0, 0, 0.5, 1)[self.v_justify]
+        return rect_bbox(self.insert[0], self.insert[1], left, bottom,
+                         left + width, bottom + self.height, self.angle)
+
+    def move(self, x, y):
+        self.insert = moved(self.insert, x, y)
+        self.touch()
+
+    # Warning! text_style(7) must put after the insert points,
+    # or it can't display in CAD
+    template = Template([
+        (0, 'TEXT'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbText'), (67, ...),
+        (1, ...), (50, ...), (40, ...), (41, ...), (72, ...),
+        (10, ...), (20, ...), (30, 0),
+        (11, ...), (21, ...), (31, 0),
+        (7, ...), (100, 'AcDbText'), (73, ...),
+    ])
 
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'TEXT')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbText')
-        code.append(67, self.space_status)
-        code.append(1, self.text_string)
-        code.append(50, self.angle)
-        code.append(40, self.height)
-        code.append(41, self.width_factor)
-        code.append(72, self.h_justify)
-
-        code.append([10, 20, 30], [self.insert[0], self.insert[1], 0])
-        code.append([11, 21, 31], [self.insert[0], self.insert[1], 0])
-        # Warning! text_style must put here, or it can't display in CAD
-        # First we put upwards, and it can't display
-        if self.style is None:
-            code.append(7, 'STANDARD')
-        else:
-            code.append(7, self.style.name)
-        code.append(100, 'AcDbText')
-        code.append(73, self.v_justify)
+        style = 'STANDARD' if self.style is None else self.style.name
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.text_string,
+                           self.angle, self.height, self.width_factor, self.h_justify,
+                           self.insert[0], self.insert[1], self.insert[0], self.insert[1],
+                           style, self.v_justify)
         return code
 
 
 class MText(_TextBase):
+    __slots__ = ('text_string', 'insert', 'height', 'width', 'attach')
+
     def __init__(self, text_string, insert, height, width=None, attach=1):
         super().__init__()
         self.text_string = text_string
@@ -707,22 +1757,33 @@ class MText(_TextBase):
         self.width = width
         self.attach = attach
 
+    def bbox(self):
+        # characters taken as 0.7 * height wide, lines wrapped at width
+        length = len(self.text_string) * self.height * 0.7
+        width = length if self.width is None else self.width
+        lines = 1 if not width else max(1, math.ceil(length / width))
+        height = lines * self.height * 1.67
+        row, column = divmod(self.attach - 1, 3)
+        left = -width * column / 2
+        top = height * row / 2
+        return rect_bbox(self.insert[0], self.insert[1], left, top - height, left + width, top)
+
+    def move(self, x, y):
+        self.insert = moved(self.insert, x, y)
+        self.touch()
+
+    template = Template([
+        (0, 'MTEXT'), (5, ...), (8, ...), (7, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbMText'), (40, ...), (67, ...),
+        (10, ...), (20, ...), (30, 0),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'MTEXT')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        if self.style is None:
-            code.append(7, 'STANDARD')
-        else:
-            code.append(7, self.style.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbMText')
-        code.append(40, self.height)
-        code.append(67, self.space_status)
-        code.append([10, 20, 30], [self.insert[0], self.insert[1], 0])
+        style = 'STANDARD' if self.style is None else self.style.name
+        self.template.fill(code, self.handle, self.layer.name, style, self.owner_handle,
+                           self.height, self.space_status, self.insert[0], self.insert[1])
 
         if self.width is not None:
             code.append(41, self.width)
@@ -735,7 +1796,7 @@ class MText(_TextBase):
             code.append(1, self.text_string)
         else:
             text_list = [self.text_string[i:i + 250] for i in range(0, word_count, 250)]
-            code.append([3]*(len(text_list)-1), self.text_string[:-1])
+            code.append([3]*(len(text_list)-1), text_list[:-1])
             code.append(1, text_list[-1])
 
         return code
@@ -746,12 +1807,15 @@ class MText(_TextBase):
 
 
 class _DimBase(Entity):
+    __slots__ = ('dimstyle',)
+
     def __init__(self):
         super().__init__()
         self.dimstyle = None
 
     def set_dimstyle(self, dimstyle):
         self.dimstyle = dimstyle
+        self.touch_code()
 
     def check_before_build(self):
         super().check_before_build()
@@ -759,6 +1823,8 @@ class _DimBase(Entity):
 
 
 class ArcLengthDimension(_DimBase):
+    __slots__ = ('center', 'line_insert', 'arc_start', 'arc_end')
+
     def __init__(self, center, line_insert, arc_start, arc_end):
         super().__init__()
         self.center = center
@@ -766,60 +1832,88 @@ class ArcLengthDimension(_DimBase):
         self.arc_start = arc_start
         self.arc_end = arc_end
 
+    def bbox(self):
+        radius = math.hypot(self.arc_start[0] - self.center[0],
+                            self.arc_start[1] - self.center[1])
+        x, y = self.center[0], self.center[1]
+        return points_bbox([(x - radius, y - radius), (x + radius, y + radius),
+                            self.line_insert])
+
+    def move(self, x, y):
+        self.center = moved(self.center, x, y)
+        self.line_insert = moved(self.line_insert, x, y)
+        self.arc_start = moved(self.arc_start, x, y)
+        self.arc_end = moved(self.arc_end, x, y)
+        self.touch()
+
+    # dim type(70), value is magic number, according dxf spec.
+    template = Template([
+        (0, 'ARC_DIMENSION'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbDimension'), (67, ...), (3, ...),
+        (10, ...), (20, ...), (30, 0),
+        (70, 37), (100, 'AcDbArcDimension'),
+        (15, ...), (25, ...), (35, 0),
+        (13, ...), (23, ...), (33, 0),
+        (16, ...), (26, ...), (36, 0),
+        (14, ...), (24, ...), (34, 0),
+        (17, ...), (27, ...), (37, 0),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'ARC_DIMENSION')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbDimension')
-        code.append(67, self.space_status)
-        code.append(3, self.dimstyle.name)
-        code.append([10, 20, 30], [self.line_insert[0], self.line_insert[1], 0])
-        # dim type, value is magic number, according dxf spec.
-        code.append(70, 37)
-        code.append(100, 'AcDbArcDimension')
-        code.append([15, 25, 35], [self.center[0], self.center[1], 0])
-        code.append([13, 23, 33], [self.arc_start[0], self.arc_start[1], 0])
-        code.append([16, 26, 36], [self.arc_start[0], self.arc_start[1], 0])
-        code.append([14, 24, 34], [self.arc_end[0], self.arc_end[1], 0])
-        code.append([17, 27, 37], [self.arc_end[0], self.arc_end[1], 0])
-
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.dimstyle.name,
+                           self.line_insert[0], self.line_insert[1],
+                           self.center[0], self.center[1],
+                           self.arc_start[0], self.arc_start[1],
+                           self.arc_start[0], self.arc_start[1],
+                           self.arc_end[0], self.arc_end[1],
+                           self.arc_end[0], self.arc_end[1])
         return code
 
 
 class DiametricDimension(_DimBase):
+    __slots__ = ('start', 'end', 'leader_length')
+
     def __init__(self, start, end, leader_length=None):
         super().__init__()
         self.start = start
         self.end = end
         self.leader_length = leader_length
 
+    def bbox(self):
+        return points_bbox((self.start, self.end))
+
+    def move(self, x, y):
+        self.start = moved(self.start, x, y)
+        self.end = moved(self.end, x, y)
+        self.touch()
+
+    # dim type(70), value is magic number, according dxf spec.
+    template = Template([
+        (0, 'DIMENSION'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbDimension'), (67, ...), (3, ...),
+        (10, ...), (20, ...), (30, 0),
+        (70, 35), (100, 'AcDbDiametricDimension'),
+    ])
+    point_template = Template([(15, ...), (25, ...), (35, 0)])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'DIMENSION')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbDimension')
-        code.append(67, self.space_status)
-        code.append(3, self.dimstyle.name)
-        code.append([10, 20, 30], [self.end[0], self.end[1], 0])
-        # dim type, value is magic number, according dxf spec.
-        code.append(70, 35)
-        code.append(100, 'AcDbDiametricDimension')
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.dimstyle.name,
+                           self.end[0], self.end[1])
         if self.leader_length is not None:
             code.append(40, self.leader_length)
-        code.append([15, 25, 35], [self.start[0], self.start[1], 0])
-
+        self.point_template.fill(code, self.start[0], self.start[1])
         return code
 
 
 class LineAngularDimension(_DimBase):
+    __slots__ = ('pt_line', 'pt_1_start', 'pt_1_end', 'pt_2_start', 'pt_2_end')
+
     def __init__(self, pt_line, pt_1_start, pt_1_end, pt_2_start, pt_2_end):
         super().__init__()
         self.pt_line = pt_line
@@ -828,30 +1922,47 @@ class LineAngularDimension(_DimBase):
         self.pt_2_start = pt_2_start
         self.pt_2_end = pt_2_end
 
+    def bbox(self):
+        return points_bbox((self.pt_line, self.pt_1_start, self.pt_1_end,
+                            self.pt_2_start, self.pt_2_end))
+
+    def move(self, x, y):
+        self.pt_line = moved(self.pt_line, x, y)
+        self.pt_1_start = moved(self.pt_1_start, x, y)
+        self.pt_1_end = moved(self.pt_1_end, x, y)
+        self.pt_2_start = moved(self.pt_2_start, x, y)
+        self.pt_2_end = moved(self.pt_2_end, x, y)
+        self.touch()
+
+    # dim type(70), value is magic number, according dxf spec.
+    template = Template([
+        (0, 'DIMENSION'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbDimension'), (67, ...), (3, ...),
+        (70, 34),
+        (10, ...), (20, ...), (30, 0),
+        (100, 'AcDb2LineAngularDimension'),
+        (13, ...), (23, ...), (33, 0),
+        (14, ...), (24, ...), (34, 0),
+        (15, ...), (25, ...), (35, 0),
+        (16, ...), (26, ...), (36, 0),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'DIMENSION')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbDimension')
-        code.append(67, self.space_status)
-        code.append(3, self.dimstyle.name)
-        # dim type, value is magic number, according dxf spec.
-        code.append(70, 34)
-        code.append([10, 20, 30], [self.pt_2_start[0], self.pt_2_start[1], 0])
-        code.append(100, 'AcDb2LineAngularDimension')
-        code.append([13, 23, 33], [self.pt_1_end[0], self.pt_1_end[1], 0])
-        code.append([14, 24, 34], [self.pt_1_start[0], self.pt_1_start[1], 0])
-        code.append([15, 25, 35], [self.pt_2_end[0], self.pt_2_end[1], 0])
-        code.append([16, 26, 36], [self.pt_line[0], self.pt_line[1], 0])
-
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.dimstyle.name,
+                           self.pt_2_start[0], self.pt_2_start[1],
+                           self.pt_1_end[0], self.pt_1_end[1],
+                           self.pt_1_start[0], self.pt_1_start[1],
+                           self.pt_2_end[0], self.pt_2_end[1],
+                           self.pt_line[0], self.pt_line[1])
         return code
 
 
 class PointAngularDimension(_DimBase):
+    __slots__ = ('pt_line', 'pt_center', 'pt_1', 'pt_2')
+
     def __init__(self, pt_line, pt_center, pt_1, pt_2):
         super().__init__()
         self.pt_line = pt_line
@@ -859,56 +1970,78 @@ class PointAngularDimension(_DimBase):
         self.pt_1 = pt_1
         self.pt_2 = pt_2
 
+    def bbox(self):
+        return points_bbox((self.pt_line, self.pt_center, self.pt_1, self.pt_2))
+
+    def move(self, x, y):
+        self.pt_line = moved(self.pt_line, x, y)
+        self.pt_center = moved(self.pt_center, x, y)
+        self.pt_1 = moved(self.pt_1, x, y)
+        self.pt_2 = moved(self.pt_2, x, y)
+        self.touch()
+
+    # dim type(70), value is magic number, according dxf spec.
+    template = Template([
+        (0, 'DIMENSION'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbDimension'),
+        (70, 37), (67, ...), (3, ...),
+        (10, ...), (20, ...), (30, 0),
+        (100, 'AcDb3PointAngularDimension'),
+        (13, ...), (23, ...), (33, 0),
+        (14, ...), (24, ...), (34, 0),
+        (15, ...), (25, ...), (35, 0),
+    ])
+
     def to_code(self):
         code = GroupCode()
-        code.append(0, 'DIMENSION')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbDimension')
-        # dim type, value is magic number, according dxf spec.
-        code.append(70, 37)
-        code.append(67, self.space_status)
-        code.append(3, self.dimstyle.name)
-        code.append([10, 20, 30], [self.pt_line[0], self.pt_line[1], 0])
-        code.append(100, 'AcDb3PointAngularDimension')
-        code.append([13, 23, 33], [self.pt_1[0], self.pt_1[1], 0])
-        code.append([14, 24, 34], [self.pt_2[0], self.pt_2[1], 0])
-        code.append([15, 25, 35], [self.pt_center[0], self.pt_center[1], 0])
-
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.dimstyle.name,
+                           self.pt_line[0], self.pt_line[1],
+                           self.pt_1[0], self.pt_1[1],
+                           self.pt_2[0], self.pt_2[1],
+                           self.pt_center[0], self.pt_center[1])
         return code
 
 
 class RadialDimension(_DimBase):
+    __slots__ = ('center', 'start', 'leader')
+
     def __init__(self, center, start, leader):
         super().__init__()
         self.center = center
         self.start = start
         self.leader = leader
 
+    def bbox(self):
+        return points_bbox((self.center, self.start))
+
+    def move(self, x, y):
+        self.center = moved(self.center, x, y)
+        self.start = moved(self.start, x, y)
+        self.touch()
+
+    # dim type(70), value is magic number, according dxf spec.
+    template = Template([
+        (0, 'DIMENSION'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbDimension'), (67, ...), (3, ...),
+        (10, ...), (20, ...), (30, 0),
+        (70, 36), (100, 'AcDbRadialDimension'), (40, ...),
+        (15, ...), (25, ...), (35, 0),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'DIMENSION')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbDimension')
-        code.append(67, self.space_status)
-        code.append(3, self.dimstyle.name)
-        code.append([10, 20, 30], [self.center[0], self.center[1], 0])
-        # dim type, value is magic number, according dxf spec.
-        code.append(70, 36)
-        code.append(100, 'AcDbRadialDimension')
-        code.append(40, self.leader)
-        code.append([15, 25, 35], [self.start[0], self.start[1], 0])
-
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.dimstyle.name,
+                           self.center[0], self.center[1], self.leader,
+                           self.start[0], self.start[1])
         return code
 
 
 class RotatedDimension(_DimBase):
+    __slots__ = ('start', 'end', 'text_insert', 'rotate_angle')
+
     def __init__(self, start, end, text_insert, rotate_angle):
         super().__init__()
         self.start = start
@@ -916,26 +2049,33 @@ class RotatedDimension(_DimBase):
         self.text_insert = text_insert
         self.rotate_angle = rotate_angle
 
+    def bbox(self):
+        return points_bbox((self.start, self.end, self.text_insert))
+
+    def move(self, x, y):
+        self.start = moved(self.start, x, y)
+        self.end = moved(self.end, x, y)
+        self.text_insert = moved(self.text_insert, x, y)
+        self.touch()
+
+    # dim type(70), value is magic number, according dxf spec.
+    template = Template([
+        (0, 'DIMENSION'), (5, ...), (8, ...), (330, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbDimension'), (67, ...), (3, ...),
+        (10, ...), (20, ...), (30, 0),
+        (70, 32), (100, 'AcDbAlignedDimension'), (50, ...),
+        (13, ...), (23, ...), (33, 0),
+        (14, ...), (24, ...), (34, 0),
+        (100, 'AcDbRotatedDimension'),
+    ])
+
     def to_code(self):
         self.check_before_build()
         code = GroupCode()
-        code.append(0, 'DIMENSION')
-        code.append(5, self.handle)
-        code.append(8, self.layer.name)
-        code.append(330, self.owner_handle)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbDimension')
-        code.append(67, self.space_status)
-        code.append(3, self.dimstyle.name)
-        code.append([10, 20, 30], [self.text_insert[0], self.text_insert[1], 0])
-        # dim type, value is magic number, according dxf spec.
-        code.append(70, 32)
-        code.append(100, 'AcDbAlignedDimension')
-        code.append(50, self.rotate_angle)
-        code.append([13, 23, 33], [self.start[0], self.start[1], 0])
-        code.append([14, 24, 34], [self.end[0], self.end[1], 0])
-        code.append(100, 'AcDbRotatedDimension')
-
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.dimstyle.name,
+                           self.text_insert[0], self.text_insert[1], self.rotate_angle,
+                           self.start[0], self.start[1], self.end[0], self.end[1])
         return code
 
 
@@ -943,7 +2083,85 @@ class RotatedDimension(_DimBase):
 # ------------------------------------------------
 
 
+def pattern_codes(lines, angle=0, scale=1):
+    """Codes and values of the compiled pattern lines of a hatch.
+
+    The pattern is turned by angle about the origin and scaled: each
+    line's angle, origin, offset (relative to the line) and dashes.
+    """
+    heads, counts, dashes = lines
+    radians = math.radians(angle)
+    cos, sin = math.cos(radians), math.sin(radians)
+    rows = list()
+    for i in range(0, len(heads), 5):
+        line_angle, x, y, dx, dy = heads[i:i + 5]
+        line_angle += angle
+        line_radians = math.radians(line_angle)
+        line_cos, line_sin = math.cos(line_radians), math.sin(line_radians)
+        rows.append([line_angle,
+                     (x * cos - y * sin) * scale, (y * cos + x * sin) * scale,
+                     (dx * line_cos - dy * line_sin) * scale,
+                     (dy * line_cos + dx * line_sin) * scale])
+    dashes = [dash * scale for dash in dashes]
+
+    codes, values = list(), list()
+    start = 0
+    for row, count in zip(rows, counts):
+        codes += _pattern_line_codes
+        codes += [40] * count
+        values += row
+        values.append(count)
+        values += dashes[start:start + count]
+        start += count
+    return codes, values
+
+
+_pattern_line_codes = [53, 43, 44, 45, 46, 79]
+
+
+class PatternCache:
+    """The pattern lines of hatches as GroupCodes, by (name, angle, scale).
+
+    An entry is made once and holds while the lines asked for equal the
+    ones it was made from, so a pattern loaded elsewhere under the same
+    name is not mistaken for it.  Past maxsize entries, the least
+    recently used goes.  The GroupCodes are shared: extend from them.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name, lines, angle=0, scale=1):
+        key = name, angle, scale
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[0] is lines or entry[0] == lines):
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        code = GroupCode()
+        code.append(78, len(lines[1]))
+        code.append(*pattern_codes(lines, angle, scale))
+        with self.lock:
+            self.entries[key] = lines, code
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return code
+
+
+pattern_cache = PatternCache()
+
+
 class Hatch(Entity):
+    __slots__ = ('pattern_data', 'point_list', 'bulge_list', 'rotate_angle', 'scale',
+                 'fill_type')
+
     def __init__(self, pattern_data,
                  point_list, bulge_list=None,
                  rotate_angle=0, scale=1, fill_type=0):
@@ -959,6 +2177,13 @@ class Hatch(Entity):
         self.scale = scale
         self.fill_type = fill_type
 
+    def bbox(self):
+        return bulge_bbox(self.point_list, self.bulge_list)
+
+    def move(self, x, y):
+        self.point_list = [moved(pt, x, y) for pt in self.point_list]
+        self.touch()
+
     def to_code(self):
         self.check_before_build()
         name = self.pattern_data['name']
@@ -996,28 +2221,8 @@ class Hatch(Entity):
         code.append(41, self.scale)
         code.append(77, 0)
 
-        code.append(78, len(data))
-
-        for row in data:
-            head = row[:5]
-            tail = row[5:]
-
-            head[0] = head[0] + angle
-
-            x, y = head[1], head[2]
-            radians = math.radians(angle)
-            head[1] = (x * math.cos(radians) - y * math.sin(radians)) * scale
-            head[2] = (y * math.cos(radians) + x * math.sin(radians)) * scale
-
-            del_x, del_y = head[3], head[4]
-            radians = math.radians(head[0])
-            head[3] = (del_x * math.cos(radians) - del_y * math.sin(radians)) * scale
-            head[4] = (del_y * math.cos(radians) + del_x * math.sin(radians)) * scale
-
-            code.append([53, 43, 44, 45, 46], head)
-            code.append(79, len(tail))
-            for item in tail:
-                code.append(40, scale*float(item))
+        lines = self.pattern_data.get('lines') or compile_pattern(data)
+        code.extend(pattern_cache.get(name, lines, angle, scale))
 
         code.append(47, 1)
         code.append(98, 1)
@@ -1027,11 +2232,20 @@ class Hatch(Entity):
 
 
 class Wipeout(Entity):
+    __slots__ = ('point_list',)
+
     def __init__(self, point_list):
         super().__init__()
         assert point_list[0] == point_list[-1]
         self.point_list = point_list
 
+    def bbox(self):
+        return points_bbox(self.point_list)
+
+    def move(self, x, y):
+        self.point_list = [moved(pt, x, y) for pt in self.point_list]
+        self.touch()
+
     def _process_points(self):
         points = self.point_list
         left, bottom = points[0][0], points[0][1]
@@ -1096,36 +2310,139 @@ class Wipeout(Entity):
 
 
 class Insert(Entity):
+    """A reference to a block, given as the Block or by name.
+
+    Given the Block itself, the bounding box is that of the block's
+    entities as placed; by name it is the insertion point.
+    """
+    __slots__ = ('pt_insert', 'block_name', 'scale_x', 'scale_y', 'rotate_angle', 'block')
+
     def __init__(self, pt_insert, block_name,
                  scale_x=1, scale_y=1, rotate_angle=0):
         super().__init__()
         self.pt_insert = pt_insert
-        self.block_name = block_name
         self.scale_x = scale_x
         self.scale_y = scale_y
         self.rotate_angle = rotate_angle
+        if isinstance(block_name, Block):
+            self.set_block(block_name)
+        else:
+            self.block_name = block_name
+            self.block = None
+
+    def set_block(self, block):
+        self.block = block
+        self.block_name = block.name
+        self.touch()
+
+    def _slot_state(self):
+        return {name: getattr(self, name) for cls in type(self).__mro__
+                for name in getattr(cls, '__slots__', ()) if hasattr(self, name)}
+
+    def __getstate__(self):
+        # the Block holds locks, which cannot go to the encoding processes,
+        # and they write the block_name only
+        state = self._slot_state()
+        state['block'] = None
+        return None, state
+
+    def __copy__(self):
+        clone = object.__new__(type(self))
+        for name, value in self._slot_state().items():
+            object.__setattr__(clone, name, value)
+        return clone
+
+    def block_bbox(self):
+        """Bounds of the scaled block about the insertion point, unrotated, or None."""
+        extents = None if self.block is None else self.block.extents()
+        if extents is None:
+            return None
+        base_x, base_y = self.block.pt_base[0], self.block.pt_base[1]
+        corners = [((u - base_x) * self.scale_x, (v - base_y) * self.scale_y)
+                   for u in extents[0::2] for v in extents[1::2]]
+        return points_bbox(corners)
+
+    def bbox(self):
+        x, y = self.pt_insert[0], self.pt_insert[1]
+        box = self.block_bbox()
+        if box is None:
+            return x, y, x, y
+        return rect_bbox(x, y, *box, self.rotate_angle)
+
+    def move(self, x, y):
+        self.pt_insert = moved(self.pt_insert, x, y)
+        self.touch()
+
+    template = Template([
+        (0, 'INSERT'), (5, ...), (8, ...), (330, ...), (67, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbBlockReference'), (2, ...),
+        (10, ...), (20, ...), (30, 0),
+        (41, ...), (42, ...), (43, 1), (50, ...),
+    ])
 
-    def gen_code(self):
+    def to_code(self):
+        self.check_before_build()
         code = GroupCode()
-        code.append(0, 'INSERT')
-        code.append(5, self.handle)
-        code.append(330, self.owner_handle)
-        code.append(67, self.space_status)
-        code.append(100, 'AcDbEntity')
-        code.append(100, 'AcDbBlockReference')
-        code.append([10, 20, 30], [self.pt_insert[0], self.pt_insert[1], 0])
-        code.append(2, self.block_name)
-        code.append([41, 42, 43], [self.scale_x, self.scale_y, 1])
-        code.append(50, self.rotate_angle)
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.block_name,
+                           self.pt_insert[0], self.pt_insert[1],
+                           self.scale_x, self.scale_y, self.rotate_angle)
+        return code
+
+
+class MInsert(Insert):
+    """A rectangular array of a block, MINSERT in AutoCAD.
+
+    Copy (i, j) of columns by rows is offset i * column_spacing along the
+    rotated x axis and j * row_spacing along the rotated y axis, and
+    written as a single record.
+    """
+    __slots__ = ('columns', 'rows', 'column_spacing', 'row_spacing')
+
+    def __init__(self, pt_insert, block_name, columns, rows,
+                 column_spacing=0, row_spacing=0,
+                 scale_x=1, scale_y=1, rotate_angle=0):
+        super().__init__(pt_insert, block_name, scale_x, scale_y, rotate_angle)
+        self.columns = columns
+        self.rows = rows
+        self.column_spacing = column_spacing
+        self.row_spacing = row_spacing
+
+    def bbox(self):
+        x, y = self.pt_insert[0], self.pt_insert[1]
+        box = self.block_bbox() or (0, 0, 0, 0)
+        width = (self.columns - 1) * self.column_spacing
+        height = (self.rows - 1) * self.row_spacing
+        return rect_bbox(x, y, box[0] + min(width, 0), box[1] + min(height, 0),
+                         box[2] + max(width, 0), box[3] + max(height, 0), self.rotate_angle)
+
+    template = Template([
+        (0, 'INSERT'), (5, ...), (8, ...), (330, ...), (67, ...),
+        (100, 'AcDbEntity'), (100, 'AcDbMInsertBlock'), (2, ...),
+        (10, ...), (20, ...), (30, 0),
+        (41, ...), (42, ...), (43, 1), (50, ...),
+        (70, ...), (71, ...), (44, ...), (45, ...),
+    ])
 
+    def to_code(self):
+        self.check_before_build()
+        code = GroupCode()
+        self.template.fill(code, self.handle, self.layer.name, self.owner_handle,
+                           self.space_status, self.block_name,
+                           self.pt_insert[0], self.pt_insert[1],
+                           self.scale_x, self.scale_y, self.rotate_angle,
+                           self.columns, self.rows, self.column_spacing, self.row_spacing)
         return code
-    
+
 
 # No drawing object
 # -------------------------------------------------
 
 
 class Viewport(Entity):
+    __slots__ = ('pt_model_center', 'pt_doc_center', 'doc_width', 'doc_height', 'port_id',
+                 'scale', 'angle')
+
     def __init__(self, pt_model_center,
                  pt_doc_center,
                  doc_width, doc_height,
@@ -1143,6 +2460,13 @@ class Viewport(Entity):
 
     def set_port_id(self, port_id):
         self.port_id = port_id
+        self.touch_code()
+
+    def bbox(self):
+        # on the sheet
+        return rect_bbox(self.pt_doc_center[0], self.pt_doc_center[1],
+                         -self.doc_width / 2, -self.doc_height / 2,
+                         self.doc_width / 2, self.doc_height / 2)
 
     def to_code(self):
         code = GroupCode()
@@ -1181,6 +2505,8 @@ class Viewport(Entity):
 
 
 class ObjectItem:
+    __slots__ = ('handle', 'owner_handle')
+
     def __init__(self):
         self.handle = None
         self.owner_handle = None
@@ -1193,6 +2519,8 @@ class ObjectItem:
 
 
 class Dictionary(ObjectItem):
+    __slots__ = ('handle_gen', 'name', 'dict_list')
+
     def __init__(self, handle_gen, name):
         super().__init__()
         self.handle_gen = handle_gen
@@ -1202,7 +2530,7 @@ class Dictionary(ObjectItem):
     def append(self, item):
         assert isinstance(item, ObjectItem)
         self.dict_list.append(item)
-        item.set_handle(self.handle_gen.get_hex())
+        item.set_handle(self.handle_gen.get())
         item.set_owner_handle(self.handle)
 
     def to_code(self):
@@ -1221,6 +2549,8 @@ class Dictionary(ObjectItem):
 
 
 class Layout(ObjectItem):
+    __slots__ = ('space_handle', 'name', 'pt_lb', 'pt_rt')
+
     def __init__(self, name, pt_lb, pt_rt):
         super().__init__()
         self.space_handle = None
@@ -1277,13 +2607,28 @@ class Layout(ObjectItem):
 # ------------------------------------------
 
 
-class Space:
+class Space(Staging):
+    """The entities of model or paper space.
+
+    query_bbox, query_point and nearest look the entities up by bounding
+    box in a spatial index (see pydraw.spatial).  The index is built on
+    the first query and kept up to date by append, and so are the
+    extents; after moving entities that are already in it, call reindex.  group marks entities for
+    DXF.dedupe.
+    """
+
     def __init__(self, handle_gen):
+        super().__init__()
         self.entity_list = list()
         self.handle_gen = handle_gen
         self.block = None
         self.block_record = None
         self.record_handle = None
+        self.grid = None
+        # xmin, ymin, xmax, ymax of the entities, grown by append; None
+        # after reindex, until extents computes it again
+        self.box = array('d', (math.inf, math.inf, -math.inf, -math.inf))
+        self.groups = list()
 
     def init_space_block(self, name):
         self.block = Block(self.handle_gen, name)
@@ -1291,10 +2636,99 @@ class Space:
         self.record_handle = self.block_record.handle
 
     def append(self, entity):
-        self.entity_list.append(entity)
-        entity.set_handle(self.handle_gen.get_hex())
+        box = entity.get_bbox()
+        with self.lock:
+            self.entity_list.append(entity)
+            if isinstance(entity, Batch):
+                entity.set_handle_range(self.handle_gen.reserve(len(entity)))
+            else:
+                entity.set_handle(self.handle_gen.get())
+            if self.grid is not None:
+                self.grid.insert(entity)
+            extent = self.box
+            if box is not None and extent is not None:
+                if box[0] < extent[0]:
+                    extent[0] = box[0]
+                if box[1] < extent[1]:
+                    extent[1] = box[1]
+                if box[2] > extent[2]:
+                    extent[2] = box[2]
+                if box[3] > extent[3]:
+                    extent[3] = box[3]
         entity.set_owner_handle(self.record_handle)
 
+    def extend(self, entities):
+        """Append entities, taking their handles as one range."""
+        entities = list(entities)
+        sizes = [len(entity) if isinstance(entity, Batch) else 1 for entity in entities]
+        boxes = [entity.get_bbox() for entity in entities]
+        with self.lock:
+            self.entity_list.extend(entities)
+            handle = self.handle_gen.reserve(sum(sizes))
+            if self.grid is not None:
+                self.grid.extend(entities)
+            if self.box is not None:
+                boxes = array('d', [value for box in boxes if box is not None for value in box])
+                if len(boxes):
+                    self.box = array('d', union_bbox(self.box + boxes))
+        owner_handle = self.record_handle
+        for entity, size in zip(entities, sizes):
+            if isinstance(entity, Batch):
+                entity.set_handle_range(handle)
+            else:
+                entity.set_handle(handle)
+            entity.set_owner_handle(owner_handle)
+            handle += size
+
+    def group(self, entities):
+        """Mark appended entities as a group that DXF.dedupe may hoist into a block."""
+        entities = list(entities)
+        with self.lock:
+            self.groups.append(entities)
+        return entities
+
+    def extents(self):
+        """(xmin, ymin, xmax, ymax) of the entities, None when none has an extent.
+
+        Kept up to date by append; after moving entities that are already
+        in the space, call reindex.
+        """
+        with self.lock:
+            if self.box is None:
+                box = entity_extents(self.entity_list)
+                self.box = array('d', (math.inf, math.inf, -math.inf, -math.inf)
+                                 if box is None else box)
+            box = self.box
+            return None if box[0] > box[2] else tuple(box)
+
+    def get_grid(self):
+        """The GridIndex of the entities, the staged ones merged first."""
+        self.merge()
+        with self.lock:
+            if self.grid is None:
+                # numpy is only needed once the space is queried
+                from .spatial import GridIndex
+                self.grid = GridIndex(self.entity_list)
+            return self.grid
+
+    def reindex(self):
+        """Drop the spatial index and the extents, to be made again from the entities."""
+        with self.lock:
+            self.grid = None
+            self.box = None
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """The entities whose bounding boxes meet the window."""
+        return self.get_grid().query_bbox(xmin, ymin, xmax, ymax)
+
+    def query_point(self, x, y, tolerance=0):
+        """The entities whose bounding boxes are within tolerance of (x, y)."""
+        return self.get_grid().query_point(x, y, tolerance)
+
+    def nearest(self, x, y, count=1):
+        """The count entities whose bounding boxes are closest to (x, y)."""
+        return self.get_grid().nearest(x, y, count)
+
 
 class ModelSpace(Space):
     def __init__(self, handle_gen):
@@ -1306,6 +2740,11 @@ class ModelSpace(Space):
         assert not isinstance(entity, Viewport)
         super().append(entity)
 
+    def extend(self, entities):
+        entities = list(entities)
+        assert not any(isinstance(entity, Viewport) for entity in entities)
+        super().extend(entities)
+
 
 class PaperSpace(Space):
     index = 0
@@ -1330,10 +2769,33 @@ class PaperSpace(Space):
         if isinstance(entity, Viewport):
             entity.set_port_id(self.viewport_id_gen.get_dec())
 
+    def extend(self, entities):
+        for entity in entities:
+            self.append(entity)
+
 
 class DXF:
-    def __init__(self):
-        self.handle_gen = Handle()
+    """A drawing document.
+
+    With cache_codes, every entity keeps its serialized record between
+    saves, so saving again after an edit only serializes what changed.
+    precision is the number of decimals floats are written with in text
+    output, trailing zeros stripped; None writes them in full.
+
+    The tables are serialized once and written again as long as their
+    records stay the same.  A document made with a template starts with
+    the template's application id, dimension styles, layers, linetypes
+    and text styles, copies of the records, and with its serialized
+    tables until they change here.
+    """
+    tables = ('APPID', 'BLOCK_RECORD', 'DIMSTYLE', 'LAYER', 'LTYPE', 'STYLE',
+              'UCS', 'VIEW', 'VPORT')
+
+    def __init__(self, cache_codes=False, precision=None, template=None):
+        self.cache_codes = cache_codes
+        self.precision = precision
+        # handles below the template's seed are taken by its tables
+        self.handle_gen = Handle(1 if template is None else template.handle_gen.seed())
         self.ltype_resource = LTypeResource()
         self.pattern_resource = PatternResource()
 
@@ -1342,15 +2804,24 @@ class DXF:
         # classes
         self.class_list = list()
         # tables
-        self.appid = AppID('ACAD')
-        self.appid.set_handle(self.handle_gen.get_hex())
         self.block_record_list = list()
         self.dimstyle = HandleContainer(self.handle_gen)
         self.layer = HandleContainer(self.handle_gen)
-        self.ltype = HandleContainer(self.handle_gen)
         self.style = HandleContainer(self.handle_gen)
+        self.ltype = LTypeContainer(self.handle_gen, self.style)
+        if template is None:
+            self.appid = AppID('ACAD')
+            self.appid.set_handle(self.handle_gen.get())
+            self.table_handle = {name: self.get_handle() for name in self.tables}
+            self.table_cache = dict()
+        else:
+            self.table_handle = template.table_handle
+            self.copy_tables(template)
+            self.table_cache = dict(template.table_cache)
+        self.tables_encoded = None
         # blocks
         self.block_list = list()
+        self.block_index = 0
         # entities
         self.model_space = ModelSpace(self.handle_gen)
         self.paper_space = PaperSpace(self.handle_gen)
@@ -1359,14 +2830,42 @@ class DXF:
         # init
         self.init_header()
         self.init_classes()
-        self.init_tables()
+        self.init_tables(template is None)
         self.init_blocks()
         self.init_objects()
 
+    def copy_tables(self, template):
+        """Copy the records of template, referring to each other's copies.
+
+        The copies keep the records' codes, so the template's tables stay
+        valid here until a copy changes.
+        """
+        self.appid = template.appid.copy()
+        for name in ('dimstyle', 'layer', 'ltype', 'style'):
+            container = getattr(self, name)
+            for key, record in getattr(template, name).ordered_dict.items():
+                container.ordered_dict[key] = record.copy()
+        styles = {id(old): new for old, new in zip(template.style, self.style)}
+        ltypes = {id(old): new for old, new in zip(template.ltype, self.ltype)}
+        for dimstyle in self.dimstyle:
+            object.__setattr__(dimstyle, 'text_style',
+                               styles.get(id(dimstyle.text_style), dimstyle.text_style))
+        for layer in self.layer:
+            object.__setattr__(layer, 'ltype', ltypes.get(id(layer.ltype), layer.ltype))
+        for ltype in self.ltype:
+            if ltype.styles is not None:
+                object.__setattr__(ltype, 'styles', {name: styles.get(id(style), style)
+                                                     for name, style in ltype.styles.items()})
+
     def init_header(self):
         var = self.variable_list
         var.append(Variable('ACADVER', 1, 'AC1021'))
-        var.append(Variable('HANDSEED', 5, self.handle_gen.get_max()))
+        self.handseed = Variable('HANDSEED', 5, self.handle_gen.seed())
+        var.append(self.handseed)
+        self.extents = dict()
+        for name in ('EXTMIN', 'EXTMAX', 'PEXTMIN', 'PEXTMAX'):
+            self.extents[name] = Variable(name, [10, 20, 30], None)
+            var.append(self.extents[name])
 
     def init_classes(self):
         cls = self.class_list
@@ -1374,9 +2873,11 @@ class DXF:
                          r"WipeOut|Product Desc:     WipeOut Dbx Application|Company:          Autodesk, Inc.|WEB Address:      www.autodesk.com",
                          0, 1, 0, 0))
 
-    def init_tables(self):
+    def init_tables(self, standard=True):
         self.block_record_list.append(self.model_space.block_record)
         self.block_record_list.append(self.paper_space.block_record)
+        if not standard:
+            return
 
         self.ltype.append(LType('CONTINUOUS'))
         self.ltype.append(LType('ByBlock'))
@@ -1409,16 +2910,156 @@ class DXF:
 
     def build(self):
         code = GroupCode()
-        code.extend(self.build_header())
-        code.extend(self.build_classes())
-        code.extend(self.build_tables())
-        code.extend(self.build_blocks())
-        code.extend(self.build_entities())
-        code.extend(self.build_objects())
-        code.append(0, 'EOF')
+        for part in self.iter_build():
+            code.extend(part)
+        code.precision = self.precision
         return code
 
+    def iter_build(self):
+        """Yield the document as a sequence of small GroupCode chunks.
+
+        Blocks and entities are produced one record at a time, so a writer
+        consuming this generator never holds more than one record's codes.
+        """
+        yield from self.iter_head()
+        yield from self.iter_entities()
+        yield from self.iter_tail()
+
+    def new_block(self, name=None, layer=None, pt_base=(0, 0)):
+        """A block added to the document, by default named BLOCK<n>."""
+        names = {block.name for block in self.block_list}
+        if name is None:
+            while f'BLOCK{self.block_index}' in names:
+                self.block_index += 1
+            name = f'BLOCK{self.block_index}'
+            self.block_index += 1
+        assert name not in names
+        block = Block(self.handle_gen, name, layer, pt_base)
+        self.block_list.append(block)
+        self.block_record_list.append(block.block_record)
+        return block
+
+    def add_ltype(self, name):
+        """The linetype name of ltype_resource, added with the styles it uses."""
+        if name in self.ltype.ordered_dict:
+            return self.ltype[name]
+        ltype = LType(name, self.ltype_resource.get_data(name))
+        self.ltype.append(ltype)
+        return ltype
+
+    def get_block(self, name):
+        """The block named name, None when there is none."""
+        for block in self.block_list:
+            if block.name == name:
+                return block
+        return None
+
+    def dedupe(self, min_count=2, min_size=2, precision=6, auto=True):
+        """Hoist repeated groups of entities into blocks, see pydraw.dedupe."""
+        from .dedupe import dedupe
+        return dedupe(self, min_count, min_size, precision, auto)
+
+    def merge(self):
+        """Give the staged entities of the spaces and blocks their handles."""
+        self.model_space.merge()
+        self.paper_space.merge()
+        for block in self.block_list:
+            block.merge()
+
+    def iter_head(self):
+        self.merge()
+        yield self.build_header()
+        yield self.build_classes()
+        yield self.build_tables()
+        yield from self.iter_blocks()
+
+    def iter_tail(self):
+        yield self.build_objects()
+        code = GroupCode()
+        code.append(0, 'EOF')
+        yield code
+
+    def iter_records(self, binary=False, encoding='utf-8', workers=None):
+        """Yield the document as encoded records, str or bytes when binary.
+
+        With workers > 1 the entities are encoded in a process pool, a
+        chunk of them per record; the output is the same either way.  The
+        pool does not use or fill the cache_codes records, and only pays
+        off with cores to spare: on fewer cores than workers it is slower
+        than encoding in this process.
+        """
+        precision = self.precision
+        if binary:
+            def encode(codes):
+                for code in codes:
+                    yield code.to_bytes(encoding)
+        else:
+            def encode(codes):
+                return GroupCode.iter_text(codes, precision)
+
+        self.merge()
+        yield from encode([self.build_header(), self.build_classes()])
+        yield self.encode_tables(binary, encoding, precision)
+        yield from encode(self.iter_blocks())
+        if workers is not None and workers > 1:
+            yield from encode([self.begin_section('ENTITIES')])
+            yield from self.encode_entities(workers, binary, encoding)
+            yield from encode([self.end_section()])
+        elif self.cache_codes:
+            yield from encode([self.begin_section('ENTITIES')])
+            for entity in chain(self.model_space.entity_list, self.paper_space.entity_list):
+                data = entity.encode(binary, encoding, precision)
+                # an empty batch has no records
+                if data:
+                    yield data
+            yield from encode([self.end_section()])
+        else:
+            yield from encode(self.iter_entities())
+        yield from encode(self.iter_tail())
+
+    def encode_entities(self, workers, binary=False, encoding='utf-8', chunk_size=2048):
+        """Yield the entities encoded in a pool of workers processes, chunk by chunk.
+
+        Where processes start by fork, the workers inherit the entity list
+        and are sent index ranges only; elsewhere every chunk of entities
+        is pickled to its worker, which costs about as much as encoding it.
+        """
+        entity_list = self.model_space.entity_list + self.paper_space.entity_list
+        ranges = [(i, min(i + chunk_size, len(entity_list)))
+                  for i in range(0, len(entity_list), chunk_size)]
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        forked = multiprocessing.get_start_method() == 'fork'
+        key = id(entity_list)
+        if forked:
+            # the pool forks on the first submit, after this
+            _forked_entities[key] = entity_list
+        pending = deque()
+        try:
+            with ProcessPoolExecutor(workers) as executor:
+                # a few chunks per worker in flight keeps memory bounded
+                for start, stop in ranges:
+                    if forked:
+                        future = executor.submit(_encode_forked_entities, key, start, stop,
+                                                 binary, encoding, self.precision)
+                    else:
+                        future = executor.submit(_encode_entities, entity_list[start:stop],
+                                                 binary, encoding, self.precision)
+                    pending.append(future)
+                    if len(pending) >= 2 * workers:
+                        data = pending.popleft().result()
+                        if data:
+                            yield data
+                while pending:
+                    data = pending.popleft().result()
+                    if data:
+                        yield data
+        finally:
+            _forked_entities.pop(key, None)
+
     def build_header(self):
+        self.handseed.values = self.handle_gen.seed()
+        self.update_extents()
         code = GroupCode()
         code.append(0, 'SECTION')
         code.append(2, 'HEADER')
@@ -1427,6 +3068,18 @@ class DXF:
         code.append(0, 'ENDSEC')
         return code
 
+    def update_extents(self):
+        """Set EXTMIN/EXTMAX and PEXTMIN/PEXTMAX from the spaces' entities.
+
+        An empty space gets the 1e20, -1e20 pair CAD writes for no extents.
+        """
+        for prefix, space in (('', self.model_space), ('P', self.paper_space)):
+            box = space.extents()
+            if box is None:
+                box = 1e20, 1e20, -1e20, -1e20
+            self.extents[prefix + 'EXTMIN'].values = [box[0], box[1], 0]
+            self.extents[prefix + 'EXTMAX'].values = [box[2], box[3], 0]
+
     def build_classes(self):
         code = GroupCode()
         code.append(0, 'SECTION')
@@ -1440,174 +3093,206 @@ class DXF:
         code = GroupCode()
         code.append(0, 'SECTION')
         code.append(2, 'TABLES')
-        code.extend(self.build_appid_table())
-        code.extend(self.build_block_table())
-        code.extend(self.build_dimstyle_table())
-        code.extend(self.build_layer_table())
-        code.extend(self.build_ltype_table())
-        code.extend(self.build_style_table())
-        code.extend(self.build_ucs_table())
-        code.extend(self.build_view_table())
-        code.extend(self.build_vport_table())
+        for name in self.tables:
+            code.extend(self.get_table(name).code)
         code.append(0, 'ENDSEC')
         return code
 
-    def build_blocks(self):
-        code = GroupCode()
-        code.append(0, 'SECTION')
-        code.append(2, 'BLOCKS')
-        for block in self.block_list:
-            code.extend(block.to_code())
-        code.append(0, 'ENDSEC')
-        return code
-
-    def build_entities(self):
-        code = GroupCode()
-        code.append(0, 'SECTION')
-        code.append(2, 'ENTITIES')
-        for entity in self.model_space.entity_list:
-            code.extend(entity.to_code())
-        for entity in self.paper_space.entity_list:
-            code.extend(entity.to_code())
-        code.append(0, 'ENDSEC')
-        return code
-
-    def build_objects(self):
-        code = GroupCode()
-        code.append(0, 'SECTION')
-        code.append(2, 'OBJECTS')
-        for obj in self.object_list:
-            code.extend(obj.to_code())
-        code.append(0, 'ENDSEC')
-        return code
+    def encode_tables(self, binary=False, encoding='utf-8', precision=None):
+        """The TABLES section encoded, reused while no table has changed."""
+        tables = [self.get_table(name) for name in self.tables]
+        key = binary, encoding, precision
+        cached = self.tables_encoded
+        if (cached is None or cached[0] != key
+                or not all(a is b for a, b in zip(tables, cached[1]))):
+            parts = [table.encode(binary, encoding, precision) for table in tables]
+            begin, end = self.begin_section('TABLES'), self.end_section()
+            if binary:
+                data = b''.join([begin.to_bytes(encoding), *parts, end.to_bytes(encoding)])
+            else:
+                data = '\n'.join([begin.to_string(precision), *parts, end.to_string(precision)])
+            cached = self.tables_encoded = key, tables, data
+        return cached[2]
+
+    def table_records(self, name):
+        if name == 'APPID':
+            return [self.appid]
+        if name == 'BLOCK_RECORD':
+            return self.block_record_list
+        container = {'DIMSTYLE': self.dimstyle, 'LAYER': self.layer,
+                     'LTYPE': self.ltype, 'STYLE': self.style}.get(name)
+        return [] if container is None else list(container)
+
+    def get_table(self, name):
+        """The Table of name, serialized again only when its records changed."""
+        record_codes = [record.get_code() for record in self.table_records(name)]
+        table = self.table_cache.get(name)
+        if table is None or not table.matches(record_codes):
+            code = GroupCode()
+            code.append(0, 'TABLE')
+            code.append(2, name)
+            code.append(5, self.table_handle[name])
+            code.append(100, 'AcDbSymbolTable')
+            code.append(70, 0)
+            if name == 'DIMSTYLE':
+                code.append(100, 'AcDbDimStyleTable')
+                code.append(71, 1)
+            for record_code in record_codes:
+                code.extend(record_code)
+            code.append(0, 'ENDTAB')
+            table = self.table_cache[name] = Table(record_codes, code)
+        return table
 
     def build_appid_table(self):
-        code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'APPID')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
+        return self.get_table('APPID').code
 
-        code.extend(self.appid.to_code())
-
-        code.append(0, 'ENDTAB')
+    def build_block_table(self):
+        return self.get_table('BLOCK_RECORD').code
 
-        return code
+    def build_dimstyle_table(self):
+        return self.get_table('DIMSTYLE').code
 
-    def build_block_table(self):
-        code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'BLOCK_RECORD')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
+    def build_layer_table(self):
+        return self.get_table('LAYER').code
 
-        for block in self.block_record_list:
-            code.extend(block.to_code())
+    def build_ltype_table(self):
+        return self.get_table('LTYPE').code
 
-        code.append(0, 'ENDTAB')
+    def build_style_table(self):
+        return self.get_table('STYLE').code
 
-        return code
+    def build_ucs_table(self):
+        return self.get_table('UCS').code
 
-    def build_dimstyle_table(self):
-        code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'DIMSTYLE')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
-        code.append(100, 'AcDbDimStyleTable')
-        code.append(71, 1)
+    def build_view_table(self):
+        return self.get_table('VIEW').code
 
-        for dim in self.dimstyle:
-            code.extend(dim.to_code())
+    def build_vport_table(self):
+        return self.get_table('VPORT').code
 
-        code.append(0, 'ENDTAB')
+    def build_blocks(self):
+        code = GroupCode()
+        for part in self.iter_blocks():
+            code.extend(part)
         return code
 
-    def build_layer_table(self):
+    def iter_blocks(self):
         code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'LAYER')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
-
-        for layer in self.layer:
-            code.extend(layer.to_code())
-
-        code.append(0, 'ENDTAB')
-        return code
+        code.append(0, 'SECTION')
+        code.append(2, 'BLOCKS')
+        yield code
+        for block in self.block_list:
+            yield from block.iter_code(self.cache_codes)
+        code = GroupCode()
+        code.append(0, 'ENDSEC')
+        yield code
 
-    def build_ltype_table(self):
+    def build_entities(self):
         code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'LTYPE')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
+        for part in self.iter_entities():
+            code.extend(part)
+        return code
 
-        for ltype in self.ltype:
-            code.extend(ltype.to_code())
+    def iter_entities(self):
+        yield self.begin_section('ENTITIES')
+        yield from iter_entity_codes(self.model_space.entity_list, self.cache_codes)
+        yield from iter_entity_codes(self.paper_space.entity_list, self.cache_codes)
+        yield self.end_section()
 
-        code.append(0, 'ENDTAB')
+    @staticmethod
+    def begin_section(name):
+        code = GroupCode()
+        code.append(0, 'SECTION')
+        code.append(2, name)
         return code
 
-    def build_style_table(self):
+    @staticmethod
+    def end_section():
         code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'STYLE')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
-
-        for style in self.style:
-            code.extend(style.to_code())
-
-        code.append(0, 'ENDTAB')
+        code.append(0, 'ENDSEC')
         return code
 
-    def build_ucs_table(self):
+    def build_objects(self):
         code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'UCS')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
-
-        code.append(0, 'ENDTAB')
-
+        code.append(0, 'SECTION')
+        code.append(2, 'OBJECTS')
+        for obj in self.object_list:
+            code.extend(obj.to_code())
+        code.append(0, 'ENDSEC')
         return code
 
-    def build_view_table(self):
-        code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'VIEW')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
+    def get_handle(self):
+        return self.handle_gen.get()
+
+    def iter_bytes(self, binary=False, encoding='utf-8', chunk_size=0x10000, workers=None):
+        """Yield the encoded document in chunks of about chunk_size bytes."""
+        records = self.iter_records(binary, encoding, workers)
+        chunk = list()
+        size = 0
+        if binary:
+            chunk.append(BINARY_SENTINEL)
+            for data in records:
+                chunk.append(data)
+                size += len(data)
+                if size >= chunk_size:
+                    yield b''.join(chunk)
+                    chunk, size = list(), 0
+        else:
+            separator = ''
+            for text in records:
+                if not text:
+                    continue
+                chunk.append(separator)
+                chunk.append(text)
+                separator = '\n'
+                size += len(text)
+                if size >= chunk_size:
+                    yield ''.join(chunk).encode(encoding)
+                    chunk, size = list(), 0
+            if chunk:
+                chunk = [''.join(chunk).encode(encoding)]
+        if chunk:
+            yield b''.join(chunk)
+
+    def write(self, stream, binary=False, compression=None, name='drawing.dxf', workers=None):
+        """Write the document to a binary file-like object.
+
+        compression is None, 'gzip' or 'zip'; a zip archive holds the
+        drawing as a single member called name.  The stream is left open.
+        workers > 1 encodes the entities in that many processes, see
+        iter_records.
+        """
+        if compression is None:
+            for data in self.iter_bytes(binary, workers=workers):
+                stream.write(data)
+        elif compression == 'gzip':
+            import gzip
+            with gzip.GzipFile(fileobj=stream, mode='wb') as f:
+                self.write(f, binary, workers=workers)
+        elif compression == 'zip':
+            import zipfile
+            with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+                with archive.open(name, 'w') as f:
+                    self.write(f, binary, workers=workers)
+        else:
+            raise ValueError(f'Unknown compression: {compression}')
 
-        code.append(0, 'ENDTAB')
+    def save(self, path, binary=False, compression=None, workers=None):
+        with open(path, 'wb') as f:
+            name = os.path.splitext(os.path.basename(os.fspath(path)))[0] + '.dxf'
+            self.write(f, binary, compression, name, workers)
 
-        return code
 
-    def build_vport_table(self):
-        code = GroupCode()
-        code.append(0, 'TABLE')
-        code.append(2, 'VPORT')
-        code.append(5, self.get_handle())
-        code.append(100, 'AcDbSymbolTable')
-        code.append(70, 0)
+# entity lists being encoded, by key, for the forked encoding workers
+_forked_entities = dict()
 
-        code.append(0, 'ENDTAB')
 
-        return code
+def _encode_forked_entities(key, start, stop, binary, encoding, precision):
+    return _encode_entities(_forked_entities[key][start:stop], binary, encoding, precision)
 
-    def get_handle(self):
-        return self.handle_gen.get_hex()
 
-    def save(self, path):
-        code = self.build()
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(code.to_string())
+def _encode_entities(entity_list, binary, encoding, precision):
+    codes = list(iter_entity_codes(entity_list))
+    if binary:
+        return b''.join([code.to_bytes(encoding) for code in codes])
+    return '\n'.join(GroupCode.iter_text(codes, precision, len(codes)))
@@ -1,8 +1,12 @@
 import math
 from typing import Union, List
 
+from .geometry import arc_bbox, sweep
+
 
 class Entity:
+    __slots__ = ()
+
     def scale(self, x, y, factor):
         pass
 
@@ -20,6 +24,8 @@ class Entity:
 
 
 class Vector:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -74,15 +80,143 @@ class Vector:
         self.y = y + factor * (self.y - y)
         return self
 
+    def rotate(self, x, y, angle):
+        radians = math.radians(angle)
+        cos, sin = math.cos(radians), math.sin(radians)
+        dx, dy = self.x - x, self.y - y
+        self.x = x + dx * cos - dy * sin
+        self.y = y + dx * sin + dy * cos
+        return self
+
+    def mirror_x(self, x):
+        self.x = 2 * x - self.x
+        return self
+
     def copy(self):
         return Vector(self.x, self.y)
 
 
+class PointView(Vector):
+    """A point of a PointArray; reads and writes go through to the array."""
+    __slots__ = ('points', 'index')
+
+    def __init__(self, points, index):
+        self.points = points
+        self.index = index
+
+    @property
+    def x(self):
+        return float(self.points.data[self.index, 0])
+
+    @x.setter
+    def x(self, value):
+        self.points.data[self.index, 0] = value
+
+    @property
+    def y(self):
+        return float(self.points.data[self.index, 1])
+
+    @y.setter
+    def y(self, value):
+        self.points.data[self.index, 1] = value
+
+
+class PointArray:
+    """Points in an (N, 2) float array, transformed all at once.
+
+    The transforms match Vector's and change the points in place. It
+    behaves like a list of points: indexing and iteration give PointViews
+    that write through to the array, and append adds a point.
+    """
+    __slots__ = ('buffer', 'size')
+
+    def __init__(self, points=()):
+        import numpy as np
+        if isinstance(points, PointArray):
+            points = points.data
+        elif not isinstance(points, np.ndarray):
+            points = [(point[0], point[1]) for point in points]
+        self.buffer = np.array(points, dtype=float).reshape(-1, 2)
+        self.size = len(self.buffer)
+
+    @property
+    def data(self):
+        return self.buffer[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[index] for index in range(*key.indices(self.size))]
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError('PointArray index out of range')
+        return PointView(self, key)
+
+    def __setitem__(self, key, point):
+        self.data[key] = point[0], point[1]
+
+    def __iter__(self):
+        return (PointView(self, index) for index in range(self.size))
+
+    def __repr__(self):
+        return f'PointArray({self.data.tolist()})'
+
+    def __eq__(self, other):
+        import numpy as np
+        tol = 1e-6
+        other = other.data if isinstance(other, PointArray) else PointArray(other).data
+        return self.data.shape == other.shape and bool(np.all(np.abs(self.data - other) < tol))
+
+    def append(self, point):
+        if self.size == len(self.buffer):
+            # grow by doubling so appending stays amortized O(1)
+            import numpy as np
+            buffer = np.empty((max(2 * self.size, 8), 2))
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+        self.buffer[self.size] = point[0], point[1]
+        self.size += 1
+
+    def move(self, x, y):
+        data = self.data
+        data += (x, y)
+        return self
+
+    def scale(self, x, y, factor):
+        data = self.data
+        data -= (x, y)
+        data *= factor
+        data += (x, y)
+        return self
+
+    def rotate(self, x, y, angle):
+        import numpy as np
+        radians = math.radians(angle)
+        cos, sin = math.cos(radians), math.sin(radians)
+        data = self.data
+        data -= (x, y)
+        data @= np.array([[cos, sin], [-sin, cos]])
+        data += (x, y)
+        return self
+
+    def mirror_x(self, x):
+        self.data[:, 0] = 2 * x - self.data[:, 0]
+        return self
+
+    def copy(self):
+        return PointArray(self.data)
+
+
 Point = Vector
 P = Point
 
 
 class Arc(Entity):
+    __slots__ = ('center', 'radius', 'start_angle', 'end_angle', 'line_style')
+
     def __init__(self, center: Point, radius: Union[float, int],
                  start_angle: Union[float, int], end_angle: Union[float, int], line_style='normal'):
         self.center = center
@@ -106,10 +240,14 @@ class Arc(Entity):
         visitor.visit_arc(self)
 
     def compute_bounding_box(self):
-        pass
+        start = math.radians(self.start_angle)
+        return arc_bbox(self.center[0], self.center[1], self.radius,
+                        start, sweep(start, math.radians(self.end_angle)))
 
 
 class Circle(Entity):
+    __slots__ = ('center', 'radius', 'line_style')
+
     def __init__(self, center, radius, line_style='normal'):
         self.center = center
         self.radius = radius
@@ -129,6 +267,8 @@ class Circle(Entity):
 
 
 class Ellipse(Entity):
+    __slots__ = ('center', 'long_vector', 'ratio', 'start_angle', 'end_angle', 'line_style')
+
     def __init__(self, center: Point, long_vector, ratio, start_angle=0, end_angle=360, line_style='normal'):
         super().__init__()
         self.center = center
@@ -162,6 +302,8 @@ class Ellipse(Entity):
 
 
 class Line(Entity):
+    __slots__ = ('start', 'end', 'line_style')
+
     def __init__(self, start: Point, end: Point, line_style='normal'):
         self.start = start
         self.end = end
@@ -183,8 +325,19 @@ class Line(Entity):
 
 
 class LWPolyline(Entity):
+    """A polyline whose points are kept in a PointArray.
+
+    A list of points is copied into the array, so the transforms are
+    vectorized; point_list still reads like a list, with PointViews that
+    write through and append.  Points given as a PointArray are used as
+    they are.
+    """
+    __slots__ = ('point_list', 'bulge_list', 'line_style')
+
     def __init__(self, point_list: List[Point], bulge_list=None, line_style='normal'):
         super().__init__()
+        if not isinstance(point_list, PointArray):
+            point_list = PointArray(point_list)
         self.point_list = point_list
         if bulge_list is None:
             bulge_list = [0]*len(point_list)
@@ -193,12 +346,16 @@ class LWPolyline(Entity):
         self.line_style = line_style
 
     def move(self, x, y):
-        for point in self.point_list:
-            point.move(x, y)
+        self.point_list.move(x, y)
 
     def scale(self, x, y, factor):
-        for point in self.point_list:
-            point.scale(x, y, factor)
+        self.point_list.scale(x, y, factor)
+
+    def rotate(self, x, y, angle):
+        self.point_list.rotate(x, y, angle)
+
+    def mirror_x(self, x):
+        self.point_list.mirror_x(x)
 
     def draw_to(self, canvas):
         canvas.lwpolyline(self.point_list, self.bulge_list, self.line_style)
@@ -208,6 +365,9 @@ class LWPolyline(Entity):
 
 
 class Text(Entity):
+    __slots__ = ('text_string', 'insert', 'height', 'h_justify', 'v_justify', 'width_factor',
+                 'angle', 'font')
+
     def __init__(self, text_string, insert, height,
                  h_justify=0, v_justify=0, width_factor=0.7, angle=0, font='normal'):
         super().__init__()
@@ -240,6 +400,8 @@ class Text(Entity):
 
 
 class MText(Entity):
+    __slots__ = ('text_string', 'insert', 'height', 'width', 'attach', 'font')
+
     def __init__(self, text_string, insert, height, width=None, attach=1, font='normal'):
         self.text_string = text_string
         self.insert = insert
@@ -0,0 +1,96 @@
+import math
+
+# the unit vectors at 0, 90, 180 and 270 degrees
+_quadrants = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+
+def moved(point, x, y):
+    return [point[0] + x, point[1] + y]
+
+
+def points_bbox(points):
+    xs = [pt[0] for pt in points]
+    ys = [pt[1] for pt in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def rect_bbox(x, y, left, bottom, right, top, angle=0):
+    """Bounds of the rectangle left..right, bottom..top about (x, y), rotated by angle."""
+    if angle:
+        radians = math.radians(angle)
+        cos, sin = math.cos(radians), math.sin(radians)
+        corners = [(x + u * cos - v * sin, y + u * sin + v * cos)
+                   for u in (left, right) for v in (bottom, top)]
+        return points_bbox(corners)
+    return x + left, y + bottom, x + right, y + top
+
+
+def sweep(start, end):
+    """The counterclockwise sweep from start to end in radians, a full turn when equal."""
+    return (end - start) % math.tau or math.tau
+
+
+def arc_bbox(x, y, radius, start, span):
+    """Bounds of the arc about (x, y) from start counterclockwise by span, in radians.
+
+    The ends and every quadrant point the arc passes are taken.
+    """
+    stop = start + span
+    points = [(x + radius * math.cos(start), y + radius * math.sin(start)),
+              (x + radius * math.cos(stop), y + radius * math.sin(stop))]
+    quadrant = math.floor(start / (math.pi / 2)) + 1
+    while quadrant * (math.pi / 2) < stop:
+        u, v = _quadrants[quadrant % 4]
+        points.append((x + radius * u, y + radius * v))
+        quadrant += 1
+    return points_bbox(points)
+
+
+def ellipse_bbox(x, y, ux, uy, ratio, start, span):
+    """Bounds of the ellipse about (x, y) with major axis (ux, uy).
+
+    The curve runs from the parameter start counterclockwise by span, in
+    radians.  The ends and the parameters where x or y turns are taken.
+    """
+    vx, vy = -uy * ratio, ux * ratio
+    turns = [math.atan2(vx, ux), math.atan2(vy, uy)]
+    params = [start, start + span] + [
+        t for turn in turns for t in (turn, turn + math.pi)
+        if (t - start) % math.tau <= span]
+    return points_bbox([(x + ux * math.cos(t) + vx * math.sin(t),
+                         y + uy * math.cos(t) + vy * math.sin(t)) for t in params])
+
+
+def bulge_bbox(points, bulges):
+    """Bounds of a polyline whose segments bulge into arcs.
+
+    The bulge of a vertex is the tangent of a quarter of the included angle
+    of the arc to the next vertex, counterclockwise when positive.
+    """
+    xmin, ymin, xmax, ymax = points_bbox(points)
+    for i, bulge in enumerate(bulges[:len(points) - 1]):
+        if not bulge:
+            continue
+        x0, y0, x1, y1 = points[i][0], points[i][1], points[i + 1][0], points[i + 1][1]
+        dx, dy = x1 - x0, y1 - y0
+        chord = math.hypot(dx, dy)
+        if not chord:
+            continue
+        angle = 4 * math.atan(bulge)
+        # the center lies off the middle of the chord, to the left for a positive bulge
+        offset = 0.5 / math.tan(angle / 2)
+        cx, cy = (x0 + x1) / 2 - dy * offset, (y0 + y1) / 2 + dx * offset
+        radius = chord / (2 * abs(math.sin(angle / 2)))
+        if bulge < 0:
+            x0, y0 = x1, y1
+        box = arc_bbox(cx, cy, radius, math.atan2(y0 - cy, x0 - cx), abs(angle))
+        xmin, ymin = min(xmin, box[0]), min(ymin, box[1])
+        xmax, ymax = max(xmax, box[2]), max(ymax, box[3])
+    return xmin, ymin, xmax, ymax
+
+
+def union_bbox(boxes):
+    """Bounds of a flat sequence of xmin, ymin, xmax, ymax, None when empty."""
+    if not len(boxes):
+        return None
+    return min(boxes[0::4]), min(boxes[1::4]), max(boxes[2::4]), max(boxes[3::4])
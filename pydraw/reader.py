@@ -0,0 +1,753 @@
+import codecs
+import gzip
+import io
+import marshal
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import warnings
+import zipfile
+from array import array
+from collections import OrderedDict
+from itertools import chain
+
+from .dxf import (BINARY_SENTINEL, Arc, Circle, Ellipse, Hatch, Insert, Layer, Line,
+                  LWPolyline, MInsert, MText, Style, Text, value_type)
+
+
+# ------------------------------------------
+# Tokenizer
+# ------------------------------------------
+
+
+_STR, _FLOAT, _INT16, _INT32, _INT64, _BOOL, _BYTES = range(7)
+
+_kinds = {str: _STR, float: _FLOAT, 'int16': _INT16, 'int32': _INT32,
+          'int64': _INT64, bool: _BOOL, bytes: _BYTES}
+
+# value kind of every group code, indexed by code
+_code_kinds = [_kinds[value_type(code)] for code in range(1072)]
+
+# text value converters indexed by code, None keeps the str
+_text_converters = [float if kind == _FLOAT else
+                    int if kind in (_INT16, _INT32, _INT64, _BOOL) else None
+                    for kind in _code_kinds]
+
+_unpack_code = struct.Struct('<H').unpack_from
+_binary_unpackers = {
+    _FLOAT: (struct.Struct('<d').unpack_from, 8),
+    _INT16: (struct.Struct('<h').unpack_from, 2),
+    _INT32: (struct.Struct('<i').unpack_from, 4),
+    _INT64: (struct.Struct('<q').unpack_from, 8),
+    _BOOL: (struct.Struct('<B').unpack_from, 1),
+    _STR: None,
+    _BYTES: (),
+}
+
+# binary value readers indexed by code: (unpack, size), None for
+# zero-terminated strings, an empty tuple for length-prefixed chunks
+_binary_fields = [_binary_unpackers[kind] for kind in _code_kinds]
+
+
+def iter_pairs(stream, encoding='utf-8', chunk_size=0x100000):
+    """Yield the (code, value) pairs of a text or binary DXF stream.
+
+    The stream is a binary file-like object, read chunk_size bytes at a
+    time.  Values come typed by their group code: float, int or str;
+    binary chunks are returned as hex strings, the same as in text files.
+    """
+    head = stream.read(len(BINARY_SENTINEL))
+    if head == BINARY_SENTINEL:
+        return _iter_binary_pairs(stream, encoding, chunk_size)
+    return _iter_text_pairs(stream, head, encoding, chunk_size)
+
+
+def _iter_text_pairs(stream, head, encoding, chunk_size):
+    if codecs.lookup(encoding).name == 'utf-8':
+        encoding = 'utf-8-sig'
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    converters = _text_converters
+    count = len(converters)
+    tail = ''
+    data = head
+    while True:
+        text = tail + decoder.decode(data, not data)
+        if '\r' in text:
+            text = text.replace('\r\n', '\n')
+        lines = text.split('\n')
+        if data:
+            # keep the unfinished line and an unpaired code for the next chunk
+            tail = lines.pop()
+            if len(lines) & 1:
+                tail = lines.pop() + '\n' + tail
+        elif not lines[-1]:
+            lines.pop()
+        it = iter(lines)
+        for code, value in zip(it, it):
+            code = int(code)
+            convert = converters[code] if code < count else None
+            yield code, value if convert is None else convert(value)
+        if not data:
+            return
+        data = stream.read(chunk_size)
+
+
+def _iter_binary_pairs(stream, encoding, chunk_size):
+    fields = _binary_fields
+    count = len(fields)
+    unpack_code = _unpack_code
+    buffer = b''
+    pos = limit = 0
+    end_of_stream = False
+    while True:
+        if pos >= limit and not end_of_stream:
+            # fixed size values and binary chunks never need more than this
+            more = stream.read(chunk_size)
+            end_of_stream = not more
+            buffer = buffer[pos:] + more
+            pos = 0
+            limit = len(buffer) - 0x110
+        if pos >= len(buffer):
+            return
+        code, = unpack_code(buffer, pos)
+        pos += 2
+        field = fields[code] if code < count else None
+        if field is None:
+            end = buffer.find(b'\0', pos)
+            while end < 0:
+                more = stream.read(chunk_size)
+                if not more:
+                    raise ValueError('Truncated binary DXF')
+                buffer = buffer[pos:] + more
+                pos = 0
+                limit = len(buffer) - 0x110
+                end = buffer.find(b'\0')
+            value = buffer[pos:end].decode(encoding, 'replace')
+            pos = end + 1
+        elif field:
+            unpack, size = field
+            value, = unpack(buffer, pos)
+            pos += size
+        else:
+            size = buffer[pos]
+            value = buffer[pos + 1:pos + 1 + size].hex().upper()
+            pos += 1 + size
+        yield code, value
+
+
+# ------------------------------------------
+# Document
+# ------------------------------------------
+
+
+class Document:
+    """The content of a DXF file, as pydraw.dxf objects.
+
+    entities holds the ENTITIES section, model and paper space alike, and
+    blocks maps every block name to its entities.  Layers and text styles
+    referenced by name are created on first use when the file's tables do
+    not define them.  Records of other types are skipped.
+    """
+    def __init__(self):
+        self.header = OrderedDict()
+        self.layers = OrderedDict()
+        self.styles = OrderedDict()
+        self.blocks = OrderedDict()
+        self.entities = list()
+        self._block = None
+
+    def get_layer(self, name):
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = Layer(name)
+        return layer
+
+    def get_style(self, name):
+        style = self.styles.get(name)
+        if style is None:
+            style = self.styles[name] = Style(name)
+        return style
+
+    def load(self, pairs):
+        """Add the records of a stream of (code, value) pairs."""
+        section = None
+        target = None
+        record = None
+        for code, value in pairs:
+            if code:
+                if record is not None:
+                    record.append((code, value))
+                elif code == 2 and section is None:
+                    section = value
+                elif code == 9 and section == 'HEADER':
+                    target = self.header[value] = []
+                elif target is not None:
+                    target.append(value)
+                continue
+
+            if record is not None:
+                self.add_record(section, record)
+                record = None
+            if value == 'SECTION' or value == 'ENDSEC':
+                section = target = None
+            elif value == 'EOF':
+                break
+            elif section is not None and section != 'HEADER':
+                record = [(0, value)]
+
+        for name, values in self.header.items():
+            self.header[name] = values[0] if len(values) == 1 else tuple(values)
+        return self
+
+    def add_record(self, section, record):
+        kind = record[0][1]
+        if section == 'ENTITIES':
+            entity = self.read_entity(kind, record)
+            if entity is not None:
+                self.entities.append(entity)
+        elif section == 'BLOCKS':
+            if kind == 'BLOCK':
+                self._block = self.blocks.setdefault(_first(record, 2), list())
+            elif kind != 'ENDBLK':
+                entity = self.read_entity(kind, record)
+                if entity is not None:
+                    self._block.append(entity)
+        elif section == 'TABLES':
+            if kind == 'LAYER':
+                layer = self.get_layer(_first(record, 2))
+                layer.set_handle(_handle(_first(record, 5)))
+                layer.color = _first(record, 62, layer.color)
+            elif kind == 'STYLE':
+                style = self.get_style(_first(record, 2))
+                style.set_handle(_handle(_first(record, 5)))
+                style.font_name = _first(record, 3, style.font_name)
+                style.big_font_name = _first(record, 4, style.big_font_name)
+                style.width_factor = _first(record, 41, style.width_factor)
+
+    def read_entity(self, kind, record):
+        reader = _entity_readers.get(kind)
+        if reader is None:
+            return None
+        tags = dict(record)
+        entity = reader(self, record, tags)
+        if entity is None:
+            return None
+        handle, owner_handle = _handles(record)
+        entity.set_handle(handle)
+        entity.set_owner_handle(owner_handle)
+        entity.set_layer(self.get_layer(tags.get(8, '0')))
+        entity.set_space_status(tags.get(67, 0))
+        return entity
+
+
+def _first(record, code, default=None):
+    for c, value in record:
+        if c == code:
+            return value
+    return default
+
+
+def _handle(value):
+    return None if value is None else int(value, 16)
+
+
+def _handles(record):
+    """Handle and owner handle, skipping the 102 application groups."""
+    handle = owner_handle = None
+    in_group = False
+    for code, value in record:
+        if code == 5:
+            handle = _handle(value)
+        elif code == 102:
+            in_group = value.startswith('{')
+        elif code == 330 and not in_group:
+            owner_handle = _handle(value)
+            break
+        elif code == 100 and value != 'AcDbEntity':
+            break
+    return handle, owner_handle
+
+
+def _point(tags, code):
+    return [tags.get(code, 0.0), tags.get(code + 10, 0.0)]
+
+
+def _angle(param, ratio):
+    """Inverse of Ellipse.focus_radian, in degrees."""
+    angle = math.degrees(math.atan2(ratio * math.sin(param), math.cos(param)))
+    return round(angle % 360, 9) % 360
+
+
+def _rotate(x, y, degrees):
+    radians = math.radians(degrees)
+    cos, sin = math.cos(radians), math.sin(radians)
+    return x * cos - y * sin, y * cos + x * sin
+
+
+# Entity readers
+# -------------------------------------------------
+
+
+def _read_arc(doc, record, tags):
+    return Arc(_point(tags, 10), tags[40], tags.get(50, 0.0), tags.get(51, 360.0))
+
+
+def _read_circle(doc, record, tags):
+    return Circle(_point(tags, 10), tags[40])
+
+
+def _read_ellipse(doc, record, tags):
+    ratio = tags[40]
+    if not 0 < ratio < 1:
+        return None
+    start, end = tags.get(41, 0.0), tags.get(42, 2 * math.pi)
+    return Ellipse(_point(tags, 10), _point(tags, 11), ratio,
+                   _angle(start, ratio), _angle(end, ratio) or 360)
+
+
+def _read_line(doc, record, tags):
+    return Line(_point(tags, 10), _point(tags, 11), tags.get(48, 1))
+
+
+def _read_lwpolyline(doc, record, tags):
+    point_list = list()
+    bulge_list = list()
+    for code, value in record:
+        if code == 10:
+            point_list.append([value, 0.0])
+            bulge_list.append(0)
+        elif code == 20:
+            point_list[-1][1] = value
+        elif code == 42:
+            bulge_list[-1] = value
+    if tags.get(70, 0) & 1 and point_list and point_list[0] != point_list[-1]:
+        point_list.append(list(point_list[0]))
+        bulge_list.append(0)
+    return LWPolyline(point_list, bulge_list)
+
+
+def _read_text(doc, record, tags):
+    h_justify, v_justify = tags.get(72, 0), tags.get(73, 0)
+    insert = _point(tags, 11 if (h_justify or v_justify) and 11 in tags else 10)
+    text = Text(tags.get(1, ''), insert, tags[40], h_justify, v_justify,
+                tags.get(41, 1), tags.get(50, 0))
+    text.set_style(doc.get_style(tags.get(7, 'STANDARD')))
+    return text
+
+
+def _read_mtext(doc, record, tags):
+    text_string = ''.join([value for code, value in record if code == 3]) + tags.get(1, '')
+    text = MText(text_string, _point(tags, 10), tags[40], tags.get(41), tags.get(71, 1))
+    text.set_style(doc.get_style(tags.get(7, 'STANDARD')))
+    return text
+
+
+def _read_polyline_path(it):
+    point_list = list()
+    bulge_list = list()
+    closed = True
+    for code, value in it:
+        if code == 10:
+            point_list.append([value, 0.0])
+            bulge_list.append(0)
+        elif code == 20:
+            point_list[-1][1] = value
+        elif code == 42:
+            bulge_list[-1] = value
+        elif code == 73:
+            closed = bool(value)
+        elif code == 97:
+            break
+    if point_list and closed and point_list[0] != point_list[-1]:
+        point_list.append(list(point_list[0]))
+        bulge_list.append(0)
+    return point_list, bulge_list
+
+
+def _read_edge_path(it):
+    """Points and bulges of a boundary path of line and arc edges.
+
+    A path with ellipse or spline edges is not read: it gives no points,
+    with a warning.
+    """
+    edges = list()
+    for code, value in it:
+        if code == 72:
+            if value not in (1, 2):
+                warnings.warn(f'Hatch boundary edge of type {value} is not read, '
+                              'the hatch is skipped')
+                return [], []
+            edge = {72: value}
+            edges.append(edge)
+        elif code == 97:
+            break
+        elif edges:
+            edge[code] = value
+
+    point_list = list()
+    bulge_list = list()
+    end = None
+    for edge in edges:
+        if edge[72] == 1:
+            start, end = [edge[10], edge[20]], [edge[11], edge[21]]
+            bulge = 0
+        else:
+            x, y, radius = edge[10], edge[20], edge[40]
+            # the angles of a clockwise arc are measured clockwise
+            sign = 1 if edge.get(73, 1) else -1
+            start_angle, end_angle = sign * edge[50], sign * edge[51]
+            sweep = (edge[51] - edge[50]) % 360 or 360
+            if sweep == 360:
+                # a full circle, as two halves
+                middle = start_angle + sign * 180
+                point_list.append(_polar(x, y, radius, start_angle))
+                bulge_list.append(sign)
+                start_angle = middle
+                sweep = 180
+            start = _polar(x, y, radius, start_angle)
+            end = _polar(x, y, radius, end_angle)
+            bulge = sign * math.tan(math.radians(sweep) / 4)
+        point_list.append(start)
+        bulge_list.append(bulge)
+    if end is not None:
+        if math.dist(end, point_list[0]) < 1e-6:
+            end = list(point_list[0])
+        point_list.append(end)
+        bulge_list.append(0)
+    return point_list, bulge_list
+
+
+def _polar(x, y, radius, degrees):
+    radians = math.radians(degrees)
+    return [x + radius * math.cos(radians), y + radius * math.sin(radians)]
+
+
+def _read_hatch(doc, record, tags):
+    # the first boundary path and the pattern lines, read in order
+    it = iter(record)
+    for code, value in it:
+        if code == 92:
+            break
+    else:
+        return None
+
+    if value & 2:
+        point_list, bulge_list = _read_polyline_path(it)
+    else:
+        point_list, bulge_list = _read_edge_path(it)
+    if not point_list:
+        return None
+    if point_list[0] != point_list[-1]:
+        return None
+
+    angle = tags.get(52, 0.0)
+    scale = tags.get(41, 1.0) or 1.0
+    content = list()
+    for code, value in it:
+        if code == 53:
+            row = [value]
+            content.append(row)
+        elif content and code in (43, 44, 45, 46, 49):
+            row.append(value)
+        elif content and code == 40:
+            # dash lengths, as Hatch.to_code writes them
+            row.append(value)
+        elif code == 47 or code == 98:
+            break
+
+    # undo the rotation and scale Hatch.to_code applies to the pattern
+    for row in content:
+        line_angle = row[0]
+        row[0] = line_angle - angle
+        x, y = _rotate(row[1], row[2], -angle)
+        dx, dy = _rotate(row[3], row[4], -line_angle)
+        row[1:] = [x / scale, y / scale, dx / scale, dy / scale] + [
+            dash / scale for dash in row[5:]]
+
+    pattern_data = {'name': tags.get(2, ''), 'inform': '', 'content': tuple(content)}
+    return Hatch(pattern_data, point_list, bulge_list, angle, scale, tags.get(70, 0))
+
+
+def _read_insert(doc, record, tags):
+    columns, rows = tags.get(70, 1), tags.get(71, 1)
+    if columns > 1 or rows > 1:
+        return MInsert(_point(tags, 10), tags[2], columns, rows,
+                       tags.get(44, 0), tags.get(45, 0),
+                       tags.get(41, 1), tags.get(42, 1), tags.get(50, 0))
+    return Insert(_point(tags, 10), tags[2], tags.get(41, 1), tags.get(42, 1),
+                  tags.get(50, 0))
+
+
+_entity_readers = {
+    'ARC': _read_arc,
+    'CIRCLE': _read_circle,
+    'ELLIPSE': _read_ellipse,
+    'LINE': _read_line,
+    'LWPOLYLINE': _read_lwpolyline,
+    'TEXT': _read_text,
+    'MTEXT': _read_mtext,
+    'HATCH': _read_hatch,
+    'INSERT': _read_insert,
+}
+
+
+# ------------------------------------------
+# Index
+# ------------------------------------------
+
+
+# one match per pair with code 0, 2, 5 or 8; the pairs in between are
+# skipped inside the regex engine
+_indexed_pair = re.compile(
+    rb'(?: *(?![0258]\r?\n)\d+\r?\n[^\n]*\n)*'
+    rb'( *([0258])\r?\n([^\r\n]*)\r?\n)')
+
+
+def _scan_text(data, encoding):
+    for match in _indexed_pair.finditer(data):
+        code, value = match.group(2, 3)
+        yield match.start(1), int(code), value.decode(encoding, 'replace')
+
+
+def _scan_binary(data, encoding):
+    fields = _binary_fields
+    count = len(fields)
+    unpack_code = _unpack_code
+    pos = len(BINARY_SENTINEL)
+    size = len(data)
+    while pos < size:
+        start = pos
+        code, = unpack_code(data, pos)
+        pos += 2
+        field = fields[code] if code < count else None
+        if field is None:
+            end = data.find(b'\0', pos)
+            if end < 0:
+                raise ValueError('Truncated binary DXF')
+            if code == 0 or code == 2 or code == 5 or code == 8:
+                yield start, code, data[pos:end].decode(encoding, 'replace')
+            pos = end + 1
+        elif field:
+            pos += field[1]
+        else:
+            pos += 1 + data[pos]
+
+
+class Index:
+    """Byte offsets of the sections and records of a DXF file.
+
+    The file is memory-mapped and scanned once for the SECTION/ENDSEC
+    pairs and the start of every record in the BLOCKS and ENTITIES
+    sections, with its type, handle and layer.  Lookups only decode the
+    records they return.  save() stores the index next to the file as
+    path + '.idx'; it is reused while the file keeps its size and mtime.
+    """
+    version = 2
+
+    def __init__(self, path, encoding='utf-8'):
+        self.path = os.fspath(path)
+        self.encoding = encoding
+        with open(self.path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        stat = os.stat(self.path)
+        self.stamp = stat.st_size, stat.st_mtime_ns
+        self.binary = self.data[:len(BINARY_SENTINEL)] == BINARY_SENTINEL
+        self._document = None
+        self._by_handle = None
+        self._by_kind = None
+        self._by_layer = None
+        if not self.load():
+            self.scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    @property
+    def index_path(self):
+        return self.path + '.idx'
+
+    def scan(self):
+        self.sections = OrderedDict()
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.kinds = list()
+        self.handles = list()
+        self.layers = list()
+
+        scan = _scan_binary if self.binary else _scan_text
+        section = section_start = None
+        in_record = indexed = False
+        for start, code, value in scan(self.data, self.encoding):
+            if code:
+                if in_record:
+                    if code == 5 and self.handles[-1] is None:
+                        self.handles[-1] = int(value, 16)
+                    elif code == 8 and self.layers[-1] is None:
+                        self.layers[-1] = value
+                elif code == 2 and section is None and section_start is not None:
+                    section = value
+                    indexed = section == 'BLOCKS' or section == 'ENTITIES'
+                continue
+
+            if in_record:
+                self.ends.append(start)
+                in_record = False
+            if value == 'SECTION':
+                section, section_start = None, start
+            elif value == 'ENDSEC':
+                if section is not None:
+                    self.sections[section] = section_start, self._pair_end(start)
+                section = section_start = None
+                indexed = False
+            elif value == 'EOF':
+                break
+            elif indexed:
+                self.starts.append(start)
+                self.kinds.append(value)
+                self.handles.append(None)
+                self.layers.append(None)
+                in_record = True
+
+    def _pair_end(self, start):
+        """End offset of the pair starting at start."""
+        if self.binary:
+            return self.data.find(b'\0', start + 2) + 1
+        end = self.data.find(b'\n', self.data.find(b'\n', start) + 1)
+        return len(self.data) if end < 0 else end + 1
+
+    def save(self):
+        state = {
+            'version': self.version, 'stamp': self.stamp,
+            'sections': list(self.sections.items()),
+            'starts': self.starts.tobytes(), 'ends': self.ends.tobytes(),
+            'kinds': self.kinds, 'handles': self.handles, 'layers': self.layers,
+        }
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(marshal.dumps(state))
+            os.replace(temp, self.index_path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    def load(self):
+        """Read the saved index if it matches the file, return whether it did."""
+        try:
+            with open(self.index_path, 'rb') as f:
+                state = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if (not isinstance(state, dict) or state.get('version') != self.version
+                or tuple(state['stamp']) != self.stamp):
+            return False
+        self.sections = OrderedDict(state['sections'])
+        self.starts = array('Q', state['starts'])
+        self.ends = array('Q', state['ends'])
+        self.kinds = state['kinds']
+        self.handles = state['handles']
+        self.layers = state['layers']
+        return True
+
+    def __len__(self):
+        return len(self.starts)
+
+    def pairs(self, start, end):
+        """Decode the pairs between two byte offsets."""
+        data = self.data[start:end]
+        if self.binary:
+            return _iter_binary_pairs(io.BytesIO(data), self.encoding, len(data))
+        return _iter_text_pairs(io.BytesIO(), data, self.encoding, len(data))
+
+    def section(self, name):
+        """The (code, value) pairs of a section, SECTION and ENDSEC included."""
+        if name not in self.sections:
+            return iter(())
+        return self.pairs(*self.sections[name])
+
+    @property
+    def document(self):
+        """A Document with the header and the tables, for the entity layers and styles."""
+        if self._document is None:
+            self._document = Document().load(chain(self.section('HEADER'),
+                                                   self.section('TABLES')))
+        return self._document
+
+    def record(self, i):
+        return list(self.pairs(self.starts[i], self.ends[i]))
+
+    def entity(self, i):
+        """Decode record i, None when it is not a supported entity."""
+        return self.document.read_entity(self.kinds[i], self.record(i))
+
+    def find(self, handle):
+        """The entity with a handle, given as an int or in hex."""
+        if isinstance(handle, str):
+            handle = int(handle, 16)
+        if self._by_handle is None:
+            self._by_handle = {handle: i for i, handle in enumerate(self.handles)}
+        i = self._by_handle.get(handle)
+        return None if i is None else self.entity(i)
+
+    def select(self, kind=None, layer=None):
+        """Yield the supported entities of a type and/or on a layer."""
+        if kind is not None:
+            if self._by_kind is None:
+                self._by_kind = _group(self.kinds)
+            candidates = self._by_kind.get(kind, ())
+        elif layer is not None:
+            if self._by_layer is None:
+                self._by_layer = _group(self.layers)
+            candidates = self._by_layer.get(layer, ())
+        else:
+            candidates = range(len(self))
+        layers = self.layers
+        for i in candidates:
+            if layer is not None and layers[i] != layer:
+                continue
+            entity = self.entity(i)
+            if entity is not None:
+                yield entity
+
+
+def _group(values):
+    groups = dict()
+    for i, value in enumerate(values):
+        groups.setdefault(value, array('L')).append(i)
+    return groups
+
+
+# ------------------------------------------
+# Entry points
+# ------------------------------------------
+
+
+def load(stream, encoding='utf-8'):
+    """Read a text or binary DXF from a binary file-like object."""
+    return Document().load(iter_pairs(stream, encoding))
+
+
+def read(path, compression=None, encoding='utf-8'):
+    """Read a DXF file, as written by DXF.save with the same compression."""
+    if compression is None:
+        with open(path, 'rb') as f:
+            return load(f, encoding)
+    elif compression == 'gzip':
+        with gzip.open(path, 'rb') as f:
+            return load(f, encoding)
+    elif compression == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(archive.namelist()[0]) as f:
+                return load(f, encoding)
+    else:
+        raise ValueError(f'Unknown compression: {compression}')
@@ -0,0 +1,249 @@
+import heapq
+import math
+from array import array
+
+import numpy as np
+
+
+class GridIndex:
+    """A uniform grid over the bounding boxes of entities.
+
+    An entity is listed in every cell its box overlaps.  Those spanning
+    more than max_cells cells, and all of them until the grid is first
+    sized, go in a loose list that every query scans.  The cell size is
+    picked from the boxes, and picked again whenever the count has grown
+    fourfold since; rebuild(cell_size) sets it by hand until then.
+
+    Boxes are read when an entity is inserted: after moving an indexed
+    entity, call rebuild.  Entities without a box, e.g. empty batches,
+    are left out.  Queries answer by bounding box and list the
+    entities in insertion order.
+    """
+    max_cells = 16
+    min_sized = 256
+
+    def __init__(self, entities=()):
+        self.entities = list()
+        # xmin, ymin, xmax, ymax of each entity
+        self.boxes = array('d')
+        self.cells = dict()
+        # the cells in use lie within i0, j0, i1, j1
+        self.cell_range = None
+        self.loose = list()
+        self.cell_size = None
+        self.sized = 0
+        self.extend(entities)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def insert(self, entity):
+        box = entity.get_bbox()
+        if box is None:
+            return
+        index = len(self.entities)
+        self.entities.append(entity)
+        self.boxes.extend(box)
+        if self._needs_rebuild():
+            self.rebuild()
+        else:
+            self._place(index, *box)
+
+    def extend(self, entities):
+        start = len(self.entities)
+        for entity in entities:
+            box = entity.get_bbox()
+            if box is not None:
+                self.entities.append(entity)
+                self.boxes.extend(box)
+        if self._needs_rebuild():
+            self.rebuild()
+        else:
+            for index in range(start, len(self.entities)):
+                self._place(index, *self.boxes[4 * index:4 * index + 4])
+
+    def _needs_rebuild(self):
+        return len(self.entities) >= 4 * max(self.sized, self.min_sized // 4)
+
+    def rebuild(self, cell_size=None):
+        """Sort every entity into cells again, of cell_size or a fitting size."""
+        self.cells = dict()
+        self.cell_range = None
+        self.loose = list()
+        self.sized = len(self.entities)
+        boxes = np.frombuffer(self.boxes, dtype=float).reshape(-1, 4)
+        if cell_size is None:
+            cell_size = self._fit_cell_size(boxes)
+        self.cell_size = cell_size
+        if cell_size is None:
+            self.loose = list(range(len(self.entities)))
+            return
+
+        low = np.floor(boxes[:, :2] / cell_size).astype(np.int64)
+        counts = np.floor(boxes[:, 2:] / cell_size).astype(np.int64) - low + 1
+        spans = counts.prod(axis=1)
+        placed = np.flatnonzero(spans <= self.max_cells)
+        self.loose = np.flatnonzero(spans > self.max_cells).tolist()
+        if not len(placed):
+            return
+
+        # one (cell, entity) pair per cell an entity overlaps, grouped by
+        # cell in a single stable sort, so each cell lists its entities in order
+        spans = spans[placed]
+        indexes = np.repeat(placed, spans)
+        offsets = np.arange(len(indexes)) - np.repeat(np.cumsum(spans) - spans, spans)
+        rows = np.repeat(counts[placed, 1], spans)
+        keys = low[indexes] + np.column_stack((offsets // rows, offsets % rows))
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        indexes, keys = indexes[order], keys[order]
+        bounds = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+        starts = [0] + bounds.tolist()
+        stops = bounds.tolist() + [len(indexes)]
+        cells = self.cells
+        for (i, j), start, stop in zip(keys[starts].tolist(), starts, stops):
+            cells[i, j] = indexes[start:stop].tolist()
+        self.cell_range = (*keys.min(axis=0).tolist(), *keys.max(axis=0).tolist())
+
+    def _fit_cell_size(self, boxes):
+        if len(boxes) < self.min_sized:
+            return None
+        width = boxes[:, 2].max() - boxes[:, 0].min()
+        height = boxes[:, 3].max() - boxes[:, 1].min()
+        # about four entities a cell, no smaller than a typical entity
+        typical = np.median(np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]))
+        size = max(math.sqrt(4 * width * height / len(boxes)),
+                   4 * max(width, height) / len(boxes), typical)
+        return float(size) if size > 0 else None
+
+    def _cell_range(self, xmin, ymin, xmax, ymax):
+        size = self.cell_size
+        return (math.floor(xmin / size), math.floor(ymin / size),
+                math.floor(xmax / size), math.floor(ymax / size))
+
+    def _place(self, index, xmin, ymin, xmax, ymax):
+        if self.cell_size is None:
+            self.loose.append(index)
+            return
+        i0, j0, i1, j1 = self._cell_range(xmin, ymin, xmax, ymax)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > self.max_cells:
+            self.loose.append(index)
+            return
+        cells = self.cells
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                cell = cells.get((i, j))
+                if cell is None:
+                    cells[i, j] = [index]
+                else:
+                    cell.append(index)
+        self._extend_range(i0, j0, i1, j1)
+
+    def _extend_range(self, i0, j0, i1, j1):
+        if self.cell_range is None:
+            self.cell_range = i0, j0, i1, j1
+        else:
+            r = self.cell_range
+            self.cell_range = min(r[0], i0), min(r[1], j0), max(r[2], i1), max(r[3], j1)
+
+    def _candidates(self, xmin, ymin, xmax, ymax):
+        found = list(self.loose)
+        if self.cell_size is None:
+            return found
+        i0, j0, i1, j1 = self._cell_range(xmin, ymin, xmax, ymax)
+        cells = self.cells
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(cells):
+            for (i, j), cell in cells.items():
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    found.extend(cell)
+        else:
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    cell = cells.get((i, j))
+                    if cell is not None:
+                        found.extend(cell)
+        return found
+
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        """The entities whose boxes meet the window."""
+        entities = self.entities
+        return [entities[index] for index in self.query_indexes(xmin, ymin, xmax, ymax)]
+
+    def query_indexes(self, xmin, ymin, xmax, ymax):
+        """The insertion indexes of the entities whose boxes meet the window."""
+        found = np.sort(np.array(self._candidates(xmin, ymin, xmax, ymax), dtype=np.int64))
+        if len(found) > 1:
+            found = found[np.concatenate(([True], found[1:] != found[:-1]))]
+        boxes = np.frombuffer(self.boxes, dtype=float).reshape(-1, 4)[found]
+        hit = ((boxes[:, 0] <= xmax) & (boxes[:, 2] >= xmin)
+               & (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin))
+        return found[hit].tolist()
+
+    def query_point(self, x, y, tolerance=0):
+        """The entities whose boxes are within tolerance of (x, y)."""
+        return self.query_bbox(x - tolerance, y - tolerance, x + tolerance, y + tolerance)
+
+    def nearest(self, x, y, count=1):
+        """The count entities with boxes closest to (x, y), closest first."""
+        if not self.entities or count < 1:
+            return []
+        entities = self.entities
+        if not self.cells:
+            return [entities[index] for distance, index in self._closest(x, y, None, count)]
+
+        # look at rings of cells around the point's cell, until the best
+        # found is nearer than anything in the next ring can be
+        size = self.cell_size
+        ci, cj = math.floor(x / size), math.floor(y / size)
+        i0, j0, i1, j1 = self.cell_range
+        ring = max(0, i0 - ci, ci - i1, j0 - cj, cj - j1)
+        last = max(ci - i0, i1 - ci, cj - j0, j1 - cj)
+        seen = set(self.loose)
+        best = self._closest(x, y, self.loose, count)
+        cells = self.cells
+        while ring <= last:
+            if len(best) >= count and best[-1][0] <= (ring - 1) * size:
+                break
+            if 8 * ring > len(cells):
+                # the rings have outgrown the grid: look at everything
+                best = self._closest(x, y, None, count)
+                break
+            found = list()
+            for i, j in _ring(ci, cj, ring):
+                cell = cells.get((i, j))
+                if cell is not None:
+                    for index in cell:
+                        if index not in seen:
+                            seen.add(index)
+                            found.append(index)
+            best = heapq.nsmallest(count, best + self._closest(x, y, found, count))
+            ring += 1
+        return [entities[index] for distance, index in best]
+
+    def _closest(self, x, y, indexes, count):
+        """(distance, index) of the count closest of indexes, or of all if None."""
+        boxes = np.frombuffer(self.boxes, dtype=float).reshape(-1, 4)
+        if indexes is None:
+            indexes = np.arange(len(boxes))
+        else:
+            indexes = np.array(indexes, dtype=np.int64)
+            boxes = boxes[indexes]
+        if not len(indexes):
+            return []
+        dx = np.maximum(np.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0)
+        dy = np.maximum(np.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0)
+        distance = np.hypot(dx, dy)
+        order = np.lexsort((indexes, distance))[:count]
+        return list(zip(distance[order].tolist(), indexes[order].tolist()))
+
+
+def _ring(ci, cj, ring):
+    """The cells at Chebyshev distance ring from (ci, cj)."""
+    if ring == 0:
+        yield ci, cj
+        return
+    for i in range(ci - ring, ci + ring + 1):
+        yield i, cj - ring
+        yield i, cj + ring
+    for j in range(cj - ring + 1, cj + ring):
+        yield ci - ring, j
+        yield ci + ring, j
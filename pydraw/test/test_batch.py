@@ -0,0 +1,103 @@
+import io
+
+import numpy as np
+
+from .. import dxf
+from ..batch import ArcBatch, CircleBatch, LineBatch
+from ..reader import load
+
+
+def make_dxf(starts, ends, radii, batch):
+    d = dxf.DXF()
+    layer = d.layer['0']
+    m = d.model_space
+    if batch:
+        m.append(LineBatch(starts, ends, layer=layer))
+        m.append(CircleBatch(starts, radii, layer=layer))
+        m.append(ArcBatch(ends, 2.5, radii * 90, 180, layer=layer))
+    else:
+        entities = [dxf.Line(start, end) for start, end in zip(starts.tolist(), ends.tolist())]
+        entities += [dxf.Circle(center, radius)
+                     for center, radius in zip(starts.tolist(), radii.tolist())]
+        entities += [dxf.Arc(center, 2.5, angle, 180)
+                     for center, angle in zip(ends.tolist(), (radii * 90).tolist())]
+        for entity in entities:
+            entity.set_layer(layer)
+            m.append(entity)
+    line = dxf.Line([0, 0], [1, 1])
+    line.set_layer(layer)
+    m.append(line)
+    return d
+
+
+def test_batches_write_like_single_entities():
+    rand = np.random.default_rng(1)
+    starts, ends, radii = rand.random((100, 2)) * 1000, rand.random((100, 2)), rand.random(100)
+    for kwargs in ({}, {'binary': True}):
+        outputs = list()
+        for batch in (False, True):
+            stream = io.BytesIO()
+            make_dxf(starts, ends, radii, batch).write(stream, **kwargs)
+            outputs.append(stream.getvalue())
+        assert outputs[0] == outputs[1]
+
+    d = make_dxf(starts, ends, radii, True)
+    d.precision = 3
+    assert d.build().to_string(3) == make_dxf(starts, ends, radii, False).build().to_string(3)
+
+
+def test_arc_batch_bbox():
+    rand = np.random.default_rng(2)
+    centers, radii = rand.random((200, 2)) * 100, rand.random(200) * 10
+    starts, ends = rand.random(200) * 720 - 360, rand.random(200) * 360
+    boxes = np.array([dxf.Arc(center, radius, start, end).bbox() for center, radius, start, end
+                      in zip(centers.tolist(), radii.tolist(), starts.tolist(), ends.tolist())])
+    expected = (*boxes[:, :2].min(axis=0), *boxes[:, 2:].max(axis=0))
+    assert np.allclose(ArcBatch(centers, radii, starts, ends).bbox(), expected)
+    assert np.allclose(ArcBatch([[0, 0], [10, 0]], 1, 0, 90).bbox(), (0, 0, 11, 1))
+
+
+def test_batch_takes_a_handle_range():
+    d = dxf.DXF()
+    lines = LineBatch([[0, 0], [1, 1], [2, 2]], [[1, 0], [2, 1], [3, 2]], layer=d.layer['0'])
+    d.model_space.append(lines)
+    first = lines.first_handle
+    assert lines.handle == first
+    assert d.get_handle() == first + 3
+    code = lines.to_code()
+    assert [value for code, value in zip(code.codes, code.values()) if code == 5] == [
+        first, first + 1, first + 2]
+
+
+def test_empty_batches_have_no_extents():
+    empty = np.zeros((0, 2))
+    for batch in (LineBatch(empty, empty), CircleBatch(empty, 1), ArcBatch(empty, 1, 0, 90)):
+        assert batch.bbox() is None
+        d = dxf.DXF()
+        batch.set_layer(d.layer['0'])
+        d.model_space.append(batch)
+        d.write(io.BytesIO())
+        assert '$EXTMIN\n10\n1e+20\n' in d.build_header().to_string()
+        line = dxf.Line([0, 0], [1, 2])
+        line.set_layer(d.layer['0'])
+        d.model_space.append(line)
+        assert d.model_space.extents() == (0, 0, 1, 2)
+        assert d.model_space.query_point(0, 0) == [line]
+
+
+def test_empty_batches_round_trip():
+    empty = np.zeros((0, 2))
+    for cache_codes, workers in ((False, None), (True, None), (False, 2)):
+        d = dxf.DXF(cache_codes=cache_codes)
+        for batch in (LineBatch(empty, empty), CircleBatch(empty, 1), ArcBatch(empty, 1, 0, 90)):
+            batch.set_layer(d.layer['0'])
+            d.model_space.append(batch)
+        line = dxf.Line([0, 0], [1, 2])
+        line.set_layer(d.layer['0'])
+        d.model_space.append(line)
+        stream = io.BytesIO()
+        d.write(stream, workers=workers)
+        assert b'\nENTITIES\n0\nLINE\n' in stream.getvalue()
+        stream.seek(0)
+        entity, = load(stream).entities
+        assert entity.end == [1, 2]
@@ -0,0 +1,80 @@
+import io
+
+from .. import dxf
+from ..dedupe import clusters
+from ..reader import load
+
+
+def bolt(d, x, y):
+    entities = [dxf.Circle([x, y], 5), dxf.Circle([x, y], 3),
+                dxf.LWPolyline([[x - 6, y - 6], [x + 6, y - 6], [x + 6, y + 6], [x - 6, y - 6]]),
+                dxf.Line([x - 7, y], [x + 7, y]), dxf.Arc([x, y], 4, 0, 90)]
+    for entity in entities:
+        entity.set_layer(d.layer['0'])
+        d.model_space.append(entity)
+    return entities
+
+
+def test_clusters():
+    lines = [dxf.Line([0, 0], [1, 1]), dxf.Line([5, 5], [6, 6]), dxf.Line([1, 1], [2, 0]),
+             dxf.Line([6, 6], [7, 5]), dxf.Line([20, 20], [21, 21])]
+    assert clusters(lines) == [[lines[0], lines[2]], [lines[1], lines[3]], [lines[4]]]
+
+
+def test_repeated_groups_become_inserts():
+    d = dxf.DXF()
+    for i in range(20):
+        bolt(d, i * 30.1, 7.3)
+    line = dxf.Line([1000, 0], [1010, 0])
+    line.set_layer(d.layer['0'])
+    d.model_space.append(line)
+    extents = d.model_space.extents()
+    stream = io.BytesIO()
+    d.write(stream)
+    size = len(stream.getvalue())
+
+    block, = d.dedupe()
+    assert block.name == 'BLOCK0' and len(block.entity_list) == 5
+    assert block.extents() == (0, 0, 14, 12)
+    inserts = d.model_space.entity_list[:-1]
+    assert all(isinstance(insert, dxf.Insert) for insert in inserts)
+    assert [insert.pt_insert[0] for insert in inserts[:2]] == [-7, 30.1 - 7]
+    assert d.model_space.entity_list[-1] is line
+    assert d.model_space.extents() == extents
+    handles = [entity.handle for entity in d.model_space.entity_list]
+    assert handles == sorted(handles) and len(set(handles)) == len(handles)
+
+    stream = io.BytesIO()
+    d.write(stream)
+    assert len(stream.getvalue()) < size / 2
+    stream.seek(0)
+    doc = load(stream)
+    assert len(doc.blocks['BLOCK0']) == 5
+    assert [type(e) for e in doc.entities] == [dxf.Insert] * 20 + [dxf.Line]
+    assert doc.entities[1].block_name == 'BLOCK0'
+
+
+def test_marked_groups():
+    d = dxf.DXF()
+    first, second = bolt(d, 0, 0), bolt(d, 100, 0)
+    # touching each other, so not a group on their own
+    bolt(d, 200, 0)
+    bolt(d, 210, 0)
+    d.model_space.group(first[:2])
+    d.model_space.group(second[:2])
+    block, = d.dedupe(auto=False)
+    assert len(block.entity_list) == 2
+    assert len(d.model_space.entity_list) == 20 - 2
+    # the rest of the two bolts touch their inserts and nest them
+    nested, = d.dedupe()
+    assert len(nested.entity_list) == 4
+    assert nested.entity_list[0].block_name == block.name
+    assert len(d.model_space.entity_list) == 2 + 10
+
+
+def test_unnamed_blocks_are_numbered():
+    d = dxf.DXF()
+    d.new_block('BLOCK0')
+    assert [d.new_block().name, d.new_block().name] == ['BLOCK1', 'BLOCK2']
+    handle_gen = dxf.Handle()
+    assert dxf.Block(handle_gen).name != dxf.Block(handle_gen).name
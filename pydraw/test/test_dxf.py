@@ -0,0 +1,489 @@
+import copy
+import gzip
+import io
+import multiprocessing
+import struct
+import threading
+import tracemalloc
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from ..dxf import (BINARY_SENTINEL, DXF, Arc, Circle, DimStyle, Entity, GroupCode, Handle,
+                   Hatch, Insert, Layer, Line, LType, MInsert, PatternCache, Resource,
+                   Template, compile_pattern, format_floats)
+from ..reader import load
+
+
+def make_dxf(count=10, **kwargs):
+    d = DXF(**kwargs)
+    for i in range(count):
+        line = Line([i, 0], [i, 10])
+        line.set_layer(d.layer['0'])
+        d.model_space.append(line)
+    return d
+
+
+def test_save_streams_same_text(tmp_path):
+    path = tmp_path / 'stream.dxf'
+    make_dxf().save(path)
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == make_dxf().build().to_string()
+
+
+def test_group_code_formats_at_write_time():
+    code = GroupCode()
+    code.append(0, 'LINE')
+    code.append([10, 20, 30], [1.5, 2, 0])
+    other = GroupCode()
+    other.append(8, '0')
+    code.extend(other)
+    assert list(code.codes) == [0, 10, 20, 30, 8]
+    assert list(code.floats) == [1.5]
+    assert code.data == ['0', 'LINE', '10', '1.5', '20', '2', '30', '0', '8', '0']
+    assert code.to_string() == '\n'.join(code.data)
+
+
+def test_template_fill_matches_append():
+    template = Template([(0, 'LINE'), (5, ...), (10, ...), (20, ...), (30, 0)])
+    code = GroupCode()
+    template.fill(code, 0x1F, 1, 2.5)
+    template.fill_many(code, 2, [0x20, 0x21], [3, 4], 0.5)
+
+    expect = GroupCode()
+    expect.append([0, 5, 10, 20, 30], ['LINE', 0x1F, 1.0, 2.5, 0])
+    expect.append([0, 5, 10, 20, 30], ['LINE', 0x20, 3.0, 0.5, 0])
+    expect.append([0, 5, 10, 20, 30], ['LINE', 0x21, 4.0, 0.5, 0])
+    assert code.to_string() == expect.to_string()
+    assert '\n5\n1F\n' in code.to_string()
+
+
+def test_save_binary(tmp_path):
+    path = tmp_path / 'binary.dxf'
+    make_dxf(1).save(path, binary=True)
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data.startswith(BINARY_SENTINEL + struct.pack('<H', 0) + b'SECTION\0')
+    assert struct.pack('<HdHdHd', 10, 0.0, 20, 0.0, 30, 0.0) in data
+    assert struct.pack('<H', 8) + b'0\0' in data
+    assert data.endswith(struct.pack('<H', 0) + b'EOF\0')
+
+
+def test_write_compressed_stream():
+    text = make_dxf().build().to_string().encode('utf-8')
+
+    stream = io.BytesIO()
+    make_dxf().write(stream, compression='gzip')
+    assert gzip.decompress(stream.getvalue()) == text
+
+    stream = io.BytesIO()
+    make_dxf().write(stream, compression='zip', name='plan.dxf')
+    with zipfile.ZipFile(stream) as archive:
+        assert archive.read('plan.dxf') == text
+
+
+def make_deduped_dxf(count):
+    d = make_dxf(count)
+    for i in range(50):
+        for entity in (Circle([i * 20, 100], 5), Line([i * 20 - 5, 100], [i * 20 + 5, 100])):
+            entity.set_layer(d.layer['0'])
+            d.model_space.append(entity)
+    block, = d.dedupe()
+    insert = Insert([0, -50], block, 2, 2, 30)
+    grid = MInsert([0, -200], block, 10, 10, 20, 20)
+    for entity in (insert, grid):
+        entity.set_layer(d.layer['0'])
+        d.model_space.append(entity)
+    return d
+
+
+def test_save_with_workers_is_identical(tmp_path, monkeypatch):
+    for make in (make_dxf, make_deduped_dxf):
+        for binary in (False, True):
+            sequential, parallel = tmp_path / 'sequential.dxf', tmp_path / 'parallel.dxf'
+            make(3000).save(sequential, binary)
+            make(3000).save(parallel, binary, workers=2)
+            assert sequential.read_bytes() == parallel.read_bytes()
+    # where workers do not fork, the entities are pickled to them
+    monkeypatch.setattr(multiprocessing, 'get_start_method', lambda: 'spawn')
+    make_deduped_dxf(3000).save(parallel, workers=2)
+    make_deduped_dxf(3000).save(sequential)
+    assert sequential.read_bytes() == parallel.read_bytes()
+
+
+def test_cached_codes_are_reused_until_changed(tmp_path):
+    path = tmp_path / 'cached.dxf'
+    d = make_dxf(3, cache_codes=True)
+    first, second, third = d.model_space.entity_list
+    d.save(path)
+    cached = first.get_code()
+    second.end = [1, 42.5]
+    second.touch()
+    third.move(1, 1)
+    assert first.get_code() is cached
+    assert second.get_code() is not cached and third.get_code() is not cached
+
+    d.save(path)
+    assert '\n42.5\n' in path.read_text(encoding='utf-8')
+    saved = path.read_bytes()
+    d.save(path)
+    assert path.read_bytes() == saved
+
+
+def test_precision():
+    assert format_floats([1.23456, 100.0, -0.0001, 0.5], 3) == ['1.235', '100', '0', '0.5']
+    assert format_floats([2.5, -0.4], 0) == ['2', '0']
+
+    d = make_dxf(300, precision=2)
+    line = d.model_space.entity_list[0]
+    line.end = [1 / 3, 2 / 3]
+    assert '\n0.33\n21\n0.67\n' in line.to_code().to_string(2)
+    text = b''.join(d.iter_bytes()).decode('utf-8')
+    assert text.count('\n0.33\n') == 1
+    assert text == '\n'.join(code.to_string(2) for code in d.iter_build())
+    assert d.build().to_string() == text
+
+
+def test_handles():
+    handle_gen = Handle(0xfffff)
+    assert handle_gen.get() == 0xfffff
+    assert handle_gen.get_hex() == '100000'
+    first = handle_gen.reserve(10)
+    assert handle_gen.seed() == first + 10
+
+    taken = list()
+    def take():
+        taken.extend(handle_gen.get() for _ in range(10000))
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(taken) == list(range(first + 10, first + 80010))
+
+    code = GroupCode()
+    code.append([5, 330, 70], [2 ** 63, 0x1F, 31])
+    assert code.to_string() == '5\n8000000000000000\n330\n1F\n70\n31'
+    assert code.to_bytes() == struct.pack('<H17sH3sHh', 5, b'8000000000000000', 330, b'1F',
+                                          70, 31)
+
+    d = make_dxf(3)
+    text = d.build().to_string()
+    assert f'$HANDSEED\n5\n{d.handle_gen.seed():X}\n' in text
+    assert f'\n5\n{d.model_space.entity_list[-1].handle:X}\n' in text
+
+
+def populate(d, producers, count, order):
+    layer = d.layer['0']
+    def produce(key):
+        stage = d.model_space.stage(key)
+        for i in range(count):
+            line = Line([key, i], [key, i + 1])
+            line.set_layer(layer)
+            stage.append(line)
+    threads = [threading.Thread(target=produce, args=(key,)) for key in order]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    d.merge()
+
+
+def test_staged_appends_are_reproducible():
+    outputs = list()
+    for order in (range(8), reversed(range(8))):
+        d = DXF()
+        populate(d, 8, 50, order)
+        outputs.append(d.build().to_string())
+    assert outputs[0] == outputs[1]
+
+    d = DXF()
+    first = d.handle_gen.seed()
+    populate(d, 8, 125000, range(8))
+    entity_list = d.model_space.entity_list
+    assert len(entity_list) == 1000000
+    assert [e.handle for e in entity_list] == list(range(first, first + 1000000))
+    assert [e.start[0] for e in entity_list[::125000]] == list(range(8))
+    assert entity_list[125001].start == [1, 1]
+    assert d.handle_gen.seed() == first + 1000000
+    assert not d.model_space.stages
+
+
+def test_header_extents():
+    d = make_dxf(3)
+    arc = Arc([10, 10], 5, 0, 90)
+    arc.set_layer(d.layer['0'])
+    d.model_space.append(arc)
+    header = d.build_header().to_string()
+    assert '$EXTMIN\n10\n0.0\n20\n0.0\n30\n0\n' in header
+    assert '$EXTMAX\n10\n15.0\n20\n15.0\n30\n0\n' in header
+    assert '$PEXTMIN\n10\n-297.0\n20\n0.0\n30\n0\n' in header
+    assert '$EXTMIN\n10\n1e+20\n' in DXF().build_header().to_string()
+
+
+class Marker(Entity):
+    """An entity defined outside pydraw, with no bbox of its own."""
+    __slots__ = ()
+
+    def to_code(self):
+        code = GroupCode()
+        code.append([0, 5, 8], ['POINT', self.handle, self.layer.name])
+        return code
+
+
+def test_extents_follow_append():
+    d = DXF()
+    space = d.model_space
+    marker = Marker()
+    marker.set_layer(d.layer['0'])
+    space.append(marker)
+    assert space.extents() is None
+    d.write(io.BytesIO())
+    arc = Arc([10, 10], 5, 0, 90)
+    arc.set_layer(d.layer['0'])
+    space.append(arc)
+    assert space.extents() == (10, 10, 15, 15)
+    line = Line([-1, 0], [0, 0])
+    line.set_layer(d.layer['0'])
+    space.extend([line])
+    assert space.extents() == (-1, 0, 15, 15)
+    arc.move(100, 0)
+    assert space.extents() == (-1, 0, 15, 15)
+    space.reindex()
+    assert space.extents() == (-1, 0, 115, 15)
+
+
+def test_block_inserts():
+    d = DXF()
+    block = d.new_block('SYMBOL', pt_base=(1, 1))
+    circle = Circle([1, 1], 1)
+    circle.set_layer(d.layer['0'])
+    block.append(circle)
+    assert d.get_block('SYMBOL') is block and d.get_block('NONE') is None
+
+    insert = Insert([10, 10], block, 2, 2, 90)
+    assert insert.block_name == 'SYMBOL'
+    assert insert.bbox() == (8, 8, 12, 12)
+    grid = MInsert([0, 0], block, 100, 100, 5, 10)
+    assert grid.bbox() == (-1, -1, 496, 991)
+    assert MInsert([0, 0], 'SYMBOL', 3, 2, -5, 10).bbox() == (-10, 0, 0, 10)
+    for entity in (insert, grid):
+        entity.set_layer(d.layer['0'])
+        d.model_space.append(entity)
+
+    stream = io.BytesIO()
+    d.write(stream)
+    text = stream.getvalue().decode()
+    assert text.count('\nINSERT\n') == 2 and text.count('\nCIRCLE\n') == 1
+    assert 'AcDbMInsertBlock' in text
+    stream.seek(0)
+    doc = load(stream)
+    assert len(doc.blocks['SYMBOL']) == 1
+    first, second = doc.entities
+    assert type(first) is Insert and type(second) is MInsert
+    assert (second.block_name, second.columns, second.rows) == ('SYMBOL', 100, 100)
+    assert (second.column_spacing, second.row_spacing) == (5, 10)
+
+
+def record_handles(text):
+    lines = text.split('\n')
+    return [lines[i + 1] for i in range(0, len(lines) - 1, 2) if lines[i] in ('5', '105')]
+
+
+def test_tables_are_reused_until_changed():
+    d = make_dxf()
+    tables = d.encode_tables()
+    assert d.encode_tables() is tables
+    assert d.encode_tables(binary=True) == d.encode_tables(binary=True)
+    d.layer.append(Layer('walls', color=3))
+    assert 'walls' in d.encode_tables() and 'walls' not in tables
+    tables = d.encode_tables()
+    d.layer['walls'].color = 5
+    assert d.encode_tables() != tables
+    assert d.build_tables().to_string() == d.encode_tables()
+
+    assert d.build_layer_table().to_string() in d.encode_tables()
+
+    d.dimstyle.append(DimStyle('DIMS', d.style['STANDARD']))
+    d.encode_tables()
+    copy = DXF(template=d)
+    for name in ('APPID', 'DIMSTYLE', 'LAYER', 'LTYPE', 'STYLE', 'VPORT'):
+        assert copy.get_table(name) is d.get_table(name)
+    # the records are the copy's own, changing them leaves the template be
+    assert copy.layer['walls'] is not d.layer['walls']
+    assert copy.dimstyle['DIMS'].text_style is copy.style['STANDARD']
+    copy.layer['walls'].color = 1
+    copy.style['STANDARD'].width_factor = 1
+    assert d.layer['walls'].color == 5 and d.style['STANDARD'].width_factor == 0.7
+    assert copy.get_table('LAYER') is not d.get_table('LAYER')
+    # the spaces are the copy's own
+    assert copy.get_table('BLOCK_RECORD') is not d.get_table('BLOCK_RECORD')
+    line = Line([0, 0], [1, 1])
+    line.set_layer(copy.layer['walls'])
+    copy.model_space.append(line)
+    copy.layer.append(Layer('doors'))
+    assert 'doors' in copy.encode_tables() and 'doors' not in d.encode_tables()
+    stream = io.BytesIO()
+    copy.write(stream)
+    handles = record_handles(stream.getvalue().decode())
+    assert len(handles) == len(set(handles))
+
+
+def test_resource_reads_definitions(tmp_path, monkeypatch):
+    monkeypatch.setattr(Resource, 'cache_dir', None)
+    path = tmp_path / 'lib.pat'
+    path.write_text('\n'.join([
+        ';; a library', '',
+        '*BOX,Box steel',
+        '0, 0,0, 0,1, 1,-1',
+        '90, 0,0, 0,1, 1,-1',
+        '; a comment inside',
+        '*GAS_LINE,Gas line ----GAS----',
+        'A,.5,-.2,["GAS",STANDARD,S=.1,X=-0.1,Y=-.05],-.25',
+        '*BOX,a second BOX is ignored',
+        '45, 0,0, 0,.125']))
+    resource = Resource(path)
+    assert 'BOX' in resource and 'ANSI31' not in resource
+    box = resource.get_data('BOX')
+    assert box == {'name': 'BOX', 'inform': 'Box steel',
+                   'content': ([0, 0, 0, 0, 1, 1, -1], [90, 0, 0, 0, 1, 1, -1])}
+    assert resource.get_data('BOX') is box
+    assert resource.get_data('GAS_LINE')['content'] == (
+        ['A', 0.5, -0.2, '["GAS",STANDARD,S=.1,X=-0.1,Y=-.05]', -0.25],)
+
+    d = make_dxf()
+    hatch = Hatch(box, [[0, 0], [2, 0], [2, 2], [0, 0]])
+    hatch.set_layer(d.layer['0'])
+    d.model_space.append(hatch)
+    assert '\nBOX\n' in d.build_entities().to_string()
+
+
+def load_resource(path, cache_dir):
+    Resource.cache_dir = cache_dir
+    return Resource(path).get_data('P1')
+
+
+def test_resource_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setattr(Resource, 'cache_dir', str(cache_dir))
+    path = tmp_path / 'lib.pat'
+    path.write_text('*P1,one\n0, 0,0, 0,1\n*P2,two\n90, 0,0, 0,2, 1,-1\n')
+    expected = Resource(path, cache=False).get_data('P2')
+
+    # processes starting together all get the definitions and leave one cache
+    with ProcessPoolExecutor(4) as executor:
+        results = list(executor.map(load_resource, [path] * 8, [str(cache_dir)] * 8))
+    assert all(result['content'] == ([0, 0, 0, 0, 1],) for result in results)
+    cache_file, = cache_dir.iterdir()
+    assert cache_file.name.endswith('.marshal')
+
+    monkeypatch.setattr(Resource, 'split', None)
+    assert Resource(path).get_data('P2') == expected
+    monkeypatch.undo()
+    monkeypatch.setattr(Resource, 'cache_dir', str(cache_dir))
+
+    # a changed file makes a new cache
+    path.write_text('*P1,one\n0, 0,0, 0,1\n*P2,two\n45, 0,0, 0,3\n')
+    assert Resource(path).get_data('P2')['content'] == ([45, 0, 0, 0, 3],)
+    cache_file.write_bytes(b'\xff')
+    assert Resource(path).get_data('P2')['content'] == ([45, 0, 0, 0, 3],)
+    assert Resource(path).index['P2'].__class__ is bytes
+
+
+def test_pattern_and_linetype_libraries(tmp_path, monkeypatch):
+    monkeypatch.setattr(Resource, 'cache_dir', None)
+    (tmp_path / 'lib.pat').write_text('\n'.join([
+        '*BRICK,Brick or masonry-type surface',
+        '0, 0,0, 0,.25',
+        '90, 0,0, .25,.25, .25,-.25',
+        '*ANSI31,ANSI Iron from the library',
+        '45, 0,0, 0,.125']))
+    (tmp_path / 'lib.lin').write_text('\n'.join([
+        '*DASHDOT,Dash dot __ . __ . __',
+        'A,.5,-.25,0,-.25',
+        '*GAS_LINE,Gas line ----GAS----GAS----',
+        'A,.5,-.2,["GAS",STANDARD,S=.1,U=0.0,X=-0.1,Y=-.05],-.25',
+        '*ZIGZAG,Zig zag /\\/\\/\\/',
+        'A,.0001,-.2,[ZIG,ltypeshp.shx,x=-.2,s=.2],-.4,[ZIG,ltypeshp.shx,r=180,x=.2,s=.2],-.2']))
+    d = DXF()
+    d.pattern_resource.load(tmp_path / 'lib.pat')
+    d.ltype_resource.load(tmp_path / 'lib.lin')
+    assert 'BRICK' in d.pattern_resource and 'SOLID' in d.pattern_resource
+    assert d.pattern_resource.get_data('ANSI31')['inform'] == 'ANSI Iron from the library'
+    heads, counts, dashes = d.pattern_resource.get_data('BRICK')['lines']
+    assert (list(heads), list(counts), list(dashes)) == (
+        [0, 0, 0, 0, 0.25, 90, 0, 0, 0.25, 0.25], [0, 2], [0.25, -0.25])
+
+    hatch = Hatch(d.pattern_resource.get_data('BRICK'), [[0, 0], [2, 0], [2, 2], [0, 0]],
+                  rotate_angle=90, scale=2)
+    hatch.set_layer(d.layer['0'])
+    d.model_space.append(hatch)
+    text = hatch.to_code().to_string(6)
+    assert '\n78\n2\n53\n90\n43\n0\n44\n0\n45\n-0.5\n46\n0\n79\n0\n' in text
+    assert '\n53\n180\n43\n0\n44\n0\n45\n-0.5\n46\n-0.5\n79\n2\n40\n0.5\n40\n-0.5\n' in text
+
+    dashdot = d.add_ltype('DASHDOT')
+    assert d.add_ltype('DASHDOT') is dashdot
+    assert '\n73\n4\n40\n1\n49\n0.5\n74\n0\n49\n-0.25\n74\n0\n49\n0\n' in \
+        dashdot.to_code().to_string(6)
+    standard = d.style['STANDARD'].handle
+    gas = d.add_ltype('GAS_LINE').to_code().to_string(6)
+    assert (f'49\n-0.2\n74\n10\n75\n0\n340\n{standard:X}\n46\n0.1\n50\n0\n44\n-0.1\n45\n-0.05\n'
+            '9\nGAS\n49\n-0.25\n74\n0' in gas)
+    # appended the old way, the styles come from the document
+    d.ltype.append(LType('GAS_LINE2', d.ltype_resource.get_data('GAS_LINE')))
+    assert d.ltype['GAS_LINE2'].styles == {'STANDARD': d.style['STANDARD']}
+    assert f'340\n{standard:X}\n' in d.ltype['GAS_LINE2'].to_code().to_string(6)
+    try:
+        d.add_ltype('ZIGZAG')
+    except ValueError:
+        pass
+    else:
+        assert False, 'shapes need their numbers'
+    d.ltype_resource.shapes['ZIG'] = 131
+    zigzag = d.add_ltype('ZIGZAG').to_code().to_string(6)
+    shapes = d.style['ltypeshp.shx']
+    assert shapes.shape_file and '\n70\n1\n' in shapes.to_code().to_string()
+    assert f'74\n4\n75\n131\n340\n{shapes.handle:X}\n46\n0.2\n50\n3.141593\n' in zigzag
+
+
+def test_pattern_cache():
+    d = make_dxf()
+    pattern = d.pattern_resource.get_data('ANSI31')
+    content, lines = copy.deepcopy(pattern['content']), copy.deepcopy(pattern['lines'])
+    hatches = [Hatch(pattern, [[0, 0], [2, 0], [2, 2], [0, 0]], rotate_angle=45, scale=2)
+               for _ in range(2)]
+    for hatch in hatches:
+        hatch.set_layer(d.layer['0'])
+        d.model_space.append(hatch)
+    first, second = (hatch.to_code().to_string(6) for hatch in hatches)
+    assert first.replace(f'\n{hatches[0].handle:X}\n', '') == \
+        second.replace(f'\n{hatches[1].handle:X}\n', '')
+    assert '\n53\n90\n43\n0\n44\n0\n45\n-6.35\n46\n0\n79\n0\n' in first
+    assert pattern['content'] == content and pattern['lines'] == lines
+
+    cache = PatternCache(maxsize=2)
+    code = cache.get('ANSI31', lines, 45, 2)
+    assert cache.get('ANSI31', lines, 45, 2) is code
+    # the same name with other lines, e.g. read from a file
+    other = compile_pattern([[0, 0, 0, 0, 1]])
+    assert cache.get('ANSI31', other, 45, 2) is not code
+    values = cache.get('ANSI31', compile_pattern([[0, 0, 0, 0, 1]]), 45, 2).values()
+    assert [round(value, 6) for value in values] == [1, 45, 0, 0, -1.414214, 1.414214, 0]
+    cache.get('ANSI31', lines, 0, 1)
+    cache.get('ANSI31', lines, 90, 1)
+    assert len(cache) == 2 and ('ANSI31', 45, 2) not in cache.entries
+
+
+def bytes_per_item(make, count=1000):
+    tracemalloc.start()
+    items = [make(i) for i in range(count)]
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(items) == count
+    return used / count
+
+
+def test_entity_size():
+    start, end = [0.0, 0.0], [1.0, 1.0]
+    assert bytes_per_item(lambda i: Line(start, end)) < 128
+    assert bytes_per_item(lambda i: Arc(start, 1.0, 0.0, 90.0)) < 136
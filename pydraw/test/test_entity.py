@@ -1,4 +1,6 @@
-from ..entity import Vector, Line
+import tracemalloc
+
+from ..entity import Arc, Context, LWPolyline, PointArray, Vector, Line
 
 
 def test_vector_transform():
@@ -24,3 +26,68 @@ def test_line_transform():
     assert l.start == [100, 0]
     assert l.end == [0, -100]
 
+
+
+def test_point_array_matches_vector():
+    points = [[0, 0], [50, 0], [50, 50], [12.5, -3]]
+    vectors = [Vector(x, y) for x, y in points]
+    array = PointArray(points)
+    for transform, args in (('move', (3, -2)), ('scale', (10, 5, 2.5)),
+                            ('rotate', (1, 2, 33)), ('mirror_x', (7,))):
+        getattr(array, transform)(*args)
+        for v in vectors:
+            getattr(v, transform)(*args)
+        assert array == vectors
+    assert array[1] == vectors[1]
+    array[1] = [0, 0]
+    assert list(array)[1] == [0, 0]
+
+
+def test_polyline_transforms_in_place():
+    for make in (list, PointArray):
+        polyline = LWPolyline(make([Vector(0, 0), Vector(10, 0), Vector(10, 10)]))
+        context = Context()
+        context.append(polyline)
+        context.reset_unit('m')
+        assert polyline.point_list == [[0, 0], [10000, 0], [10000, 10000]]
+        polyline.move(1, 1)
+        polyline.rotate(1, 1, 90)
+        assert polyline.point_list == [[1, 1], [1, 10001], [-9999, 10001]]
+
+
+def test_polyline_points_read_like_a_list():
+    polyline = LWPolyline([Vector(10, 0), Vector(10, 10)])
+    # a list of points goes into an array, transformed in one operation
+    assert isinstance(polyline.point_list, PointArray)
+    polyline.point_list.append(Vector(0, 10))
+    polyline.bulge_list.append(0)
+    polyline.point_list[0].move(5, 0)
+    polyline.move(0, 1)
+    assert polyline.point_list == [[15, 1], [10, 11], [0, 11]]
+    assert [point.y for point in polyline.point_list] == [1, 11, 11]
+    points = PointArray([[0, 0], [1, 0]])
+    assert LWPolyline(points).point_list is points
+
+
+def test_point_array_writes_through():
+    points = PointArray([[0, 0], [10, 0]])
+    points[1].move(0, 5)
+    points.append(Vector(3, 4))
+    points[-1].scale(0, 0, 2)
+    assert points == [[0, 0], [10, 5], [6, 8]]
+    for _ in range(20):
+        points.append([1, 1])
+    assert len(points) == 23 and points[22] == [1, 1]
+
+
+def test_vector_size():
+    tracemalloc.start()
+    vectors = [Vector(i * 0.5, i * 0.25) for i in range(1000)]
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the two floats of each vector included
+    assert used / len(vectors) < 112
+
+
+def test_arc_bounding_box():
+    assert Arc(Vector(50, 50), 25, 0, 180).compute_bounding_box() == (25, 50, 75, 75)
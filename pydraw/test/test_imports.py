@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+# microseconds `import pydraw.dxf` may take with its bytecode compiled,
+# everything it imports included; it took about 170000 with pyparsing
+budget = 50000
+heavy = ('pyparsing', 'PIL', 'numpy', 'multiprocessing', 'concurrent.futures', 'zipfile', 'gzip')
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def import_times(module, pycache):
+    """name -> cumulative microseconds of every import made to import module."""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    command = [sys.executable, '-X', 'importtime', '-X', f'pycache_prefix={pycache}',
+               '-c', f'import {module}']
+    # the first run compiles the bytecode the second is timed with
+    for _ in range(2):
+        result = subprocess.run(command, cwd=root, env=env, capture_output=True, text=True,
+                                check=True)
+    times = dict()
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+def imported(times, package):
+    return [name for name in times if name == package or name.startswith(package + '.')]
+
+
+def test_dxf_imports_within_budget(tmp_path):
+    times = import_times('pydraw.dxf', tmp_path)
+    for package in heavy:
+        assert not imported(times, package)
+    assert times['pydraw.dxf'] < budget
+
+
+def test_drawing_defers_pil(tmp_path):
+    times = import_times('pydraw.drawing', tmp_path)
+    assert 'pydraw.drawing' in times
+    assert not imported(times, 'PIL')
+
+
+def test_hatch_defers_numpy():
+    script = '\n'.join([
+        'import io, sys',
+        'from pydraw.dxf import DXF, Hatch',
+        'd = DXF()',
+        "hatch = Hatch(d.pattern_resource.get_data('ANSI31'), [[0, 0], [2, 0], [2, 2], [0, 0]],",
+        '              rotate_angle=30, scale=2)',
+        "hatch.set_layer(d.layer['0'])",
+        'd.model_space.append(hatch)',
+        'd.write(io.BytesIO())',
+        "print('numpy' in sys.modules)"])
+    result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.strip() == 'False'
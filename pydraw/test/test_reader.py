@@ -0,0 +1,162 @@
+import io
+import warnings
+
+from .. import dxf
+from ..reader import Document, Index, iter_pairs, load, read
+
+
+def make_dxf():
+    d = dxf.DXF()
+    layer = dxf.Layer('walls', color=3)
+    d.layer.append(layer)
+    pattern = d.pattern_resource.get_data('ANSI31')
+    entities = [
+        dxf.Arc([50, 50], 25, 0, 180),
+        dxf.Circle([25, 25], 10),
+        dxf.Ellipse([75, 75], [25, 0], 0.5),
+        dxf.Ellipse([100, 100], [25, 0], 0.5, 45, 135),
+        dxf.Line([0, 0], [100.5, 100.25]),
+        dxf.LWPolyline([[0, 0], [50, 0], [50, 50], [0, 0]], [0.5, 0, 0.5, 0]),
+        dxf.Text('hello world', [100, 100], 10),
+        dxf.MText('hello world' * 30, [50, 50], 5, 100),
+        dxf.Hatch(pattern, [[0, 0], [20, 0], [20, 20], [0, 0]], rotate_angle=30, scale=2),
+    ]
+    for entity in entities:
+        entity.set_layer(layer)
+        if isinstance(entity, dxf._TextBase):
+            entity.set_style(d.style['STANDARD'])
+        d.model_space.append(entity)
+    return d
+
+
+def test_iter_pairs_text_and_binary():
+    d = make_dxf()
+    for binary in (False, True):
+        stream = io.BytesIO()
+        d.write(stream, binary)
+        stream.seek(0)
+        pairs = list(iter_pairs(stream, chunk_size=100))
+        assert pairs[:2] == [(0, 'SECTION'), (2, 'HEADER')]
+        assert pairs[-1] == (0, 'EOF')
+        assert (11, 100.5) in pairs and (48, 1.0) in pairs
+    text = b'  0\r\nSECTION\r\n  2\r\nENTITIES\r\n 62\r\n7\r\n  0\r\nEOF\r\n'
+    assert list(iter_pairs(io.BytesIO(text), chunk_size=3)) == [
+        (0, 'SECTION'), (2, 'ENTITIES'), (62, 7), (0, 'EOF')]
+
+
+def test_read_round_trip(tmp_path):
+    d = make_dxf()
+    for binary, compression in ((False, None), (True, None), (False, 'gzip'), (True, 'zip')):
+        path = tmp_path / 'round.dxf'
+        d.save(path, binary, compression)
+        doc = read(path, compression)
+        assert doc.header['$ACADVER'] == 'AC1021'
+        assert doc.layers['walls'].color == 3
+        assert len(doc.entities) == len(d.model_space.entity_list)
+        for entity, original in zip(doc.entities, d.model_space.entity_list):
+            assert type(entity) is type(original)
+            assert entity.handle == original.handle
+            assert entity.owner_handle == original.owner_handle
+            assert entity.to_code().to_string(6) == original.to_code().to_string(6)
+
+
+def test_load_blocks_and_inserts():
+    text = '\n'.join([
+        '0', 'SECTION', '2', 'BLOCKS',
+        '0', 'BLOCK', '5', '20', '8', '0', '2', 'DOOR',
+        '0', 'LINE', '5', '21', '330', '1F', '8', 'doors', '10', '0', '20', '0', '11', '1', '21', '0',
+        '0', 'ENDBLK', '5', '22',
+        '0', 'ENDSEC',
+        '0', 'SECTION', '2', 'ENTITIES',
+        '0', 'INSERT', '5', '30', '102', '{ACAD_REACTORS', '330', '99', '102', '}',
+        '330', '1A', '10', '5', '20', '6', '2', 'DOOR', '50', '90',
+        '0', 'SPLINE', '5', '31',
+        '0', 'ENDSEC', '0', 'EOF', ''])
+    doc = load(io.BytesIO(text.encode()))
+    line, = doc.blocks['DOOR']
+    assert line.layer is doc.layers['doors']
+    assert line.owner_handle == 0x1F
+    insert, = doc.entities
+    assert isinstance(insert, dxf.Insert)
+    assert insert.handle == 0x30 and insert.owner_handle == 0x1A
+    assert insert.pt_insert == [5.0, 6.0] and insert.rotate_angle == 90
+
+
+def hatch_pairs(handle, *path):
+    return [(0, 'HATCH'), (5, handle), (8, '0'), (2, 'SOLID'), (70, 1), (91, 1),
+            (92, 1), (93, len([pair for pair in path if pair[0] == 72])), *path, (97, 0),
+            (75, 1), (76, 1), (98, 0)]
+
+
+def test_load_hatch_edges():
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        doc = Document().load([
+            (0, 'SECTION'), (2, 'ENTITIES'),
+            *hatch_pairs('A',
+                         (72, 1), (10, 0.0), (20, 0.0), (11, 10.0), (21, 0.0),
+                         (72, 1), (10, 10.0), (20, 0.0), (11, 10.0), (21, 10.0),
+                         (72, 2), (10, 5.0), (20, 10.0), (40, 5.0), (50, 0.0), (51, 180.0),
+                         (73, 1),
+                         (72, 1), (10, 0.0), (20, 10.0), (11, 0.0), (21, 0.0)),
+            # a clockwise full circle
+            *hatch_pairs('B',
+                         (72, 2), (10, 0.0), (20, 0.0), (40, 1.0), (50, 0.0), (51, 360.0),
+                         (73, 0)),
+            *hatch_pairs('C',
+                         (72, 3), (10, 0.0), (20, 0.0), (11, 1.0), (21, 0.0), (40, 0.5),
+                         (50, 0.0), (51, 360.0), (73, 1)),
+            (0, 'ENDSEC'), (0, 'EOF')])
+    square, circle = doc.entities
+    assert square.point_list == [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+    assert [round(bulge, 6) for bulge in square.bulge_list] == [0, 0, 1, 0, 0]
+    assert [[round(x, 6), round(y, 6)] for x, y in circle.point_list] == [[1, 0], [-1, 0], [1, 0]]
+    assert [round(bulge, 6) for bulge in circle.bulge_list] == [-1, -1, 0]
+    assert len(caught) == 1 and 'type 3' in str(caught[0].message)
+
+
+def test_document_load_pairs():
+    doc = Document().load([(0, 'SECTION'), (2, 'ENTITIES'),
+                           (0, 'CIRCLE'), (5, 'A'), (330, '1F'), (10, 1.0), (20, 2.0), (40, 3.0),
+                           (0, 'ENDSEC'), (0, 'EOF')])
+    circle, = doc.entities
+    assert circle.center == [1.0, 2.0] and circle.radius == 3.0
+    assert circle.layer.name == '0'
+
+
+def test_index_lookups(tmp_path):
+    d = make_dxf()
+    path = tmp_path / 'index.dxf'
+    for binary in (False, True):
+        d.save(path, binary)
+        with Index(path) as index:
+            assert list(index.sections) == ['HEADER', 'CLASSES', 'TABLES', 'BLOCKS',
+                                            'ENTITIES', 'OBJECTS']
+            assert list(index.section('HEADER'))[:3] == [(0, 'SECTION'), (2, 'HEADER'),
+                                                        (9, '$ACADVER')]
+            line = d.model_space.entity_list[4]
+            found = index.find(line.handle)
+            assert found.to_code().to_string() == line.to_code().to_string()
+            assert found.layer is index.document.layers['walls']
+            assert [e.handle for e in index.select('ELLIPSE')] == [
+                e.handle for e in d.model_space.entity_list if isinstance(e, dxf.Ellipse)]
+            assert len(list(index.select(layer='walls'))) == len(d.model_space.entity_list)
+            assert list(index.select('CIRCLE', layer='0')) == []
+            assert index.find('FFFF') is None
+            assert index.find(f'{line.handle:x}').handle == line.handle
+
+
+def test_index_is_saved_next_to_the_file(tmp_path):
+    path = tmp_path / 'index.dxf'
+    make_dxf().save(path)
+    with Index(path) as index:
+        index.save()
+        starts = list(index.starts)
+    assert (tmp_path / 'index.dxf.idx').exists()
+    with Index(path) as index:
+        assert index.load()
+        assert list(index.starts) == starts
+    make_dxf().save(path, binary=True)
+    with Index(path) as index:
+        assert not index.load()
+        assert len(index) == len(starts)
@@ -0,0 +1,121 @@
+import math
+
+import numpy as np
+
+from .. import dxf
+from ..batch import CircleBatch, LineBatch
+from ..spatial import GridIndex
+
+
+def make_entities(count, seed=1):
+    rand = np.random.default_rng(seed)
+    entities = list()
+    for x, y, size, kind in zip(*(rand.random((3, count)) * [[1000], [1000], [5]]).tolist(),
+                                rand.integers(0, 6, count).tolist()):
+        if kind == 0:
+            entity = dxf.Line([x, y], [x + size, y - size])
+        elif kind == 1:
+            entity = dxf.Circle([x, y], size)
+        elif kind == 2:
+            entity = dxf.Arc([x, y], size, 30, 120)
+        elif kind == 3:
+            entity = dxf.Ellipse([x, y], [size, size], 0.5)
+        elif kind == 4:
+            entity = dxf.LWPolyline([[x, y], [x + size, y], [x, y + size]], [0, 1, 0])
+        else:
+            entity = dxf.RotatedDimension([x, y], [x + size, y], [x, y + 1], 0)
+        entities.append(entity)
+    return entities
+
+
+def meets(box, xmin, ymin, xmax, ymax):
+    return box[0] <= xmax and box[2] >= xmin and box[1] <= ymax and box[3] >= ymin
+
+
+def distance(box, x, y):
+    return math.hypot(max(box[0] - x, x - box[2], 0), max(box[1] - y, y - box[3], 0))
+
+
+def test_bboxes():
+    assert dxf.Circle([1, 2], 3).bbox() == (-2, -1, 4, 5)
+    assert dxf.Line([3, 0], [1, 2]).bbox() == (1, 0, 3, 2)
+    assert dxf.Arc([50, 50], 25, 0, 180).bbox() == (25, 50, 75, 75)
+    assert np.allclose(dxf.Arc([0, 0], 1, 300, 60).bbox(),
+                       (0.5, -math.sqrt(3) / 2, 1, math.sqrt(3) / 2))
+    assert np.allclose(dxf.Ellipse([0, 0], [0, 2], 0.5).bbox(), (-1, -2, 1, 2))
+    assert np.allclose(dxf.Ellipse([100, 100], [25, 0], 0.5, 45, 135).bbox(),
+                       (88.82, 111.18, 111.18, 112.5), atol=0.005)
+    assert np.allclose(dxf.Ellipse([100, 100], [25, 0], 0.5, 135, 205).bbox(),
+                       (75, 91.475, 88.82, 111.18), atol=0.005)
+    # half circles to the right of the direction of travel
+    assert np.allclose(dxf.LWPolyline([[0, 0], [2, 0]], [1, 0]).bbox(), (0, -1, 2, 0))
+    assert np.allclose(dxf.LWPolyline([[0, 0], [2, 0]], [-1, 0]).bbox(), (0, 0, 2, 1))
+    square = [[0, 0], [50, 0], [50, 50], [0, 50], [0, 0]]
+    assert np.allclose(dxf.LWPolyline(square, [0.5, 0.5, 0.5, 0.5, 0]).bbox(),
+                       (-12.5, -12.5, 62.5, 62.5))
+    assert dxf.Text('ab', [10, 10], 2, width_factor=1).bbox() == (10, 10, 14, 12)
+    box = dxf.Text('ab', [10, 10], 2, width_factor=1, angle=90).bbox()
+    assert np.allclose(box, (8, 10, 10, 14))
+    assert dxf.Insert([5, 5], 'DOOR').bbox() == (5, 5, 5, 5)
+    assert LineBatch([[0, 0], [5, 1]], [[1, -1], [2, 2]]).bbox() == (0, -1, 5, 2)
+    assert CircleBatch([[0, 0], [5, 1]], [1, 2]).bbox() == (-1, -1, 7, 3)
+
+
+def test_bbox_is_cached_until_changed():
+    arc = dxf.Arc([0, 0], 1, 0, 90)
+    box = arc.get_bbox()
+    assert arc.get_bbox() is box
+    arc.end_angle = 180
+    assert arc.get_bbox() is box
+    arc.touch()
+    assert arc.get_bbox() == (-1, 0, 1, 1)
+    arc.move(10, 0)
+    assert arc.get_bbox() == (9, 0, 11, 1)
+
+
+def test_queries_match_a_scan():
+    entities = make_entities(3000)
+    boxes = [entity.bbox() for entity in entities]
+    grid = GridIndex(entities[:1000])
+    for entity in entities[1000:]:
+        grid.insert(entity)
+    assert grid.cell_size is not None and len(grid) == 3000
+
+    for window in ((100, 100, 200, 150), (-10, -10, 0.5, 0.5), (0, 0, 1000, 1000),
+                   (2000, 2000, 3000, 3000)):
+        assert grid.query_bbox(*window) == [
+            entity for entity, box in zip(entities, boxes) if meets(box, *window)]
+    assert grid.query_point(500, 500, 2) == [
+        entity for entity, box in zip(entities, boxes) if meets(box, 498, 498, 502, 502)]
+
+    for x, y in ((500, 500), (0, 0), (-500, 2000), (1000.5, 999)):
+        found = grid.nearest(x, y, 5)
+        expected = sorted(range(len(entities)), key=lambda i: (distance(boxes[i], x, y), i))
+        assert found == [entities[i] for i in expected[:5]]
+
+
+def test_space_keeps_its_index():
+    d = dxf.DXF()
+    layer = d.layer['0']
+    for entity in make_entities(500):
+        entity.set_layer(layer)
+        d.model_space.append(entity)
+    assert d.model_space.grid is None
+    assert d.model_space.query_point(-100, -100) == []
+
+    line = dxf.Line([-100, -100], [-99, -99])
+    line.set_layer(layer)
+    d.model_space.append(line)
+    assert d.model_space.query_point(-100, -100) == [line]
+    assert d.model_space.nearest(-200, -200) == [line]
+
+    # staged entities are merged by the query
+    circle = dxf.Circle([-300, -300], 1)
+    d.model_space.stage(0).append(circle)
+    assert d.model_space.nearest(-300, -300) == [circle]
+    assert d.model_space.entity_list[-1] is circle and not d.model_space.stages
+
+    line.start, line.end = [-400, -400], [-399, -399]
+    line.touch()
+    d.model_space.reindex()
+    assert d.model_space.nearest(-400, -400) == [line]